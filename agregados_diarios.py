@@ -0,0 +1,124 @@
+"""
+Índice de agregados diarios para reportes por rango de fechas
+Acumula suma (en centavos, exacta) y cantidad por día (en total y por columnas como medio de pago
+o categoría) y resuelve cualquier rango con sumas prefijas
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Dict, Optional, Sequence
+
+class AgregadosDiarios:
+    """Sumas y conteos por día con consultas por rango en O(log días)"""
+
+    def __init__(self, dimensiones: Sequence[str] = ()):
+        """
+        Args:
+            dimensiones: Columnas por las que se desglosan los totales
+        """
+        self.dimensiones = tuple(dimensiones)
+        self.limpiar()
+
+    def limpiar(self) -> None:
+        # ordinal del día -> [suma, conteo, {dimensión: {valor: [suma, conteo]}}]
+        self._dias: Dict[Optional[int], list] = {}
+        self._prefijos = None
+
+    def agregar(self, dia: Optional[int], centavos: int, valores: Dict[str, str]) -> None:
+        """
+        Suma un registro al día indicado
+
+        Args:
+            dia: Ordinal de la fecha o None si la fecha no es válida
+            centavos: Monto del registro en centavos
+            valores: Valor de cada dimensión para el registro
+        """
+        acumulado = self._dias.get(dia)
+        if acumulado is None:
+            acumulado = self._dias[dia] = [0, 0, {d: {} for d in self.dimensiones}]
+        acumulado[0] += centavos
+        acumulado[1] += 1
+        for dimension in self.dimensiones:
+            grupo = acumulado[2][dimension].setdefault(valores.get(dimension, ''), [0, 0])
+            grupo[0] += centavos
+            grupo[1] += 1
+        self._prefijos = None
+
+    def quitar(self, dia: Optional[int], centavos: int, valores: Dict[str, str]) -> None:
+        """Resta un registro agregado antes con los mismos datos (edición o borrado)"""
+        acumulado = self._dias[dia]
+        acumulado[0] -= centavos
+        acumulado[1] -= 1
+        for dimension in self.dimensiones:
+            valor = valores.get(dimension, '')
+            grupo = acumulado[2][dimension][valor]
+            grupo[0] -= centavos
+            grupo[1] -= 1
+            if not grupo[1]:
+                del acumulado[2][dimension][valor]
+        if not acumulado[1]:
+            del self._dias[dia]
+        self._prefijos = None
+
+    def _construir_prefijos(self) -> dict:
+        """Ordena los días y calcula las sumas acumuladas"""
+        dias = sorted(d for d in self._dias if d is not None)
+        sumas, conteos = [0], [0]
+        grupos = {d: {} for d in self.dimensiones}
+
+        for i, dia in enumerate(dias):
+            suma, conteo, por_dimension = self._dias[dia]
+            sumas.append(sumas[-1] + suma)
+            conteos.append(conteos[-1] + conteo)
+            for dimension, valores in por_dimension.items():
+                for valor, (suma_valor, conteo_valor) in valores.items():
+                    serie = grupos[dimension].get(valor)
+                    if serie is None:
+                        serie = grupos[dimension][valor] = ([0] * (i + 1), [0] * (i + 1))
+                    serie[0].append(serie[0][-1] + suma_valor)
+                    serie[1].append(serie[1][-1] + conteo_valor)
+            # Los valores ausentes este día mantienen su acumulado anterior
+            for series in grupos.values():
+                for serie_sumas, serie_conteos in series.values():
+                    if len(serie_sumas) < i + 2:
+                        serie_sumas.append(serie_sumas[-1])
+                        serie_conteos.append(serie_conteos[-1])
+
+        return {'dias': dias, 'sumas': sumas, 'conteos': conteos, 'grupos': grupos}
+
+    def resumen(self, inicio: Optional[int] = None, fin: Optional[int] = None) -> Dict:
+        """
+        Totales de un rango de días (ambos extremos incluidos)
+
+        Los registros con fecha inválida se incluyen siempre, igual que
+        en el filtrado por rango de GoogleSheetsManager.
+
+        Returns:
+            Dict con 'total', 'conteo' y 'por' ({dimensión: {valor: total}})
+        """
+        if self._prefijos is None:
+            self._prefijos = self._construir_prefijos()
+        p = self._prefijos
+
+        i = 0 if inicio is None else bisect_left(p['dias'], inicio)
+        j = len(p['dias']) if fin is None else bisect_right(p['dias'], fin)
+        j = max(i, j)
+
+        total = p['sumas'][j] - p['sumas'][i]
+        conteo = p['conteos'][j] - p['conteos'][i]
+        por: Dict[str, Dict[str, int]] = {}
+        for dimension, series in p['grupos'].items():
+            por[dimension] = {
+                valor: serie_sumas[j] - serie_sumas[i]
+                for valor, (serie_sumas, serie_conteos) in series.items()
+                if serie_conteos[j] - serie_conteos[i] > 0
+            }
+
+        sin_fecha = self._dias.get(None)
+        if sin_fecha is not None:
+            total += sin_fecha[0]
+            conteo += sin_fecha[1]
+            for dimension, valores in sin_fecha[2].items():
+                for valor, (suma_valor, _) in valores.items():
+                    por[dimension][valor] = por[dimension].get(valor, 0) + suma_valor
+
+        return {'total': total, 'conteo': conteo, 'por': por}
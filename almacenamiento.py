@@ -0,0 +1,136 @@
+"""
+Interfaz común de almacenamiento de ventas, gastos y cierres
+El bot trabaja contra esta interfaz; GoogleSheetsManager y
+AlmacenamientoSQLite son sus implementaciones. En los registros y totales
+los montos van en centavos enteros; las filas con la forma de la hoja
+(obtener_ventas, obtener_gastos) conservan el Monto en pesos.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional
+
+def totales_vacios() -> Dict:
+    """Totales en cero (en centavos), usados cuando no es posible calcularlos"""
+    return {
+        'total_ventas': 0, 'total_gastos': 0,
+        'utilidad': 0, 'margen': 0,
+        'num_ventas': 0, 'num_gastos': 0,
+        'ventas_por_medio': {}, 'gastos_por_categoria': {}
+    }
+
+class Almacenamiento(ABC):
+    """Operaciones que el bot necesita de un almacenamiento"""
+
+    # ----- Registro -----
+
+    @abstractmethod
+    def registrar_venta(self, venta: Dict) -> bool:
+        """Registra una venta (keys: fecha, numero_factura, cliente, monto, medio_pago, observaciones)"""
+
+    @abstractmethod
+    def registrar_gasto(self, gasto: Dict) -> bool:
+        """Registra un gasto (keys: fecha, categoria, proveedor, monto, medio_pago, observaciones)"""
+
+    @abstractmethod
+    def registrar_cierre_diario(self, cierre: Dict) -> bool:
+        """Registra el cierre del día desglosado por medio de pago"""
+
+    # ----- Consultas -----
+
+    @abstractmethod
+    def obtener_ventas(self, fecha_inicio: Optional[str] = None,
+                       fecha_fin: Optional[str] = None) -> List[Dict]:
+        """Ventas del rango (DD/MM/AAAA) con las claves de los encabezados de la hoja"""
+
+    @abstractmethod
+    def obtener_gastos(self, fecha_inicio: Optional[str] = None,
+                       fecha_fin: Optional[str] = None) -> List[Dict]:
+        """Gastos del rango (DD/MM/AAAA) con las claves de los encabezados de la hoja"""
+
+    @abstractmethod
+    def registros_completos(self, tipo: str) -> List[Dict]:
+        """
+        Todas las ventas o gastos con las claves de los encabezados de la hoja.
+        A diferencia de obtener_ventas/obtener_gastos, propaga los errores en
+        lugar de retornar una lista vacía.
+        """
+
+    @abstractmethod
+    def calcular_totales(self, fecha_inicio: Optional[str] = None,
+                         fecha_fin: Optional[str] = None) -> Dict:
+        """Totales del rango con la forma de totales_vacios()"""
+
+    @abstractmethod
+    def buscar_venta_por_factura(self, numero_factura: str) -> Optional[Dict]:
+        """Primera venta con ese número de factura"""
+
+    @abstractmethod
+    def existe_factura(self, numero_factura: str) -> bool:
+        """Indica si ya hay una venta con ese número de factura"""
+
+    @abstractmethod
+    def buscar_gasto_por_criterio(self, categoria: str = None,
+                                  proveedor: str = None,
+                                  fecha: str = None) -> List[Dict]:
+        """Gastos que cumplen todos los criterios indicados"""
+
+    @abstractmethod
+    def buscar_gastos_pagina(self, categoria: str = None, proveedor: str = None,
+                             fecha: str = None, cursor=None, tamano: int = 10) -> Dict:
+        """
+        Una página de los gastos que cumplen los criterios, en orden de registro
+
+        Args:
+            cursor: Valor 'cursor' de la página anterior (None para la primera)
+            tamano: Máximo de gastos por página
+
+        Returns:
+            Dict con 'gastos', 'total' de coincidencias y 'cursor' de la
+            página siguiente (None si no hay más)
+        """
+
+    def iterar_gastos(self, categoria: str = None, proveedor: str = None,
+                      fecha: str = None, tamano: int = 50) -> Iterator[Dict]:
+        """Recorre perezosamente los gastos que cumplen los criterios, página por página"""
+        cursor = None
+        while True:
+            pagina = self.buscar_gastos_pagina(categoria, proveedor, fecha, cursor, tamano)
+            yield from pagina['gastos']
+            cursor = pagina['cursor']
+            if cursor is None:
+                return
+
+    @abstractmethod
+    def obtener_ultimo_registro(self, tipo: str) -> Optional[Dict]:
+        """Último registro de 'venta' o 'gasto'"""
+
+    # ----- Modificación -----
+
+    @abstractmethod
+    def editar_venta(self, id_registro: str, venta: Dict) -> bool:
+        """Reemplaza los datos de la venta con ese ID"""
+
+    @abstractmethod
+    def editar_gasto(self, id_registro: str, gasto: Dict) -> bool:
+        """Reemplaza los datos del gasto con ese ID"""
+
+    @abstractmethod
+    def eliminar_registro(self, id_registro: str, tipo: str) -> bool:
+        """Elimina la venta o el gasto con ese ID"""
+
+    # ----- Estado -----
+
+    @property
+    def listo(self) -> bool:
+        """Indica si las consultas ya ven el historial completo"""
+        return True
+
+    def precalentar(self) -> None:
+        """Prepara conexiones o cachés en segundo plano (opcional)"""
+
+    def pendientes_de_sincronizar(self) -> Dict:
+        """Registros aún no replicados y si hay conexión con el destino remoto"""
+        return {'pendientes': 0, 'sin_conexion': False}
+
+    def cerrar(self) -> None:
+        """Libera conexiones e hilos al apagar el bot (opcional)"""
@@ -0,0 +1,607 @@
+"""
+Almacenamiento local en SQLite
+Es la base de datos principal cuando ALMACENAMIENTO=sqlite (opcional): las
+consultas se resuelven con índices locales y cada cambio se anota, en la misma
+transacción, en el diario de escritura de Google Sheets, que lo replica en
+segundo plano y queda como copia de exportación. Los montos se guardan en
+centavos enteros.
+"""
+
+import functools
+import sqlite3
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from almacenamiento import Almacenamiento, totales_vacios
+from utils import (centavos_a_celda, clave_busqueda, fecha_a_ordinal,
+                   generar_id_registro, monto_a_centavos)
+
+logger = logging.getLogger(__name__)
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS ventas (
+    id TEXT PRIMARY KEY,
+    fecha TEXT NOT NULL,
+    fecha_ord INTEGER,
+    numero_factura TEXT NOT NULL,
+    cliente TEXT,
+    monto INTEGER NOT NULL,
+    medio_pago TEXT,
+    observaciones TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_ventas_fecha ON ventas(fecha_ord);
+CREATE INDEX IF NOT EXISTS ix_ventas_factura ON ventas(numero_factura);
+
+CREATE TABLE IF NOT EXISTS gastos (
+    id TEXT PRIMARY KEY,
+    fecha TEXT NOT NULL,
+    fecha_ord INTEGER,
+    categoria TEXT NOT NULL,
+    categoria_norm TEXT,
+    proveedor TEXT,
+    proveedor_norm TEXT,
+    monto INTEGER NOT NULL,
+    medio_pago TEXT,
+    observaciones TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_gastos_fecha ON gastos(fecha_ord);
+
+CREATE TABLE IF NOT EXISTS cierres (
+    id TEXT PRIMARY KEY,
+    fecha TEXT NOT NULL,
+    efectivo INTEGER, transferencia INTEGER, tarjeta_debito INTEGER,
+    tarjeta_credito INTEGER, otro INTEGER, total INTEGER,
+    observaciones TEXT,
+    timestamp TEXT
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+# Columnas de monto de cada tabla
+_COLUMNAS_MONTO = {
+    'ventas': ('monto',), 'gastos': ('monto',),
+    'cierres': ('efectivo', 'transferencia', 'tarjeta_debito', 'tarjeta_credito', 'otro', 'total')
+}
+
+def _centavos(valor) -> int:
+    """Monto en centavos de un registro (0 si no es numérico)"""
+    try:
+        return int(valor)
+    except (ValueError, TypeError):
+        return 0
+
+def _con_historial(metodo):
+    """
+    Mientras el historial de Google Sheets no se haya importado, la consulta
+    la resuelve el espejo: la base local aún no tiene todos los registros
+    """
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        if not self._importado:
+            return getattr(self.espejo, metodo.__name__)(*args, **kwargs)
+        return metodo(self, *args, **kwargs)
+    return envoltura
+
+class AlmacenamientoSQLite(Almacenamiento):
+    """Ventas, gastos y cierres en una base SQLite con réplica a Google Sheets"""
+
+    def __init__(self, ruta: str, espejo=None,
+                 espera_reintento: float = 5.0, espera_maxima: float = 300.0):
+        """
+        Args:
+            ruta: Archivo de la base de datos
+            espejo: GoogleSheetsManager donde se replican los cambios (opcional)
+            espera_reintento: Segundos de espera tras el primer intento fallido
+                de importar el historial del espejo
+            espera_maxima: Tope de la espera exponencial entre esos intentos
+        """
+        self.ruta = ruta
+        self.espejo = espejo
+        self.espera_reintento = espera_reintento
+        self.espera_maxima = espera_maxima
+        self._conn = sqlite3.connect(ruta, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(ESQUEMA)
+            self._migrar()
+            importado = self._conn.execute(
+                "SELECT 1 FROM meta WHERE clave = 'importado_de_sheets'").fetchone()
+        self._importado = espejo is None or importado is not None
+        # La importación y los cambios hechos directamente en el espejo no se cruzan
+        self._importacion = threading.Lock()
+        # Borrados locales previos a la importación: no se vuelven a traer del espejo
+        self._borrados_sin_historial = set()
+
+    @property
+    def listo(self) -> bool:
+        """Indica si la base ya tiene el historial importado de Google Sheets"""
+        return self._importado
+
+    def _migrar(self) -> None:
+        """
+        Agrega la columna categoria_norm y recalcula las claves de búsqueda sin
+        tildes; pasa a centavos los montos de bases creadas cuando eran pesos
+        """
+        columnas = {fila['name'] for fila in self._conn.execute('PRAGMA table_info(gastos)')}
+        with self._conn:
+            if not self._conn.execute("SELECT 1 FROM meta WHERE clave = 'montos_en_centavos'").fetchone():
+                for tabla, montos in _COLUMNAS_MONTO.items():
+                    asignaciones = ', '.join(f'{m} = CAST(ROUND({m} * 100) AS INTEGER)' for m in montos)
+                    self._conn.execute(f'UPDATE {tabla} SET {asignaciones}')
+                self._conn.execute("INSERT INTO meta (clave, valor) VALUES ('montos_en_centavos', '1')")
+            if 'categoria_norm' not in columnas:
+                self._conn.execute('ALTER TABLE gastos ADD COLUMN categoria_norm TEXT')
+                self._conn.executemany(
+                    'UPDATE gastos SET categoria_norm = ?, proveedor_norm = ? WHERE id = ?',
+                    [(clave_busqueda(f['categoria']), clave_busqueda(f['proveedor'] or ''), f['id'])
+                     for f in self._conn.execute('SELECT id, categoria, proveedor FROM gastos')]
+                )
+            self._conn.execute('DROP INDEX IF EXISTS ix_gastos_categoria')
+            # La búsqueda por proveedor es por subcadena (LIKE '%x%'): un índice no la acelera
+            self._conn.execute('DROP INDEX IF EXISTS ix_gastos_proveedor')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS ix_gastos_categoria_norm ON gastos(categoria_norm)')
+
+    def _consultar(self, sql: str, parametros=()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, parametros).fetchall()
+
+    def _modificar(self, sql: str, parametros=(),
+                   replicar: Optional[Callable[[], bool]] = None) -> int:
+        """
+        Ejecuta una escritura en su propia transacción; retorna filas afectadas
+
+        Args:
+            replicar: Anota el cambio en el diario del espejo. Corre dentro de
+                la transacción: si retorna False el cambio local se revierte,
+                así la base y Google Sheets no divergen
+        """
+        with self._lock, self._conn:
+            cambiadas = self._conn.execute(sql, parametros).rowcount
+            if cambiadas and replicar is not None and self.espejo is not None and not replicar():
+                raise RuntimeError("No se pudo anotar el cambio en el diario de Google Sheets")
+            return cambiadas
+
+    # ----- Registro -----
+
+    def registrar_venta(self, venta: Dict) -> bool:
+        try:
+            venta = dict(venta, id=venta.get('id') or generar_id_registro())
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self._modificar(
+                "INSERT INTO ventas (id, fecha, fecha_ord, numero_factura, cliente, monto, "
+                "medio_pago, observaciones, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (venta['id'], venta.get('fecha', ''), fecha_a_ordinal(venta.get('fecha', '')),
+                 str(venta.get('numero_factura', '')), venta.get('cliente', '-'),
+                 _centavos(venta.get('monto', 0)), venta.get('medio_pago', ''),
+                 venta.get('observaciones', '-'), timestamp),
+                # La escritura en Sheets ya es diferida (diario + cola)
+                replicar=lambda: self.espejo.registrar_venta(venta)
+            )
+            logger.info(f"✅ Venta registrada: {venta.get('numero_factura')}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error al registrar venta: {e}")
+            return False
+
+    def registrar_gasto(self, gasto: Dict) -> bool:
+        try:
+            gasto = dict(gasto, id=gasto.get('id') or generar_id_registro())
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            proveedor = gasto.get('proveedor', '-')
+            self._modificar(
+                "INSERT INTO gastos (id, fecha, fecha_ord, categoria, categoria_norm, proveedor, "
+                "proveedor_norm, monto, medio_pago, observaciones, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (gasto['id'], gasto.get('fecha', ''), fecha_a_ordinal(gasto.get('fecha', '')),
+                 gasto.get('categoria', ''), clave_busqueda(gasto.get('categoria', '')),
+                 proveedor, clave_busqueda(proveedor),
+                 _centavos(gasto.get('monto', 0)), gasto.get('medio_pago', ''),
+                 gasto.get('observaciones', '-'), timestamp),
+                replicar=lambda: self.espejo.registrar_gasto(gasto)
+            )
+            logger.info(f"✅ Gasto registrado: {gasto.get('categoria')}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error al registrar gasto: {e}")
+            return False
+
+    def registrar_cierre_diario(self, cierre: Dict) -> bool:
+        try:
+            cierre = dict(cierre, id=cierre.get('id') or generar_id_registro())
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self._modificar(
+                "INSERT INTO cierres (id, fecha, efectivo, transferencia, tarjeta_debito, "
+                "tarjeta_credito, otro, total, observaciones, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (cierre['id'], cierre.get('fecha', ''),
+                 _centavos(cierre.get('efectivo', 0)), _centavos(cierre.get('transferencia', 0)),
+                 _centavos(cierre.get('tarjeta_debito', 0)), _centavos(cierre.get('tarjeta_credito', 0)),
+                 _centavos(cierre.get('otro', 0)), _centavos(cierre.get('total', 0)),
+                 cierre.get('observaciones', '-'), timestamp),
+                replicar=lambda: self.espejo.registrar_cierre_diario(cierre)
+            )
+            logger.info(f"✅ Cierre diario registrado: {cierre.get('fecha')} - Total: {cierre.get('total')}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error al registrar cierre diario: {e}")
+            return False
+
+    # ----- Consultas -----
+
+    @staticmethod
+    def _filtro_fechas(fecha_inicio: Optional[str], fecha_fin: Optional[str]):
+        """
+        Cláusula WHERE del rango de fechas, con el mismo criterio que
+        GoogleSheetsManager: extremos inválidos no filtran y las filas con
+        fecha inválida se incluyen siempre
+        """
+        inicio = fecha_a_ordinal(fecha_inicio) if fecha_inicio else None
+        fin = fecha_a_ordinal(fecha_fin) if fecha_fin else None
+        if (fecha_inicio and inicio is None) or (fecha_fin and fin is None):
+            inicio = fin = None
+        condiciones, parametros = [], []
+        if inicio is not None:
+            condiciones.append('fecha_ord >= ?')
+            parametros.append(inicio)
+        if fin is not None:
+            condiciones.append('fecha_ord <= ?')
+            parametros.append(fin)
+        if not condiciones:
+            return '1', []
+        return f"(fecha_ord IS NULL OR ({' AND '.join(condiciones)}))", parametros
+
+    @staticmethod
+    def _venta(row: sqlite3.Row) -> Dict:
+        return {
+            'fecha': row['fecha'], 'numero_factura': row['numero_factura'],
+            'cliente': row['cliente'], 'monto': int(row['monto']),
+            'medio_pago': row['medio_pago'], 'observaciones': row['observaciones'],
+            'timestamp': row['timestamp'], 'id': row['id']
+        }
+
+    @staticmethod
+    def _gasto(row: sqlite3.Row) -> Dict:
+        return {
+            'fecha': row['fecha'], 'categoria': row['categoria'],
+            'proveedor': row['proveedor'], 'monto': int(row['monto']),
+            'medio_pago': row['medio_pago'], 'observaciones': row['observaciones'],
+            'timestamp': row['timestamp'], 'id': row['id']
+        }
+
+    def _registros(self, tipo: str, where: str = '1', parametros=()) -> List[Dict]:
+        """Filas de ventas o gastos con las claves de los encabezados de la hoja"""
+        if tipo == 'venta':
+            return [
+                {'Fecha': r['fecha'], 'Número Factura': r['numero_factura'],
+                 'Cliente': r['cliente'], 'Monto': centavos_a_celda(r['monto']),
+                 'Medio de Pago': r['medio_pago'], 'Observaciones': r['observaciones'],
+                 'Timestamp': r['timestamp'], 'ID': r['id']}
+                for r in self._consultar(f"SELECT * FROM ventas WHERE {where} ORDER BY rowid", parametros)
+            ]
+        return [
+            {'Fecha': r['fecha'], 'Categoría': r['categoria'],
+             'Proveedor': r['proveedor'], 'Monto': centavos_a_celda(r['monto']),
+             'Medio de Pago': r['medio_pago'], 'Observaciones': r['observaciones'],
+             'Timestamp': r['timestamp'], 'ID': r['id']}
+            for r in self._consultar(f"SELECT * FROM gastos WHERE {where} ORDER BY rowid", parametros)
+        ]
+
+    @_con_historial
+    def obtener_ventas(self, fecha_inicio: Optional[str] = None,
+                       fecha_fin: Optional[str] = None) -> List[Dict]:
+        try:
+            return self._registros('venta', *self._filtro_fechas(fecha_inicio, fecha_fin))
+        except Exception as e:
+            logger.error(f"❌ Error al obtener ventas: {e}")
+            return []
+
+    @_con_historial
+    def obtener_gastos(self, fecha_inicio: Optional[str] = None,
+                       fecha_fin: Optional[str] = None) -> List[Dict]:
+        try:
+            return self._registros('gasto', *self._filtro_fechas(fecha_inicio, fecha_fin))
+        except Exception as e:
+            logger.error(f"❌ Error al obtener gastos: {e}")
+            return []
+
+    @_con_historial
+    def registros_completos(self, tipo: str) -> List[Dict]:
+        return self._registros(tipo)
+
+    @_con_historial
+    def calcular_totales(self, fecha_inicio: Optional[str] = None,
+                         fecha_fin: Optional[str] = None) -> Dict:
+        try:
+            where, parametros = self._filtro_fechas(fecha_inicio, fecha_fin)
+            ventas_por_medio = {
+                r[0]: int(r[1]) for r in self._consultar(
+                    f"SELECT medio_pago, SUM(monto) FROM ventas WHERE {where} GROUP BY medio_pago",
+                    parametros)
+            }
+            num_ventas = self._consultar(f"SELECT COUNT(*) FROM ventas WHERE {where}", parametros)[0][0]
+            gastos_por_categoria = {
+                r[0]: int(r[1]) for r in self._consultar(
+                    f"SELECT categoria, SUM(monto) FROM gastos WHERE {where} GROUP BY categoria",
+                    parametros)
+            }
+            num_gastos = self._consultar(f"SELECT COUNT(*) FROM gastos WHERE {where}", parametros)[0][0]
+
+            total_ventas = sum(ventas_por_medio.values())
+            total_gastos = sum(gastos_por_categoria.values())
+            utilidad = total_ventas - total_gastos
+
+            return {
+                'total_ventas': total_ventas,
+                'total_gastos': total_gastos,
+                'utilidad': utilidad,
+                'margen': (utilidad / total_ventas * 100) if total_ventas > 0 else 0,
+                'num_ventas': num_ventas,
+                'num_gastos': num_gastos,
+                'ventas_por_medio': ventas_por_medio,
+                'gastos_por_categoria': gastos_por_categoria
+            }
+        except Exception as e:
+            logger.error(f"❌ Error al calcular totales: {e}")
+            return totales_vacios()
+
+    @_con_historial
+    def buscar_venta_por_factura(self, numero_factura: str) -> Optional[Dict]:
+        try:
+            filas = self._consultar(
+                "SELECT * FROM ventas WHERE numero_factura = ? ORDER BY rowid LIMIT 1",
+                (numero_factura,))
+            return self._venta(filas[0]) if filas else None
+        except Exception as e:
+            logger.error(f"❌ Error al buscar venta: {e}")
+            return None
+
+    @_con_historial
+    def existe_factura(self, numero_factura: str) -> bool:
+        try:
+            return bool(self._consultar(
+                "SELECT 1 FROM ventas WHERE numero_factura = ? LIMIT 1", (numero_factura,)))
+        except Exception as e:
+            logger.error(f"❌ Error al verificar factura: {e}")
+            return False
+
+    @_con_historial
+    def buscar_gasto_por_criterio(self, categoria: str = None,
+                                  proveedor: str = None,
+                                  fecha: str = None) -> List[Dict]:
+        try:
+            where, parametros = self._filtro_gastos(categoria, proveedor, fecha)
+            return [
+                self._gasto(r)
+                for r in self._consultar(f"SELECT * FROM gastos WHERE {where} ORDER BY rowid", parametros)
+            ]
+        except Exception as e:
+            logger.error(f"❌ Error al buscar gastos: {e}")
+            return []
+
+    @staticmethod
+    def _filtro_gastos(categoria: Optional[str], proveedor: Optional[str], fecha: Optional[str]):
+        """Cláusula WHERE de la búsqueda de gastos (sin distinguir tildes ni mayúsculas)"""
+        condiciones, parametros = [], []
+        if categoria:
+            condiciones.append('categoria_norm = ?')
+            parametros.append(clave_busqueda(categoria))
+        if proveedor:
+            patron = clave_busqueda(proveedor).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            condiciones.append("proveedor_norm LIKE ? ESCAPE '\\'")
+            parametros.append(f'%{patron}%')
+        if fecha:
+            condiciones.append('fecha = ?')
+            parametros.append(fecha)
+        return ' AND '.join(condiciones) or '1', parametros
+
+    @_con_historial
+    def buscar_gastos_pagina(self, categoria: str = None, proveedor: str = None,
+                             fecha: str = None, cursor=None, tamano: int = 10) -> Dict:
+        """Paginación por rowid: el cursor es el rowid del último gasto entregado"""
+        if cursor is not None and not isinstance(cursor, int):
+            # Paginación empezada en el espejo antes de importar el historial
+            return self.espejo.buscar_gastos_pagina(categoria, proveedor, fecha, cursor, tamano)
+        try:
+            where, parametros = self._filtro_gastos(categoria, proveedor, fecha)
+            total = self._consultar(f"SELECT COUNT(*) FROM gastos WHERE {where}", parametros)[0][0]
+            filas = self._consultar(
+                f"SELECT rowid, * FROM gastos WHERE {where} AND rowid > ? ORDER BY rowid LIMIT ?",
+                parametros + [cursor or 0, tamano + 1]
+            )
+            hay_mas = len(filas) > tamano
+            filas = filas[:tamano]
+            return {
+                'gastos': [self._gasto(f) for f in filas],
+                'total': total,
+                'cursor': filas[-1]['rowid'] if hay_mas else None
+            }
+        except Exception as e:
+            logger.error(f"❌ Error al buscar gastos: {e}")
+            return {'gastos': [], 'total': 0, 'cursor': None}
+
+    @_con_historial
+    def obtener_ultimo_registro(self, tipo: str) -> Optional[Dict]:
+        try:
+            tabla = 'ventas' if tipo == 'venta' else 'gastos'
+            filas = self._consultar(f"SELECT * FROM {tabla} ORDER BY rowid DESC LIMIT 1")
+            if not filas:
+                return None
+            return self._venta(filas[0]) if tipo == 'venta' else self._gasto(filas[0])
+        except Exception as e:
+            logger.error(f"❌ Error al obtener último registro: {e}")
+            return None
+
+    # ----- Modificación -----
+
+    def editar_venta(self, id_registro: str, venta: Dict) -> bool:
+        try:
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S') + ' (editado)'
+            cambiadas = self._modificar(
+                "UPDATE ventas SET fecha = ?, fecha_ord = ?, numero_factura = ?, cliente = ?, "
+                "monto = ?, medio_pago = ?, observaciones = ?, timestamp = ? WHERE id = ?",
+                (venta.get('fecha', ''), fecha_a_ordinal(venta.get('fecha', '')),
+                 str(venta.get('numero_factura', '')), venta.get('cliente', '-'),
+                 _centavos(venta.get('monto', 0)), venta.get('medio_pago', ''),
+                 venta.get('observaciones', '-'), timestamp, id_registro),
+                replicar=lambda: self.espejo.encolar_edicion('venta', id_registro, venta)
+            )
+            if not cambiadas and not self._importado:
+                return self._en_espejo_sin_historial('editar_venta', id_registro, venta)
+            if not cambiadas:
+                logger.error(f"❌ No se encontró la venta con ID {id_registro}")
+                return False
+            logger.info(f"✅ Venta editada: {id_registro}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error al editar venta: {e}")
+            return False
+
+    def editar_gasto(self, id_registro: str, gasto: Dict) -> bool:
+        try:
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S') + ' (editado)'
+            proveedor = gasto.get('proveedor', '-')
+            cambiadas = self._modificar(
+                "UPDATE gastos SET fecha = ?, fecha_ord = ?, categoria = ?, categoria_norm = ?, "
+                "proveedor = ?, proveedor_norm = ?, monto = ?, medio_pago = ?, observaciones = ?, "
+                "timestamp = ? WHERE id = ?",
+                (gasto.get('fecha', ''), fecha_a_ordinal(gasto.get('fecha', '')),
+                 gasto.get('categoria', ''), clave_busqueda(gasto.get('categoria', '')),
+                 proveedor, clave_busqueda(proveedor),
+                 _centavos(gasto.get('monto', 0)), gasto.get('medio_pago', ''),
+                 gasto.get('observaciones', '-'), timestamp, id_registro),
+                replicar=lambda: self.espejo.encolar_edicion('gasto', id_registro, gasto)
+            )
+            if not cambiadas and not self._importado:
+                return self._en_espejo_sin_historial('editar_gasto', id_registro, gasto)
+            if not cambiadas:
+                logger.error(f"❌ No se encontró el gasto con ID {id_registro}")
+                return False
+            logger.info(f"✅ Gasto editado: {id_registro}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error al editar gasto: {e}")
+            return False
+
+    def eliminar_registro(self, id_registro: str, tipo: str) -> bool:
+        try:
+            tabla = 'ventas' if tipo == 'venta' else 'gastos'
+            if not self._importado:
+                self._borrados_sin_historial.add(id_registro)
+            if not self._modificar(f"DELETE FROM {tabla} WHERE id = ?", (id_registro,),
+                                   replicar=lambda: self.espejo.encolar_eliminacion(tipo, id_registro)):
+                if not self._importado:
+                    return self._en_espejo_sin_historial('eliminar_registro', id_registro, tipo)
+                logger.error(f"❌ No se encontró {tipo} con ID {id_registro}")
+                return False
+            logger.info(f"✅ {tipo.capitalize()} eliminada: {id_registro}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error al eliminar {tipo}: {e}")
+            return False
+
+    def _en_espejo_sin_historial(self, metodo: str, *args) -> bool:
+        """
+        Edita o borra directamente en Google Sheets un registro que no está en
+        la base porque el historial aún no se importó
+        """
+        with self._importacion:
+            if self._importado:
+                # Se importó mientras tanto: el registro ya puede estar en la base
+                return getattr(self, metodo)(*args)
+            return getattr(self.espejo, metodo)(*args)
+
+    # ----- Importación y estado -----
+
+    def _importar_de_espejo(self) -> None:
+        """Copia una sola vez el historial de Google Sheets a la base local"""
+        with self._importacion:
+            if self._importado:
+                return
+            self._importar_registros()
+            self._importado = True
+            self._borrados_sin_historial.clear()
+
+    def _importar_registros(self) -> None:
+        """Inserta en la base las ventas y gastos del espejo que aún no tiene"""
+        ventas = self.espejo.registros_completos('venta')
+        gastos = self.espejo.registros_completos('gasto')
+        with self._lock, self._conn:
+            # Bajo el bloqueo de escritura: un borrado posterior ya ve las filas importadas
+            borrados = self._borrados_sin_historial
+            ventas = [r for r in ventas if str(r.get('ID', '')) not in borrados]
+            gastos = [r for r in gastos if str(r.get('ID', '')) not in borrados]
+            # INSERT OR IGNORE: lo registrado localmente mientras tanto ya está con el mismo ID
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO ventas (id, fecha, fecha_ord, numero_factura, cliente, "
+                "monto, medio_pago, observaciones, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(str(r.get('ID') or generar_id_registro()), str(r.get('Fecha', '')),
+                  fecha_a_ordinal(str(r.get('Fecha', ''))), str(r.get('Número Factura', '')),
+                  str(r.get('Cliente', '')), monto_a_centavos(r.get('Monto')), str(r.get('Medio de Pago', '')),
+                  str(r.get('Observaciones', '')), str(r.get('Timestamp', '')))
+                 for r in ventas]
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO gastos (id, fecha, fecha_ord, categoria, categoria_norm, "
+                "proveedor, proveedor_norm, monto, medio_pago, observaciones, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(str(r.get('ID') or generar_id_registro()), str(r.get('Fecha', '')),
+                  fecha_a_ordinal(str(r.get('Fecha', ''))), str(r.get('Categoría', '')),
+                  clave_busqueda(r.get('Categoría', '')),
+                  str(r.get('Proveedor', '')), clave_busqueda(r.get('Proveedor', '')),
+                  monto_a_centavos(r.get('Monto')), str(r.get('Medio de Pago', '')),
+                  str(r.get('Observaciones', '')), str(r.get('Timestamp', '')))
+                 for r in gastos]
+            )
+            self._conn.execute(
+                "INSERT INTO meta (clave, valor) VALUES ('importado_de_sheets', ?)",
+                (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),)
+            )
+        logger.info(f"📥 Importadas {len(ventas)} ventas y {len(gastos)} gastos desde Google Sheets")
+
+    def precalentar(self) -> None:
+        """
+        Importa el historial de Google Sheets la primera vez, en segundo plano,
+        y arranca el envío de lo que quedó pendiente en el diario. Si Google
+        Sheets no responde se reintenta con espera exponencial; mientras tanto
+        las consultas se resuelven en el espejo.
+        """
+        if self.espejo is None:
+            return
+
+        def _precalentar():
+            espera = self.espera_reintento
+            while True:
+                try:
+                    self.espejo.conectar()
+                    self._importar_de_espejo()
+                    return
+                except Exception as e:
+                    logger.warning(f"⚠️ No se pudo importar el historial de Google Sheets, "
+                                   f"reintento en {espera:.0f}s: {e}")
+                time.sleep(espera)
+                espera = min(self.espera_maxima, espera * 2)
+
+        threading.Thread(target=_precalentar, name='sqlite-importar', daemon=True).start()
+
+    def pendientes_de_sincronizar(self) -> Dict:
+        if self.espejo is None:
+            return super().pendientes_de_sincronizar()
+        return self.espejo.pendientes_de_sincronizar()
+
+    def cerrar(self) -> None:
+        if self.espejo is not None:
+            self.espejo.cerrar()
+        with self._lock:
+            self._conn.close()
@@ -3,6 +3,7 @@ Bot de Telegram para SURTHILANAS
 Sistema de registro financiero automatizado
 """
 
+import asyncio
 import logging
 from functools import wraps
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
@@ -15,7 +16,8 @@ from telegram.ext import (
     ContextTypes
 )
 from config import Config
-from google_sheets import sheets_manager
+from sheets_async import sheets_async, AlmacenamientoOcupado
+from entrenador_ml import entrenador_ml
 from utils import (
     validar_fecha,
     validar_monto,
@@ -116,6 +118,7 @@ Este bot te permite gestionar las finanzas de tu empresa de forma simple y efici
 📊 <b>/reporte</b> - Ver reportes financieros
 📈 <b>/estado</b> - Ver estado actual
 🔍 <b>/buscar</b> - Buscar y editar una venta
+🔎 <b>/buscargasto</b> - Buscar gastos
 🗑️ <b>/eliminar</b> - Eliminar último registro
 🤖 <b>/analisis</b> - Análisis inteligente con IA
 🔮 <b>/prediccion</b> - Predicción de ventas (ML)
@@ -144,13 +147,14 @@ async def ayuda(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 <b>Consultas y gestión:</b>
 🔍 <b>/buscar</b> - Buscar y editar una venta por factura
+🔎 <b>/buscargasto</b> - Buscar gastos por categoría, proveedor o fecha
 🗑️ <b>/eliminar</b> - Eliminar último registro
 📊 <b>/reporte</b> - Ver reportes financieros
 📈 <b>/estado</b> - Ver estado actual del mes
 
 <b>Análisis con Inteligencia Artificial:</b>
 🤖 <b>/analisis</b> - Preguntas en lenguaje natural
-🔮 <b>/prediccion</b> - Predicción de ventas con ML
+🔮 <b>/prediccion [meses]</b> - Predicción de ventas con ML
 🔍 <b>/anomalias</b> - Detectar transacciones atípicas
 📈 <b>/tendencias</b> - Análisis temporal
 💡 <b>/insights</b> - Recomendaciones personalizadas
@@ -223,6 +227,12 @@ async def venta_factura(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
             "Escribe el número o '-' para omitir."
         )
         return VENTA_FACTURA
+    elif await sheets_async.existe_factura(numero):
+        await update.message.reply_text(
+            f"❌ Ya existe una venta con la factura {numero}.\n"
+            "Ingresa otro número o '-' para omitir."
+        )
+        return VENTA_FACTURA
 
     context.user_data['venta_factura'] = numero
     await update.message.reply_text(
@@ -321,7 +331,7 @@ async def venta_confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         'observaciones': context.user_data['venta_obs']
     }
 
-    exito = sheets_manager.registrar_venta(datos_venta)
+    exito = await sheets_async.registrar_venta(datos_venta)
 
     if exito:
         await update.message.reply_text(
@@ -480,7 +490,7 @@ async def gasto_confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         'observaciones': context.user_data['gasto_obs']
     }
 
-    exito = sheets_manager.registrar_gasto(datos_gasto)
+    exito = await sheets_async.registrar_gasto(datos_gasto)
 
     if exito:
         await update.message.reply_text(
@@ -538,7 +548,7 @@ async def reporte_generar(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     else:
         titulo_periodo = "TOTAL"
 
-    totales = sheets_manager.calcular_totales(fecha_inicio, fecha_fin)
+    totales = await sheets_async.calcular_totales(fecha_inicio, fecha_fin)
 
     resumen = f"📊 <b>REPORTE - {titulo_periodo}</b>\n"
     resumen += "━━━━━━━━━━━━━━━━━━━━\n\n"
@@ -546,6 +556,18 @@ async def reporte_generar(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     resumen += f"   ({totales['num_ventas']} registros)\n\n"
     resumen += f"💸 <b>Total Gastos:</b> {formatear_monto(totales['total_gastos'])}\n"
     resumen += f"   ({totales['num_gastos']} registros)\n\n"
+
+    desgloses = [
+        ("💳 <b>Ventas por medio de pago:</b>", totales.get('ventas_por_medio', {})),
+        ("📂 <b>Gastos por categoría:</b>", totales.get('gastos_por_categoria', {})),
+    ]
+    for titulo, desglose in desgloses:
+        if desglose:
+            resumen += f"{titulo}\n"
+            for nombre, monto in sorted(desglose.items(), key=lambda item: -item[1]):
+                resumen += f"  • {nombre or 'Sin especificar'}: {formatear_monto(monto)}\n"
+            resumen += "\n"
+
     resumen += "━━━━━━━━━━━━━━━━━━━━\n"
 
     if totales['utilidad'] >= 0:
@@ -564,8 +586,15 @@ async def reporte_generar(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 @requiere_autorizacion
 async def estado(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    totales = sheets_manager.calcular_totales(*obtener_rango_fechas('mes'))
+    totales = await sheets_async.calcular_totales(*obtener_rango_fechas('mes'))
     resumen = generar_resumen_financiero(totales)
+    cola = await sheets_async.pendientes_de_sincronizar()
+    if cola['pendientes']:
+        estado_conexion = "sin conexión, se reintentará" if cola['sin_conexion'] else "enviando"
+        resumen += (f"\n\n⏳ {cola['pendientes']} registros guardados localmente "
+                    f"pendientes de Google Sheets ({estado_conexion})")
+    if entrenador_ml.en_curso():
+        resumen += "\n\n🤖 Reentrenando el modelo de ventas en segundo plano"
     await update.message.reply_text(resumen)
 
 # ============================================
@@ -583,7 +612,7 @@ async def buscar_venta_inicio(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def buscar_venta_factura(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     numero_factura = update.message.text.strip()
-    venta = sheets_manager.buscar_venta_por_factura(numero_factura)
+    venta = await sheets_async.buscar_venta_por_factura(numero_factura)
 
     if not venta:
         await update.message.reply_text(
@@ -656,7 +685,7 @@ async def eliminar_desde_buscar_confirmar(update: Update, context: ContextTypes.
     registro = context.user_data.get('registro_eliminar')
     tipo = context.user_data.get('eliminar_tipo', 'venta')
 
-    exito = sheets_manager.eliminar_registro(registro['fila'], tipo)
+    exito = await sheets_async.eliminar_registro(registro['id'], tipo)
 
     if exito:
         await update.message.reply_text(
@@ -673,6 +702,109 @@ async def eliminar_desde_buscar_confirmar(update: Update, context: ContextTypes.
     context.user_data.clear()
     return ConversationHandler.END
 
+# ============================================
+# BUSCAR GASTOS (resultados paginados)
+# ============================================
+
+@requiere_autorizacion
+async def buscar_gasto_inicio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    keyboard = [['Categoría', 'Proveedor'], ['Fecha', 'Cancelar']]
+    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+
+    await update.message.reply_text(
+        "🔍 <b>BUSCAR GASTOS</b>\n\n"
+        "¿Por qué criterio deseas buscar?",
+        parse_mode='HTML',
+        reply_markup=reply_markup
+    )
+    return BUSCAR_GASTO_CRITERIO
+
+async def buscar_gasto_criterio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    criterio = update.message.text.strip().lower()
+
+    if criterio == 'cancelar':
+        await update.message.reply_text("❌ Operación cancelada", reply_markup=ReplyKeyboardRemove())
+        context.user_data.clear()
+        return ConversationHandler.END
+
+    if criterio in ('categoría', 'categoria'):
+        context.user_data['busqueda_criterio'] = 'categoria'
+        keyboard = [[cat] for cat in Config.CATEGORIAS_GASTOS]
+        reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+        await update.message.reply_text("Selecciona la categoría:", reply_markup=reply_markup)
+    elif criterio == 'proveedor':
+        context.user_data['busqueda_criterio'] = 'proveedor'
+        await update.message.reply_text(
+            "Escribe el nombre del proveedor (o parte de él):",
+            reply_markup=ReplyKeyboardRemove()
+        )
+    elif criterio == 'fecha':
+        context.user_data['busqueda_criterio'] = 'fecha'
+        await update.message.reply_text(
+            "Ingresa la fecha (DD/MM/AAAA) o escribe 'hoy':",
+            reply_markup=ReplyKeyboardRemove()
+        )
+    else:
+        await update.message.reply_text("❌ Opción no válida. Selecciona Categoría, Proveedor o Fecha.")
+        return BUSCAR_GASTO_CRITERIO
+
+    return BUSCAR_GASTO_VALOR
+
+async def buscar_gasto_valor(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    valor = update.message.text.strip()
+    criterio = context.user_data.get('busqueda_criterio', 'proveedor')
+
+    if criterio == 'fecha':
+        es_valida, valor = validar_fecha(valor)
+        if not es_valida:
+            await update.message.reply_text("❌ Fecha inválida. Usa formato DD/MM/AAAA o escribe 'hoy'.")
+            return BUSCAR_GASTO_VALOR
+
+    context.user_data['busqueda_filtros'] = {criterio: valor}
+    context.user_data['busqueda_cursor'] = None
+    context.user_data['busqueda_mostrados'] = 0
+    return await mostrar_pagina_gastos(update, context)
+
+async def mostrar_pagina_gastos(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Envía la siguiente página de resultados; solo se guarda el cursor entre páginas"""
+    mostrados = context.user_data.get('busqueda_mostrados', 0)
+    pagina = await sheets_async.buscar_gastos_pagina(
+        **context.user_data['busqueda_filtros'],
+        cursor=context.user_data.get('busqueda_cursor'),
+        tamano=Config.BUSQUEDA_TAMANO_PAGINA
+    )
+    gastos = pagina['gastos']
+
+    if not gastos:
+        texto = "✅ No hay más resultados" if mostrados else "❌ No se encontraron gastos con ese criterio"
+        await update.message.reply_text(texto, reply_markup=ReplyKeyboardRemove())
+        context.user_data.clear()
+        return ConversationHandler.END
+
+    mensaje = f"🔍 Gastos {mostrados + 1}-{mostrados + len(gastos)} de {pagina['total']}\n\n"
+    mensaje += "\n".join(formatear_registro_gasto(gasto) for gasto in gastos)
+
+    if pagina['cursor'] is None:
+        await update.message.reply_text(mensaje, reply_markup=ReplyKeyboardRemove())
+        context.user_data.clear()
+        return ConversationHandler.END
+
+    context.user_data['busqueda_cursor'] = pagina['cursor']
+    context.user_data['busqueda_mostrados'] = mostrados + len(gastos)
+
+    keyboard = [['Siguiente ▶️', 'Terminar']]
+    reply_markup = ReplyKeyboardMarkup(keyboard, one_time_keyboard=True, resize_keyboard=True)
+    await update.message.reply_text(mensaje, reply_markup=reply_markup)
+    return BUSCAR_GASTO_SELECCION
+
+async def buscar_gasto_siguiente(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    if 'siguiente' in update.message.text.strip().lower():
+        return await mostrar_pagina_gastos(update, context)
+
+    await update.message.reply_text("✅ Búsqueda finalizada", reply_markup=ReplyKeyboardRemove())
+    context.user_data.clear()
+    return ConversationHandler.END
+
 async def editar_venta_campo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     campo = update.message.text.strip().lower()
 
@@ -698,6 +830,8 @@ async def editar_venta_campo(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     venta = context.user_data.get('venta_encontrada')
     valor_actual = venta.get(campo_map[campo], '-')
+    if campo_map[campo] == 'monto':
+        valor_actual = formatear_monto(valor_actual)
 
     await update.message.reply_text(
         f"Valor actual de <b>{campo}</b>: {valor_actual}\n\n"
@@ -756,7 +890,7 @@ async def editar_venta_confirmar(update: Update, context: ContextTypes.DEFAULT_T
     nuevo_valor = context.user_data.get('nuevo_valor')
     venta[campo] = nuevo_valor
 
-    exito = sheets_manager.editar_venta(venta['fila'], venta)
+    exito = await sheets_async.editar_venta(venta['id'], venta)
 
     if exito:
         await update.message.reply_text(
@@ -799,7 +933,7 @@ async def eliminar_tipo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         return ConversationHandler.END
 
     tipo = 'venta' if 'venta' in opcion else 'gasto'
-    registro = sheets_manager.obtener_ultimo_registro(tipo)
+    registro = await sheets_async.obtener_ultimo_registro(tipo)
 
     if not registro:
         await update.message.reply_text(
@@ -835,7 +969,7 @@ async def eliminar_confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE)
     registro = context.user_data.get('registro_eliminar')
     tipo = context.user_data.get('eliminar_tipo')
 
-    exito = sheets_manager.eliminar_registro(registro['fila'], tipo)
+    exito = await sheets_async.eliminar_registro(registro['id'], tipo)
 
     if exito:
         await update.message.reply_text(
@@ -905,7 +1039,7 @@ async def cierreday_fecha(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def cierreday_efectivo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     texto = update.message.text.strip()
     if texto == '0':
-        monto = 0.0
+        monto = 0
     else:
         es_valido, monto = validar_monto(texto)
         if not es_valido:
@@ -925,7 +1059,7 @@ async def cierreday_efectivo(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def cierreday_transferencia(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     texto = update.message.text.strip()
     if texto == '0':
-        monto = 0.0
+        monto = 0
     else:
         es_valido, monto = validar_monto(texto)
         if not es_valido:
@@ -945,7 +1079,7 @@ async def cierreday_transferencia(update: Update, context: ContextTypes.DEFAULT_
 async def cierreday_tarjeta_deb(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     texto = update.message.text.strip()
     if texto == '0':
-        monto = 0.0
+        monto = 0
     else:
         es_valido, monto = validar_monto(texto)
         if not es_valido:
@@ -965,7 +1099,7 @@ async def cierreday_tarjeta_deb(update: Update, context: ContextTypes.DEFAULT_TY
 async def cierreday_tarjeta_cred(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     texto = update.message.text.strip()
     if texto == '0':
-        monto = 0.0
+        monto = 0
     else:
         es_valido, monto = validar_monto(texto)
         if not es_valido:
@@ -985,7 +1119,7 @@ async def cierreday_tarjeta_cred(update: Update, context: ContextTypes.DEFAULT_T
 async def cierreday_otro(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     texto = update.message.text.strip()
     if texto == '0':
-        monto = 0.0
+        monto = 0
     else:
         es_valido, monto = validar_monto(texto)
         if not es_valido:
@@ -1058,7 +1192,7 @@ async def cierreday_confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE
         'observaciones': obs
     }
 
-    exito = sheets_manager.registrar_cierre_diario(datos_cierre)
+    exito = await sheets_async.registrar_cierre_diario(datos_cierre)
 
     if exito:
         msg = "✅ <b>Cierre del día registrado exitosamente</b>\n\n"
@@ -1079,6 +1213,37 @@ async def cierreday_confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE
     context.user_data.clear()
     return ConversationHandler.END
 
+# ============================================
+# MANEJO DE ERRORES
+# ============================================
+
+async def manejar_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Errores no capturados por los handlers. Si el almacenamiento no respondió
+    a tiempo se le pide al usuario reintentar, en lugar de mostrar datos vacíos
+    """
+    error = context.error
+    if not isinstance(error, AlmacenamientoOcupado):
+        logger.error("Error no controlado", exc_info=error)
+        return
+    if not isinstance(update, Update) or update.effective_message is None:
+        return
+    if error.metodo.startswith(('registrar', 'editar', 'eliminar')):
+        mensaje = ("⏳ La base de datos está tardando en responder y el cambio puede "
+                   "aplicarse en unos segundos.\nVerifica antes de repetirlo.")
+    else:
+        mensaje = "⏳ La base de datos está tardando en responder.\nIntenta de nuevo en unos segundos."
+    await update.effective_message.reply_text(mensaje)
+
+async def cerrar_recursos(application: Application) -> None:
+    """
+    Al apagar el bot: termina los procesos de entrenamiento, envía lo que
+    quede en el diario de escritura y cierra conexiones e hilos
+    """
+    entrenador_ml.cerrar()
+    await asyncio.to_thread(sheets_async.cerrar)
+    logger.info("👋 Recursos del bot liberados")
+
 # ============================================
 # FUNCIÓN PRINCIPAL
 # ============================================
@@ -1087,14 +1252,19 @@ def main() -> None:
     """Inicializa y ejecuta el bot"""
 
     # FIX BUG 6 y 7: Inicializar el módulo ML e integrar sus handlers
-    from bot_ml_funciones import inicializar_analizador_ml, obtener_handlers_ml
+    from bot_ml_funciones import inicializar_analizador_ml, obtener_handlers_ml, programar_reentrenamiento
     import os
 
     excel_path = os.getenv('EXCEL_DATA_PATH', 'data/IF_surthilanas_año_2024.xlsx')
     if not inicializar_analizador_ml(excel_path):
         logger.warning("⚠️  Módulo ML no disponible. Los comandos /analisis, /prediccion, etc. estarán deshabilitados.")
 
-    application = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(Config.TELEGRAM_BOT_TOKEN)
+        .post_shutdown(cerrar_recursos)
+        .build()
+    )
 
     # Handlers básicos
     application.add_handler(CommandHandler("start", start))
@@ -1155,6 +1325,17 @@ def main() -> None:
         fallbacks=[CommandHandler("cancelar", cancelar)],
     )
 
+    # Conversation Handler: BUSCAR GASTOS
+    conv_buscar_gasto = ConversationHandler(
+        entry_points=[CommandHandler("buscargasto", buscar_gasto_inicio)],
+        states={
+            BUSCAR_GASTO_CRITERIO:  [MessageHandler(filters.TEXT & ~filters.COMMAND, buscar_gasto_criterio)],
+            BUSCAR_GASTO_VALOR:     [MessageHandler(filters.TEXT & ~filters.COMMAND, buscar_gasto_valor)],
+            BUSCAR_GASTO_SELECCION: [MessageHandler(filters.TEXT & ~filters.COMMAND, buscar_gasto_siguiente)],
+        },
+        fallbacks=[CommandHandler("cancelar", cancelar)],
+    )
+
     # Conversation Handler: ELIMINAR ÚLTIMO
     conv_eliminar = ConversationHandler(
         entry_points=[CommandHandler("eliminar", eliminar_ultimo_inicio)],
@@ -1185,6 +1366,7 @@ def main() -> None:
     application.add_handler(conv_gasto)
     application.add_handler(conv_reporte)
     application.add_handler(conv_buscar_venta)
+    application.add_handler(conv_buscar_gasto)
     application.add_handler(conv_eliminar)
     application.add_handler(conv_cierreday)
 
@@ -1196,6 +1378,15 @@ def main() -> None:
     application.add_handler(handlers_ml['cmd_tendencias'])
     application.add_handler(handlers_ml['cmd_insights'])
 
+    # Tiempo agotado en Google Sheets: se avisa al usuario para que reintente
+    application.add_error_handler(manejar_error)
+
+    # El modelo de ventas incorpora periódicamente las ventas registradas desde el bot
+    programar_reentrenamiento(application)
+
+    # Conexión con Google Sheets en segundo plano: el bot empieza a atender de inmediato
+    sheets_async.manager.precalentar()
+
     logger.info("🤖 Bot de SURTHILANAS iniciado")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
@@ -9,15 +9,24 @@ from telegram.ext import (
     CommandHandler, MessageHandler, filters
 )
 from ml_analisis import AnalizadorFinancieroML
+from entrenador_ml import entrenador_ml
+from config import Config
+from sheets_async import sheets_async
 from utils import es_usuario_autorizado  # FIX BUG 5: usar la misma función del bot principal
+import asyncio
 import logging
+import time
 from functools import wraps
+from typing import Dict
 
 logger = logging.getLogger(__name__)
 
 # Estado de conversación para análisis inteligente
 ANALISIS_PREGUNTA = 30
 
+# Segundos entre actualizaciones del mensaje de progreso del entrenamiento
+INTERVALO_PROGRESO = 5
+
 # Instancia global del analizador
 analizador_ml: AnalizadorFinancieroML | None = None
 
@@ -31,7 +40,10 @@ def inicializar_analizador_ml(ruta_excel: str) -> bool:
     """
     global analizador_ml
     try:
-        analizador_ml = AnalizadorFinancieroML(ruta_excel)
+        analizador_ml = AnalizadorFinancieroML(ruta_excel, dir_modelos=Config.ML_MODELOS_DIR)
+        # Si ya hay un modelo guardado (con las ventas del bot que usó), la
+        # primera predicción es inmediata
+        analizador_ml.restaurar_modelo_guardado()
         logger.info("✅ Analizador ML inicializado correctamente")
         return True
     except Exception as e:
@@ -131,6 +143,30 @@ async def analisis_pregunta(update: Update, context: ContextTypes.DEFAULT_TYPE)
 # COMANDO /prediccion - PREDICCIONES ML
 # ============================================
 
+async def _entrenar_con_progreso(update: Update) -> Dict:
+    """
+    Entrena el modelo en el pool de procesos y actualiza un mensaje con el
+    tiempo transcurrido mientras espera
+    """
+    mensaje = await update.message.reply_text(
+        "🤖 Entrenando modelo de predicción...\n"
+        "Esto puede tardar unos segundos. Te aviso cuando esté listo."
+    )
+    tarea = asyncio.ensure_future(entrenador_ml.entrenar(analizador_ml))
+    inicio = time.monotonic()
+    while True:
+        hecho, _ = await asyncio.wait({tarea}, timeout=INTERVALO_PROGRESO)
+        if hecho:
+            return tarea.result()
+        try:
+            await mensaje.edit_text(
+                "🤖 Entrenando modelo de predicción...\n"
+                f"⏳ {time.monotonic() - inicio:.0f}s transcurridos"
+            )
+        except Exception as e:
+            logger.debug(f"No se pudo actualizar el progreso: {e}")
+
+
 @requiere_autorizacion
 async def prediccion_inicio(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Muestra predicciones de ventas usando ML"""
@@ -141,37 +177,45 @@ async def prediccion_inicio(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     try:
         if analizador_ml.modelo_ventas is None:
-            await update.message.reply_text(
-                "🤖 Entrenando modelo de predicción...\n"
-                "Esto puede tardar unos segundos."
-            )
-            resultado = analizador_ml.entrenar_modelo_ventas()
+            resultado = await _entrenar_con_progreso(update)
 
             if 'error' in resultado:
                 await update.message.reply_text(f"❌ Error al entrenar modelo: {resultado['error']}")
                 return ConversationHandler.END
 
-            await update.message.reply_text(
+            mensaje = (
                 "✅ <b>Modelo entrenado exitosamente</b>\n\n"
-                f"📊 Precisión: {resultado['precisión']}\n"
-                f"📉 Error promedio: ${resultado['error_promedio']:,.0f}\n"
-                f"🔢 Datos de entrenamiento: {resultado['num_datos_entrenamiento']}\n"
-                f"🧪 Datos de prueba: {resultado['num_datos_prueba']}\n",
-                parse_mode='HTML'
+                f"📊 Precisión (backtest): {resultado['precisión']}\n"
             )
+            if resultado.get('error_promedio') is not None:
+                mensaje += f"📉 Error promedio por día: ${resultado['error_promedio']:,.0f}\n"
+            if resultado.get('error_mensual') is not None:
+                mensaje += f"📅 Error en totales de 30 días: {resultado['error_mensual']:.1%}\n"
+            mensaje += (
+                f"🔢 Días de entrenamiento: {resultado['num_datos_entrenamiento']}\n"
+                f"🧪 Días evaluados: {resultado['num_datos_prueba']}\n"
+            )
+            await update.message.reply_text(mensaje, parse_mode='HTML')
 
         from datetime import datetime
         hoy = datetime.now()
         siguiente_mes = hoy.month + 1 if hoy.month < 12 else 1
         siguiente_año = hoy.year if hoy.month < 12 else hoy.year + 1
 
+        # /prediccion N predice los próximos N meses (máximo 12)
+        meses = 1
+        if context.args and context.args[0].isdigit():
+            meses = min(max(int(context.args[0]), 1), 12)
+
         await update.message.reply_text("🔮 Generando predicción...")
-        prediccion = analizador_ml.predecir_ventas_mes(siguiente_año, siguiente_mes)
-        respuesta = analizador_ml._formatear_prediccion(prediccion)
-        await update.message.reply_text(respuesta, parse_mode='HTML')
+        predicciones = analizador_ml.predecir_ventas_meses(siguiente_año, siguiente_mes, meses)
+        for prediccion in predicciones:
+            respuesta = analizador_ml._formatear_prediccion(prediccion)
+            await update.message.reply_text(respuesta, parse_mode='HTML')
         await update.message.reply_text(
             "💡 ¿Quieres predecir otro mes?\n"
-            "Usa /prediccion nuevamente o /analisis para más opciones."
+            "Usa /prediccion nuevamente, /prediccion 3 para los próximos 3 meses\n"
+            "o /analisis para más opciones."
         )
 
     except Exception as e:
@@ -318,6 +362,56 @@ async def insights_comando(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         await update.message.reply_text("❌ Error al generar insights. Intenta nuevamente.")
 
 
+# ============================================
+# REENTRENAMIENTO PERIÓDICO
+# ============================================
+
+async def reentrenar_modelo_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Incorpora las ventas registradas desde el bot y reentrena el modelo solo
+    si los datos cambiaron (o si todavía no hay modelo)
+    """
+    if analizador_ml is None:
+        return
+    if not sheets_async.listo:
+        # Con el historial a medio importar el modelo olvidaría ventas ya aprendidas
+        logger.info("⏳ Historial aún sin importar a la base local, se reentrenará en el próximo ciclo")
+        return
+    try:
+        # registros_completos propaga los errores: una lectura fallida no debe
+        # tomarse como "se borraron todas las ventas del bot"
+        ventas = await sheets_async.registros_completos('venta')
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron leer las ventas, se reintentará en el próximo ciclo: {e}")
+        return
+    try:
+        cambios = await asyncio.to_thread(analizador_ml.incorporar_ventas, ventas)
+        if cambios == 0 and analizador_ml.modelo_ventas is not None:
+            return
+
+        resultado = await entrenador_ml.entrenar(analizador_ml)
+        if 'error' in resultado:
+            logger.warning(f"⚠️ No se pudo reentrenar el modelo de ventas: {resultado['error']}")
+    except Exception as e:
+        logger.error(f"Error en el reentrenamiento periódico: {e}")
+
+
+def programar_reentrenamiento(application) -> None:
+    """Agenda reentrenar_modelo_job en la job_queue de la aplicación"""
+    if analizador_ml is None:
+        return
+    if application.job_queue is None:
+        logger.warning("⚠️ JobQueue no disponible (instala python-telegram-bot[job-queue]); "
+                       "el modelo no incorporará las ventas nuevas")
+        return
+    application.job_queue.run_repeating(
+        reentrenar_modelo_job,
+        interval=Config.ML_REENTRENAR_INTERVALO,
+        first=60,
+        name='reentrenar-modelo-ventas'
+    )
+
+
 # ============================================
 # CONFIGURACIÓN DE HANDLERS
 # ============================================
@@ -335,7 +429,8 @@ def obtener_handlers_ml():
 
     return {
         'conv_analisis': conv_analisis,
-        'cmd_prediccion': CommandHandler("prediccion", prediccion_inicio),
+        # block=False: mientras se entrena el modelo el bot sigue atendiendo a los demás
+        'cmd_prediccion': CommandHandler("prediccion", prediccion_inicio, block=False),
         'cmd_anomalias': CommandHandler("anomalias", anomalias_comando),
         'cmd_tendencias': CommandHandler("tendencias", tendencias_comando),
         'cmd_insights': CommandHandler("insights", insights_comando),
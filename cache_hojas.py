@@ -0,0 +1,542 @@
+"""
+Caché en memoria de las hojas de Google Sheets
+La primera lectura descarga la hoja completa; después, si hay detector de
+cambios, solo se vuelve a leer cuando la versión del archivo cambió por una
+edición externa (y se aplican las filas que difieren). Sin detector se
+traen las filas agregadas después de la última fila conocida.
+"""
+
+import threading
+import time
+import logging
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple, Union
+from gspread.utils import numericise_all, rowcol_to_a1
+from agregados_diarios import AgregadosDiarios
+from indice_trigramas import IndiceTrigramas
+from utils import clave_busqueda, fecha_a_ordinal, monto_a_centavos
+
+logger = logging.getLogger(__name__)
+
+def _letra_columna(numero: int) -> str:
+    """Convierte un número de columna (1 = A) a su letra en notación A1"""
+    return rowcol_to_a1(1, numero)[:-1]
+
+def _como_celda(valor) -> str:
+    """Representa un valor como lo devuelve la hoja (150000.0 -> '150000')"""
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+# El índice de fechas guarda (ordinal, posición) empaquetados en un entero
+_BITS_POSICION = 32
+_MASCARA_POSICION = (1 << _BITS_POSICION) - 1
+# Conversiones recordadas por columna antes de vaciar la memoria
+_MAX_MEMORIA = 10000
+# Columnas con un valor distinto por fila: no se deduplican sus valores
+_COLUMNAS_UNICAS = ('ID', 'Timestamp', 'Número Factura')
+
+def _insertar_ordenada(posiciones: array, posicion: int) -> None:
+    if not posiciones or posiciones[-1] < posicion:
+        posiciones.append(posicion)
+    else:
+        insort(posiciones, posicion)
+
+def _desplazadas(posiciones: array, desde: int) -> array:
+    """Copia de las posiciones con las mayores que desde corridas una hacia atrás"""
+    return array(posiciones.typecode, (p - 1 if p > desde else p for p in posiciones))
+
+class RegistroVista:
+    """
+    Vista liviana de una fila de la caché, sin copiar sus valores. Es válida
+    hasta el siguiente cambio de la caché (las posiciones pueden moverse).
+    """
+
+    __slots__ = ('_cache', 'posicion')
+
+    def __init__(self, cache: 'CacheHoja', posicion: int):
+        self._cache = cache
+        self.posicion = posicion
+
+    @property
+    def fila_hoja(self) -> int:
+        """Número de fila en la hoja (la 1 son los encabezados)"""
+        return self.posicion + 2
+
+    def __getitem__(self, columna: str) -> str:
+        return self._cache.columnas[self._cache.encabezados.index(columna)][self.posicion]
+
+    def como_dict(self) -> Dict:
+        """Equivalente a una fila de worksheet.get_all_records()"""
+        return dict(zip(self._cache.encabezados, numericise_all(self._cache.fila(self.posicion))))
+
+class CacheHoja:
+    """Copia por columnas de una hoja con refresco incremental"""
+
+    def __init__(self, nombre: str, ttl: float, dimensiones: Sequence[str] = (),
+                 claves: Sequence[str] = (), normalizadas: Sequence[str] = (),
+                 textos: Sequence[str] = ()):
+        """
+        Args:
+            nombre: Nombre de la hoja (para logs)
+            ttl: Segundos durante los cuales la copia se considera fresca
+            dimensiones: Columnas por las que se desglosan los agregados diarios
+            claves: Columnas indexadas por valor para búsquedas exactas
+            normalizadas: Columnas indexadas por valor sin tildes ni mayúsculas
+            textos: Columnas indexadas por trigramas para buscar subcadenas
+        """
+        self.nombre = nombre
+        self.ttl = ttl
+        self.claves = tuple(claves)
+        self.normalizadas = tuple(normalizadas)
+        self.textos = tuple(textos)
+        # Valores repetidos (fechas, montos, categorías...) se guardan una sola vez
+        self._valores: Dict[str, str] = {}
+        self._posiciones_repetidas: Tuple[int, ...] = ()
+        self.encabezados: List[str] = []
+        self.columnas: List[List[str]] = []
+        # Conversiones ya hechas de fechas, montos y claves (se repiten mucho)
+        self._ordinal_de: Dict[str, Optional[int]] = {}
+        self._centavos_de: Dict[str, int] = {}
+        self._clave_de: Dict[str, str] = {}
+        # Índice ordenado por fecha: (ordinal << _BITS_POSICION) | posición de la fila
+        self._indice_fechas = array('q')
+        self._sin_fecha = array('l')
+        # columna clave -> valor -> posición de la fila con ese valor (un int,
+        # o un array si hay varias: la mayoría de las claves son únicas)
+        self._indices_clave: Dict[str, Dict[str, Union[int, array]]] = {c: {} for c in self.claves}
+        self._indices_normalizados: Dict[str, Dict[str, array]] = {c: {} for c in self.normalizadas}
+        self._indices_texto = {c: IndiceTrigramas() for c in self.textos}
+        self.agregados = AgregadosDiarios(dimensiones)
+        self._cargada = False
+        self._desactualizada = True
+        self._ultima_sync = 0.0
+        # Versión del archivo en Drive que refleja la copia local
+        self._revision: Optional[str] = None
+        self.cambios_externos = 0
+        self._lock = threading.RLock()
+
+    @property
+    def cargada(self) -> bool:
+        """Indica si existe una copia local utilizable"""
+        return self._cargada and bool(self.encabezados)
+
+    @property
+    def vigente(self) -> bool:
+        """Indica si la copia local está cargada y dentro del TTL"""
+        return (self.cargada and not self._desactualizada
+                and time.monotonic() - self._ultima_sync < self.ttl)
+
+    @property
+    def num_filas(self) -> int:
+        """Número de filas de datos conocidas (sin contar encabezados)"""
+        return len(self.columnas[0]) if self.columnas else 0
+
+    def invalidar(self) -> None:
+        """Fuerza una recarga completa en la próxima lectura"""
+        with self._lock:
+            self._cargada = False
+
+    def marcar_desactualizada(self) -> None:
+        """Fuerza un refresco incremental en la próxima lectura"""
+        with self._lock:
+            self._desactualizada = True
+
+    def sincronizar(self, sheet, revision: Optional[Callable[[], Optional[str]]] = None) -> None:
+        """
+        Actualiza la copia local si está vencida o fue invalidada
+
+        Args:
+            revision: Retorna la versión actual del archivo (None si no se
+                pudo consultar). Sin ella se revisan solo las filas nuevas.
+        """
+        with self._lock:
+            if not self._cargada or not self.encabezados:
+                # La versión se toma antes de leer: si cambia durante la
+                # descarga, el próximo refresco vuelve a revisar
+                self._revision = revision() if revision else None
+                self._carga_completa(sheet)
+            elif self._desactualizada:
+                self._carga_incremental(sheet)
+            elif time.monotonic() - self._ultima_sync >= self.ttl:
+                actual = revision() if revision else None
+                if actual is None:
+                    self._carga_incremental(sheet)
+                elif actual != self._revision:
+                    self._aplicar_cambios(sheet.get_all_values())
+                    self._revision = actual
+                else:
+                    self._marcar_sincronizada()
+
+    def registrar_escritura_propia(self, previa: Optional[str], posterior: Optional[str]) -> None:
+        """
+        Una escritura del bot (ya aplicada localmente) cambió la versión del
+        archivo de previa a posterior
+
+        Si la copia local reflejaba la versión previa, sigue al día con la
+        posterior y el próximo refresco por TTL no relee nada. Si no (o si
+        Drive no respondió), la versión conocida deja de servir y ese refresco
+        compara la hoja una vez con la copia local.
+        """
+        with self._lock:
+            if previa is not None and posterior is not None and previa == self._revision:
+                self._revision = posterior
+            else:
+                self._revision = None
+
+    def _carga_completa(self, sheet) -> None:
+        valores = sheet.get_all_values()
+        self._fijar_encabezados(valores[0] if valores else [])
+        self._reiniciar_indices()
+        self._agregar_filas(valores[1:])
+        self._marcar_sincronizada()
+        logger.info(f"📥 Caché de {self.nombre} cargada: {self.num_filas} filas")
+
+    def _carga_incremental(self, sheet) -> None:
+        n = self.num_filas
+        # Se relee la última fila conocida para detectar borrados o ediciones externas
+        fila_inicio = n + 1 if n > 0 else 2
+        rango = f"A{fila_inicio}:{_letra_columna(len(self.encabezados))}"
+        valores = sheet.get(rango)
+
+        if n > 0:
+            if not valores or self._normalizar(valores[0]) != self.fila(n - 1):
+                logger.info(f"🔄 Caché de {self.nombre} desincronizada, recargando")
+                self._carga_completa(sheet)
+                return
+            valores = valores[1:]
+
+        self._agregar_filas(valores)
+        self._marcar_sincronizada()
+        if valores:
+            logger.debug(f"📥 Caché de {self.nombre}: {len(valores)} filas nuevas")
+
+    def _aplicar_cambios(self, valores: List[List]) -> None:
+        """
+        Aplica a la copia local solo las filas que difieren del contenido actual
+
+        Se conservan el prefijo y el sufijo comunes y se reemplaza el tramo
+        intermedio (ediciones, borrados o inserciones hechos a mano).
+        """
+        encabezados = valores[0] if valores else []
+        if encabezados != self.encabezados:
+            logger.info(f"🔄 Encabezados de {self.nombre} cambiaron, recargando")
+            self._fijar_encabezados(encabezados)
+            self._reiniciar_indices()
+            self._agregar_filas(valores[1:])
+            self._marcar_sincronizada()
+            return
+
+        nuevas = [self._normalizar(fila) for fila in valores[1:]]
+        n, m = self.num_filas, len(nuevas)
+        prefijo = 0
+        while prefijo < min(n, m) and self.fila(prefijo) == nuevas[prefijo]:
+            prefijo += 1
+        if prefijo == n:
+            # Solo hay filas agregadas al final
+            self._agregar_filas(nuevas[n:])
+        else:
+            sufijo = 0
+            while (sufijo < min(n, m) - prefijo
+                   and self.fila(n - 1 - sufijo) == nuevas[m - 1 - sufijo]):
+                sufijo += 1
+            tramo = nuevas[prefijo:m - sufijo]
+            for i, columna in enumerate(self.columnas):
+                columna[prefijo:n - sufijo] = [fila[i] for fila in tramo]
+            self._reindexar()
+            self.cambios_externos += 1
+            logger.info(f"🔄 Caché de {self.nombre}: {n - prefijo - sufijo} filas "
+                        f"reemplazadas por {len(tramo)} por cambios externos")
+        self._marcar_sincronizada()
+
+    def _marcar_sincronizada(self) -> None:
+        self._cargada = True
+        self._desactualizada = False
+        self._ultima_sync = time.monotonic()
+
+    def _fijar_encabezados(self, encabezados: List[str]) -> None:
+        """Reinicia las columnas para un nuevo juego de encabezados"""
+        self.encabezados = encabezados
+        self.columnas = [[] for _ in encabezados]
+        self._valores = {}
+        self._posiciones_repetidas = tuple(
+            i for i, encabezado in enumerate(encabezados) if encabezado not in _COLUMNAS_UNICAS
+        )
+
+    def _normalizar(self, fila: List) -> List[str]:
+        """Ajusta una fila al ancho de los encabezados"""
+        ancho = len(self.encabezados)
+        fila = [_como_celda(v) for v in fila[:ancho]]
+        fila += [''] * (ancho - len(fila))
+        for i in self._posiciones_repetidas:
+            fila[i] = self._valores.setdefault(fila[i], fila[i])
+        return fila
+
+    def _agregar_filas(self, filas: List[List]) -> None:
+        for fila in filas:
+            fila = self._normalizar(fila)
+            posicion = self.num_filas
+            for columna, valor in zip(self.columnas, fila):
+                columna.append(valor)
+            self._indexar(posicion, fila)
+
+    def _reiniciar_indices(self) -> None:
+        self._ordinal_de.clear()
+        self._centavos_de.clear()
+        self._clave_de.clear()
+        self._indice_fechas = array('q')
+        self._sin_fecha = array('l')
+        self._indices_clave = {c: {} for c in self.claves}
+        self._indices_normalizados = {c: {} for c in self.normalizadas}
+        for indice in self._indices_texto.values():
+            indice.limpiar()
+        self.agregados.limpiar()
+
+    def _reindexar(self) -> None:
+        """Reconstruye los índices a partir de las columnas (sin acceso a red)"""
+        self._reiniciar_indices()
+        for posicion in range(self.num_filas):
+            self._indexar(posicion, self.fila(posicion))
+
+    def _indexar(self, posicion: int, fila: List[str]) -> None:
+        """Agrega la fila en la posición indicada a todos los índices"""
+        registro = dict(zip(self.encabezados, fila))
+        ordinal = self._convertir(self._ordinal_de, fecha_a_ordinal, registro.get('Fecha', ''))
+        centavos = self._convertir(self._centavos_de, monto_a_centavos, registro.get('Monto', ''))
+        self._indexar_fecha(ordinal, posicion)
+        for clave, indice in self._indices_clave.items():
+            valor = registro.get(clave, '')
+            actual = indice.get(valor)
+            if actual is None:
+                indice[valor] = posicion
+            elif isinstance(actual, int):
+                indice[valor] = array('l', sorted((actual, posicion)))
+            else:
+                # Ordenadas: la primera es la primera aparición en la hoja
+                _insertar_ordenada(actual, posicion)
+        for columna, indice in self._indices_normalizados.items():
+            clave = self._convertir(self._clave_de, clave_busqueda, registro.get(columna, ''))
+            indice.setdefault(clave, array('l')).append(posicion)
+        for columna, indice in self._indices_texto.items():
+            indice.agregar(posicion, registro.get(columna, ''))
+        self.agregados.agregar(ordinal, centavos, registro)
+
+    def _desindexar(self, posicion: int, fila: List[str]) -> None:
+        """Quita de todos los índices la fila indexada con esos valores"""
+        registro = dict(zip(self.encabezados, fila))
+        ordinal = self._convertir(self._ordinal_de, fecha_a_ordinal, registro.get('Fecha', ''))
+        centavos = self._convertir(self._centavos_de, monto_a_centavos, registro.get('Monto', ''))
+        if ordinal is None:
+            self._sin_fecha.remove(posicion)
+        else:
+            self._indice_fechas.remove((ordinal << _BITS_POSICION) | posicion)
+        for clave, indice in self._indices_clave.items():
+            valor = registro.get(clave, '')
+            actual = indice[valor]
+            if isinstance(actual, int):
+                del indice[valor]
+            else:
+                actual.remove(posicion)
+                if len(actual) == 1:
+                    indice[valor] = actual[0]
+        for columna, indice in self._indices_normalizados.items():
+            clave = self._convertir(self._clave_de, clave_busqueda, registro.get(columna, ''))
+            indice[clave].remove(posicion)
+            if not indice[clave]:
+                del indice[clave]
+        for columna, indice in self._indices_texto.items():
+            indice.quitar(posicion, registro.get(columna, ''))
+        self.agregados.quitar(ordinal, centavos, registro)
+
+    def _desplazar(self, desde: int) -> None:
+        """Resta uno a las posiciones mayores que desde en los índices (tras borrar esa fila)"""
+        # Restar uno a la posición no cambia el orden del índice de fechas
+        self._indice_fechas = array('q', (
+            clave - 1 if clave & _MASCARA_POSICION > desde else clave for clave in self._indice_fechas
+        ))
+        self._sin_fecha = _desplazadas(self._sin_fecha, desde)
+        for indice in self._indices_clave.values():
+            for valor, actual in indice.items():
+                if isinstance(actual, int):
+                    if actual > desde:
+                        indice[valor] = actual - 1
+                else:
+                    indice[valor] = _desplazadas(actual, desde)
+        for indice in self._indices_normalizados.values():
+            for clave, posiciones in indice.items():
+                indice[clave] = _desplazadas(posiciones, desde)
+        for indice in self._indices_texto.values():
+            indice.desplazar(desde)
+
+    @staticmethod
+    def _convertir(memoria: Dict, conversion, texto: str):
+        """Convierte una sola vez cada texto distinto (fechas y montos se repiten mucho)"""
+        try:
+            return memoria[texto]
+        except KeyError:
+            if len(memoria) >= _MAX_MEMORIA:
+                # Textos casi todos distintos (p. ej. montos): no se deja crecer sin límite
+                memoria.clear()
+            valor = memoria[texto] = conversion(texto)
+            return valor
+
+    def _indexar_fecha(self, ordinal: Optional[int], posicion: int) -> None:
+        if ordinal is None:
+            self._sin_fecha.append(posicion)
+            return
+        clave = (ordinal << _BITS_POSICION) | posicion
+        if not self._indice_fechas or self._indice_fechas[-1] <= clave:
+            # Caso común: registros del día, que llegan en orden
+            self._indice_fechas.append(clave)
+        else:
+            insort(self._indice_fechas, clave)
+
+    # ----- Escrituras propias aplicadas localmente -----
+
+    def aplicar_agregadas(self, filas: List[List], primera_fila: int) -> None:
+        """
+        Incorpora filas que el bot acaba de agregar a la hoja
+
+        Args:
+            filas: Valores escritos
+            primera_fila: Número de fila en la hoja donde quedó la primera
+        """
+        with self._lock:
+            if self.cargada and primera_fila == self.num_filas + 2:
+                self._agregar_filas(filas)
+            else:
+                # Hubo filas intermedias que no conocemos: se traen en el próximo refresco
+                self._desactualizada = True
+
+    def aplicar_edicion(self, fila_hoja: int, valores: List) -> None:
+        """Reemplaza localmente los valores de una fila editada por el bot"""
+        with self._lock:
+            posicion = fila_hoja - 2
+            if not self.cargada or not 0 <= posicion < self.num_filas:
+                self._cargada = False
+                return
+            actual = self.fila(posicion)
+            nueva = self._normalizar(list(valores) + actual[len(valores):])
+            self._desindexar(posicion, actual)
+            for columna, valor in zip(self.columnas, nueva):
+                columna[posicion] = valor
+            self._indexar(posicion, nueva)
+
+    def aplicar_columna(self, columna: str, valores: Dict[int, str]) -> None:
+        """
+        Asigna localmente valores de una columna en varias filas
+
+        Args:
+            columna: Nombre de la columna
+            valores: Número de fila en la hoja -> nuevo valor
+        """
+        with self._lock:
+            indice = self.encabezados.index(columna)
+            for fila_hoja, valor in valores.items():
+                posicion = fila_hoja - 2
+                if 0 <= posicion < self.num_filas:
+                    self._desindexar(posicion, self.fila(posicion))
+                    self.columnas[indice][posicion] = valor
+                    self._indexar(posicion, self.fila(posicion))
+
+    def aplicar_eliminacion(self, fila_hoja: int) -> None:
+        """Quita localmente una fila eliminada por el bot"""
+        with self._lock:
+            posicion = fila_hoja - 2
+            if not self.cargada or not 0 <= posicion < self.num_filas:
+                self._cargada = False
+                return
+            self._desindexar(posicion, self.fila(posicion))
+            for columna in self.columnas:
+                del columna[posicion]
+            self._desplazar(posicion)
+
+    # ----- Consultas -----
+
+    def letra_columna(self, columna: str) -> str:
+        """Letra A1 de la columna con ese encabezado"""
+        return _letra_columna(self.encabezados.index(columna) + 1)
+
+    def fila(self, indice: int) -> List[str]:
+        """Retorna la fila de datos en la posición indicada (0 = primera)"""
+        return [columna[indice] for columna in self.columnas]
+
+    def filas(self, posiciones: Optional[Sequence[int]] = None) -> List[Tuple[int, List[str]]]:
+        """
+        Retorna (número de fila en la hoja, valores) para cada fila de datos
+
+        Args:
+            posiciones: Filas a incluir (todas si es None)
+        """
+        with self._lock:
+            if posiciones is None:
+                posiciones = range(self.num_filas)
+            return [(i + 2, self.fila(i)) for i in posiciones]
+
+    def ultima(self) -> Optional[Tuple[int, List[str]]]:
+        """(número de fila en la hoja, valores) de la última fila de datos"""
+        with self._lock:
+            if not self.num_filas:
+                return None
+            return self.num_filas + 1, self.fila(self.num_filas - 1)
+
+    def buscar(self, clave: str, valor: str) -> List[int]:
+        """Posiciones de las filas cuya columna clave es igual a valor (O(1))"""
+        with self._lock:
+            posiciones = self._indices_clave[clave].get(valor)
+            if posiciones is None:
+                return []
+            return [posiciones] if isinstance(posiciones, int) else list(posiciones)
+
+    def buscar_normalizado(self, columna: str, valor: str) -> Set[int]:
+        """Posiciones cuya columna es igual a valor sin distinguir tildes ni mayúsculas"""
+        with self._lock:
+            return set(self._indices_normalizados[columna].get(clave_busqueda(valor), ()))
+
+    def buscar_texto(self, columna: str, subcadena: str) -> Set[int]:
+        """Posiciones cuya columna contiene la subcadena (índice de trigramas)"""
+        with self._lock:
+            return self._indices_texto[columna].buscar(subcadena)
+
+    def posiciones_en_rango(self, inicio: Optional[int] = None,
+                            fin: Optional[int] = None) -> List[int]:
+        """
+        Posiciones de las filas con fecha en [inicio, fin], en el orden de la hoja
+
+        Usa búsqueda binaria sobre el índice de fechas. Las filas con fecha
+        inválida se incluyen siempre para no ocultar datos.
+        """
+        with self._lock:
+            if inicio is None and fin is None:
+                return list(range(self.num_filas))
+            i = 0 if inicio is None else bisect_left(self._indice_fechas, inicio << _BITS_POSICION)
+            j = (len(self._indice_fechas) if fin is None
+                 else bisect_right(self._indice_fechas, ((fin + 1) << _BITS_POSICION) - 1))
+            posiciones = [clave & _MASCARA_POSICION for clave in self._indice_fechas[i:j]]
+            posiciones.extend(self._sin_fecha)
+            posiciones.sort()
+            return posiciones
+
+    def resumen(self, inicio=None, fin=None) -> Dict:
+        """Totales del rango de ordinales [inicio, fin] según los agregados diarios"""
+        with self._lock:
+            return self.agregados.resumen(inicio, fin)
+
+    def registros(self, posiciones: Optional[List[int]] = None) -> List[Dict]:
+        """
+        Equivalente local de worksheet.get_all_records()
+
+        Args:
+            posiciones: Filas a incluir (todas si es None)
+        """
+        with self._lock:
+            return [vista.como_dict() for vista in self.vistas(posiciones)]
+
+    def vistas(self, posiciones: Optional[Sequence[int]] = None) -> List[RegistroVista]:
+        """Vistas de las filas indicadas (todas si es None), sin copiar valores"""
+        with self._lock:
+            if posiciones is None:
+                posiciones = range(self.num_filas)
+            return [RegistroVista(self, i) for i in posiciones]
+
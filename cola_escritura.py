@@ -0,0 +1,304 @@
+"""
+Cola de escritura diferida hacia Google Sheets
+Cada registro confirmado se guarda primero en un diario local y luego se
+envía en lotes (una llamada values.append por hoja) cada cierto tiempo o
+cuando se acumulan suficientes filas. Si Google Sheets no responde, las
+filas siguen en el diario y se reintentan con espera exponencial.
+Las ediciones y borrados de registros (por ID) pasan por el mismo diario y
+se aplican después de las filas agregadas de su hoja.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional
+from utils import generar_id_registro
+
+logger = logging.getLogger(__name__)
+
+class ColaEscritura:
+    """Cola de filas pendientes respaldada por un diario en disco"""
+
+    def __init__(self, ruta_diario: str,
+                 enviar_lote: Callable[[str, List[List], bool], None],
+                 intervalo_ms: int, max_filas: int,
+                 espera_reintento: float = 2.0, espera_maxima: float = 300.0,
+                 aplicar_operacion: Optional[Callable[[str, str, str, Optional[List]], bool]] = None):
+        """
+        Args:
+            ruta_diario: Archivo donde se registran las filas antes de enviarlas
+            enviar_lote: Función (hoja, filas, verificar) que escribe un lote en
+                Google Sheets; con verificar=True debe omitir las filas cuyo ID
+                (última columna) ya exista en la hoja
+            intervalo_ms: Tiempo máximo que una fila espera para agruparse
+            max_filas: Cantidad de filas que dispara un envío inmediato
+            espera_reintento: Segundos de espera tras el primer envío fallido
+            espera_maxima: Tope de la espera exponencial entre reintentos
+            aplicar_operacion: Función (hoja, op, id_registro, fila) que aplica
+                una edición ('editar') o un borrado ('eliminar') en Google
+                Sheets; retorna False si el registro ya no existe
+        """
+        self.ruta_diario = ruta_diario
+        self._enviar_lote = enviar_lote
+        self._aplicar_operacion = aplicar_operacion
+        self.intervalo = intervalo_ms / 1000
+        self.max_filas = max_filas
+        self.espera_reintento = espera_reintento
+        self.espera_maxima = espera_maxima
+        self._pendientes: List[Dict] = []
+        self._en_envio: List[Dict] = []
+        self._forzar = False
+        self._fallos_consecutivos = 0
+        self._cond = threading.Condition()
+        self._hilo: Optional[threading.Thread] = None
+        # El diario se lee (y se reescribe) con el primer uso, no al crear la cola
+        self._recuperada = False
+
+    # ----- Diario -----
+
+    def _asegurar_recuperada(self) -> None:
+        with self._cond:
+            if not self._recuperada:
+                self._recuperar()
+                self._recuperada = True
+
+    def _recuperar(self) -> None:
+        """Carga las filas que quedaron sin confirmar en una ejecución anterior"""
+        entradas: Dict[str, Dict] = {}
+        if os.path.exists(self.ruta_diario):
+            with open(self.ruta_diario, encoding='utf-8') as archivo:
+                for linea in archivo:
+                    try:
+                        dato = json.loads(linea)
+                    except json.JSONDecodeError:
+                        # Última línea incompleta por una caída durante la escritura
+                        continue
+                    if 'ok' in dato:
+                        for id_entrada in dato['ok']:
+                            entradas.pop(id_entrada, None)
+                    else:
+                        entradas[dato['id']] = dato
+
+        # No se sabe si llegaron a escribirse antes de la caída: se verifican al reenviar
+        for entrada in entradas.values():
+            entrada['verificar'] = True
+        self._pendientes = list(entradas.values())
+        self._reescribir_diario(self._pendientes)
+        if self._pendientes:
+            logger.warning(f"📒 {len(self._pendientes)} filas recuperadas del diario local")
+
+    def _reescribir_diario(self, entradas: List[Dict]) -> None:
+        with open(self.ruta_diario, 'w', encoding='utf-8') as archivo:
+            for entrada in entradas:
+                archivo.write(json.dumps(entrada, ensure_ascii=False) + '\n')
+            archivo.flush()
+            os.fsync(archivo.fileno())
+
+    def _anotar_diario(self, dato: Dict) -> None:
+        with open(self.ruta_diario, 'a', encoding='utf-8') as archivo:
+            archivo.write(json.dumps(dato, ensure_ascii=False) + '\n')
+            archivo.flush()
+            os.fsync(archivo.fileno())
+
+    # ----- API pública -----
+
+    def iniciar(self) -> None:
+        """Arranca el hilo de envío si aún no está corriendo"""
+        self._asegurar_recuperada()
+        with self._cond:
+            # También se relanza si el hilo anterior terminó por un error inesperado
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name='cola-escritura', daemon=True)
+                self._hilo.start()
+
+    def encolar(self, hoja: str, fila: List) -> None:
+        """
+        Registra una fila en el diario y la deja pendiente de envío
+
+        Args:
+            hoja: 'venta', 'gasto' o 'cierre'
+            fila: Valores de la fila
+        """
+        self._agregar({'id': generar_id_registro(), 'hoja': hoja, 'fila': fila})
+
+    def encolar_operacion(self, hoja: str, op: str, id_registro: str,
+                          fila: Optional[List] = None) -> None:
+        """
+        Registra en el diario una edición o un borrado de un registro existente
+
+        Args:
+            hoja: 'venta' o 'gasto'
+            op: 'editar' o 'eliminar'
+            id_registro: ID del registro (última columna de su fila)
+            fila: Valores nuevos de la fila (solo al editar)
+        """
+        if self._aplicar_operacion is None:
+            raise RuntimeError('La cola no admite ediciones ni borrados')
+        self._agregar({'id': generar_id_registro(), 'hoja': hoja, 'op': op,
+                       'registro': id_registro, 'fila': fila})
+
+    def _agregar(self, entrada: Dict) -> None:
+        self._asegurar_recuperada()
+        with self._cond:
+            self._anotar_diario(entrada)
+            self._pendientes.append(entrada)
+            self._cond.notify_all()
+        self.iniciar()
+
+    @property
+    def sin_conexion(self) -> bool:
+        """Indica si el último envío a Google Sheets falló"""
+        return self._fallos_consecutivos > 0
+
+    def filas_pendientes(self, hoja: str) -> List[List]:
+        """
+        Copia de las filas de una hoja que aún no se escribieron, con las
+        ediciones y borrados pendientes sobre ellas ya aplicados
+        """
+        self._asegurar_recuperada()
+        with self._cond:
+            entradas = [e for e in self._en_envio + self._pendientes if e['hoja'] == hoja]
+        filas: Dict[str, List] = {}
+        for entrada in entradas:
+            if 'op' not in entrada:
+                filas[str(entrada['fila'][-1])] = list(entrada['fila'])
+            elif entrada['registro'] in filas:
+                if entrada['op'] == 'eliminar':
+                    del filas[entrada['registro']]
+                else:
+                    filas[entrada['registro']] = list(entrada['fila']) + [entrada['registro']]
+        return list(filas.values())
+
+    def pendientes(self, hoja: Optional[str] = None) -> int:
+        """Número de filas aún no escritas en Google Sheets"""
+        self._asegurar_recuperada()
+        with self._cond:
+            return sum(
+                1 for entrada in self._pendientes + self._en_envio
+                if hoja is None or entrada['hoja'] == hoja
+            )
+
+    def vaciar(self, timeout: float) -> bool:
+        """
+        Fuerza el envío inmediato y espera a que no queden filas pendientes
+
+        Sin conexión no se espera: las filas se enviarán en el próximo reintento.
+
+        Returns:
+            bool: True si la cola quedó vacía antes del tiempo límite
+        """
+        self.iniciar()
+        limite = time.monotonic() + timeout
+        with self._cond:
+            self._forzar = True
+            self._cond.notify_all()
+            while self._pendientes or self._en_envio:
+                if self.sin_conexion:
+                    return False
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return False
+                self._cond.wait(restante)
+        return True
+
+    # ----- Envío en segundo plano -----
+
+    def _bucle(self) -> None:
+        while True:
+            try:
+                self._ciclo()
+            except Exception as e:
+                # Un fallo del diario (disco lleno, permisos) no debe detener el hilo
+                logger.error(f"❌ Error en la cola de escritura: {e}")
+                with self._cond:
+                    # El lote en curso vuelve a la cola; sus filas se verifican al reenviarse
+                    for entrada in self._en_envio:
+                        if 'op' not in entrada:
+                            entrada['verificar'] = True
+                    self._pendientes = self._en_envio + self._pendientes
+                    self._en_envio = []
+                    self._fallos_consecutivos += 1
+                    self._cond.notify_all()
+                time.sleep(self._espera())
+
+    def _ciclo(self) -> None:
+        """Espera un lote, lo envía y deja en la cola lo que falló"""
+        with self._cond:
+            while not self._pendientes:
+                self._cond.wait()
+            # Ventana de agrupación: se espera a más filas salvo que se fuerce el envío
+            limite = time.monotonic() + self.intervalo
+            while len(self._pendientes) < self.max_filas and not self._forzar:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                self._cond.wait(restante)
+            lote, self._pendientes = self._pendientes, []
+            self._en_envio = lote
+            self._forzar = False
+
+        fallidas = self._enviar(lote)
+
+        with self._cond:
+            self._en_envio = []
+            self._pendientes = fallidas + self._pendientes
+            if not self._pendientes:
+                # Todo quedó confirmado: el diario se puede compactar
+                self._reescribir_diario([])
+            self._fallos_consecutivos = self._fallos_consecutivos + 1 if fallidas else 0
+            self._cond.notify_all()
+        if fallidas:
+            time.sleep(self._espera())
+
+    def _espera(self) -> float:
+        """Espera exponencial con jitter según los fallos consecutivos"""
+        espera = min(self.espera_maxima,
+                     self.espera_reintento * 2 ** (self._fallos_consecutivos - 1))
+        return espera * random.uniform(0.5, 1.0)
+
+    def _enviar(self, lote: List[Dict]) -> List[Dict]:
+        """Envía el lote agrupado por hoja; retorna las entradas que fallaron"""
+        por_hoja: Dict[str, List[Dict]] = {}
+        for entrada in lote:
+            por_hoja.setdefault(entrada['hoja'], []).append(entrada)
+
+        fallidas = []
+        for hoja, entradas in por_hoja.items():
+            agregadas = [entrada for entrada in entradas if 'op' not in entrada]
+            operaciones = [entrada for entrada in entradas if 'op' in entrada]
+            if agregadas:
+                verificar = any(entrada.get('verificar') for entrada in agregadas)
+                try:
+                    self._enviar_lote(hoja, [entrada['fila'] for entrada in agregadas], verificar)
+                except Exception as e:
+                    logger.error(f"❌ Error al enviar {len(agregadas)} filas de {hoja} "
+                                 f"(intento {self._fallos_consecutivos + 1}): {e}")
+                    # La petición pudo haberse aplicado aunque falló la respuesta
+                    for entrada in agregadas:
+                        entrada['verificar'] = True
+                    # Las operaciones pueden referirse a esas filas: esperan con ellas
+                    fallidas.extend(entradas)
+                    continue
+                with self._cond:
+                    self._anotar_diario({'ok': [entrada['id'] for entrada in agregadas]})
+            fallidas.extend(self._enviar_operaciones(hoja, operaciones))
+        return fallidas
+
+    def _enviar_operaciones(self, hoja: str, operaciones: List[Dict]) -> List[Dict]:
+        """Aplica ediciones y borrados en orden; retorna los que quedan por reintentar"""
+        for i, entrada in enumerate(operaciones):
+            try:
+                if not self._aplicar_operacion(hoja, entrada['op'], entrada['registro'], entrada['fila']):
+                    logger.warning(f"⚠️ Se descarta {entrada['op']} de {hoja} {entrada['registro']}: "
+                                   f"el registro ya no existe en Google Sheets")
+            except Exception as e:
+                logger.error(f"❌ Error al aplicar {entrada['op']} de {hoja} {entrada['registro']} "
+                             f"(intento {self._fallos_consecutivos + 1}): {e}")
+                # El orden importa (editar y luego eliminar): las siguientes también esperan
+                return operaciones[i:]
+            with self._cond:
+                self._anotar_diario({'ok': [entrada['id']]})
+        return []
@@ -25,7 +25,47 @@ class Config:
     GOOGLE_CREDENTIALS_FILE: str = os.getenv('GOOGLE_CREDENTIALS_FILE', 'credentials.json')
     VENTAS_SHEET_ID: str = os.getenv('VENTAS_SHEET_ID', '')
     GASTOS_SHEET_ID: str = os.getenv('GASTOS_SHEET_ID', '')
+
+    # Acceso concurrente a Google Sheets
+    SHEETS_MAX_WORKERS: int = int(os.getenv('SHEETS_MAX_WORKERS', '4'))
+    SHEETS_TIMEOUT: float = float(os.getenv('SHEETS_TIMEOUT', '20'))
+    # Conexiones keep-alive hacia la API y margen (s) para renovar el token antes de vencer
+    SHEETS_POOL_CONEXIONES: int = int(os.getenv('SHEETS_POOL_CONEXIONES', '10'))
+    TOKEN_MARGEN_RENOVACION: float = float(os.getenv('TOKEN_MARGEN_RENOVACION', '300'))
+    # Cuota de la API (peticiones por minuto), ráfaga permitida y reintentos ante 429/5xx
+    SHEETS_CUOTA_POR_MINUTO: int = int(os.getenv('SHEETS_CUOTA_POR_MINUTO', '60'))
+    SHEETS_RAFAGA: int = int(os.getenv('SHEETS_RAFAGA', '10'))
+    SHEETS_MAX_REINTENTOS: int = int(os.getenv('SHEETS_MAX_REINTENTOS', '5'))
+    # Tope (s) de una petición contando esperas de cuota y reintentos: menor que
+    # SHEETS_TIMEOUT para que el bot reciba el error y no se agote su espera
+    SHEETS_PLAZO_PETICION: float = float(os.getenv('SHEETS_PLAZO_PETICION', str(SHEETS_TIMEOUT / 2)))
+
+    # Almacenamiento principal: 'sheets' o, opcionalmente, 'sqlite' (Google Sheets queda como copia)
+    ALMACENAMIENTO: str = os.getenv('ALMACENAMIENTO', 'sheets').lower()
+    SQLITE_DB: str = os.getenv('SQLITE_DB', 'surthilanas.db')
+
+    # Segundos que una copia local de las hojas se considera fresca
+    CACHE_TTL: float = float(os.getenv('CACHE_TTL', '60'))
+
+    # Escritura diferida en lotes
+    DIARIO_ESCRITURA: str = os.getenv('DIARIO_ESCRITURA', 'diario_escritura.jsonl')
+    ESCRITURA_LOTE_MS: int = int(os.getenv('ESCRITURA_LOTE_MS', '500'))
+    ESCRITURA_LOTE_FILAS: int = int(os.getenv('ESCRITURA_LOTE_FILAS', '20'))
+    # Segundos que una lectura espera a que se envíen las escrituras pendientes
+    ESCRITURA_ESPERA_LECTURA: float = float(os.getenv('ESCRITURA_ESPERA_LECTURA', '3'))
+    # Tope en segundos de la espera entre reintentos cuando Google Sheets no responde
+    ESCRITURA_REINTENTO_MAX: float = float(os.getenv('ESCRITURA_REINTENTO_MAX', '300'))
+
+    # Archivo donde se recuerda que los encabezados de las hojas ya fueron verificados
+    ESQUEMA_LOCAL: str = os.getenv('ESQUEMA_LOCAL', 'esquema_hojas.json')
     
+    # Procesos dedicados a entrenar los modelos de ML (fuera del event loop del bot)
+    ML_PROCESOS_ENTRENAMIENTO: int = int(os.getenv('ML_PROCESOS_ENTRENAMIENTO', '1'))
+    # Carpeta de los modelos entrenados (se reutilizan mientras los datos no cambien)
+    ML_MODELOS_DIR: str = os.getenv('ML_MODELOS_DIR', 'modelos')
+    # Segundos entre incorporaciones de las ventas registradas desde el bot al modelo
+    ML_REENTRENAR_INTERVALO: float = float(os.getenv('ML_REENTRENAR_INTERVALO', '3600'))
+
     # General
     TIMEZONE: str = os.getenv('TIMEZONE', 'America/Bogota')
     MONEDA: str = os.getenv('MONEDA', 'COP')
@@ -35,6 +75,9 @@ class Config:
     LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO')
     LOG_FILE: str = os.getenv('LOG_FILE', 'surthilanas_bot.log')
     
+    # Gastos mostrados por mensaje en /buscargasto
+    BUSQUEDA_TAMANO_PAGINA: int = int(os.getenv('BUSQUEDA_TAMANO_PAGINA', '5'))
+
     # Categorías de gastos predefinidas
     CATEGORIAS_GASTOS = [
         'Servicios públicos',
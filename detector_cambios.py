@@ -0,0 +1,70 @@
+"""
+Detección de cambios hechos directamente en Google Sheets
+Consulta la versión del archivo en Drive (una petición pequeña, sin leer
+celdas) para saber si el spreadsheet cambió desde la última lectura
+"""
+
+import threading
+import logging
+from typing import Any, Callable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+class DetectorCambios:
+    """Versión de un spreadsheet en Drive y registro de las escrituras propias"""
+
+    def __init__(self, nombre: str, consultar_version: Callable[[], Optional[str]]):
+        """
+        Args:
+            nombre: Nombre del spreadsheet (para logs)
+            consultar_version: Retorna la versión actual del archivo en Drive
+        """
+        self.nombre = nombre
+        self._consultar = consultar_version
+        # Reentrante: ubicar una fila dentro de una escritura puede asignar IDs faltantes
+        self._lock = threading.RLock()
+        self._profundidad = 0
+        self._aviso_emitido = False
+        self.consultas = 0
+        self.fallidas = 0
+
+    def version(self) -> Optional[str]:
+        """Versión actual del archivo (None si Drive no respondió)"""
+        self.consultas += 1
+        try:
+            version = self._consultar()
+            self._aviso_emitido = False
+            return version
+        except Exception as e:
+            self.fallidas += 1
+            if not self._aviso_emitido:
+                self._aviso_emitido = True
+                logger.warning(f"⚠️ No se pudo consultar la versión de {self.nombre} en Drive, "
+                               f"se revisarán solo las filas nuevas: {e}")
+            return None
+
+    def escritura_propia(self, caches: Sequence, escribir: Callable[[], Any]) -> Any:
+        """
+        Ejecuta una escritura del bot (una a la vez por spreadsheet)
+
+        Se consulta la versión antes y después de la escritura: si antes
+        coincidía con la de una caché, nadie más editó el archivo y la caché
+        (que ya incluye el cambio propio) adopta la versión nueva sin releer
+        la hoja. Las escrituras anidadas se cuentan dentro de la exterior.
+        """
+        with self._lock:
+            self._profundidad += 1
+            exterior = self._profundidad == 1
+            previa = self.version() if exterior else None
+            completada = False
+            try:
+                resultado = escribir()
+                completada = True
+                return resultado
+            finally:
+                self._profundidad -= 1
+                if exterior:
+                    # Si la escritura falló no se sabe qué quedó aplicado en la hoja
+                    posterior = self.version() if completada else None
+                    for cache in caches:
+                        cache.registrar_escritura_propia(previa, posterior)
@@ -0,0 +1,112 @@
+"""
+Entrenamiento de modelos de ML fuera del event loop del bot
+El ajuste del modelo corre en un pool de procesos; las peticiones simultáneas
+sobre los mismos datos esperan un único entrenamiento en lugar de repetirlo
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+from config import Config
+from ml_analisis import AnalizadorFinancieroML, ML_AVAILABLE
+from pronostico_ventas import entrenar_pronosticador
+
+logger = logging.getLogger(__name__)
+
+class EntrenadorML:
+    """Entrena en otro proceso, a lo sumo una vez por versión de los datos"""
+
+    def __init__(self, procesos: int = Config.ML_PROCESOS_ENTRENAMIENTO):
+        """
+        Args:
+            procesos: Procesos dedicados al entrenamiento
+        """
+        self.procesos = max(1, procesos)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._en_curso: Dict[str, asyncio.Future] = {}
+        self.entrenamientos = 0
+        self.compartidos = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # Los procesos se crean con el primer entrenamiento, no al importar.
+        # 'spawn': hacer fork con hilos corriendo (cola, token, pool de Sheets)
+        # puede dejar locks tomados en el proceso hijo
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def en_curso(self) -> bool:
+        """Indica si hay algún entrenamiento ejecutándose"""
+        return bool(self._en_curso)
+
+    async def entrenar(self, analizador: AnalizadorFinancieroML) -> Dict:
+        """
+        Entrena el modelo de ventas del analizador sin bloquear el event loop
+
+        Si el modelo ya corresponde a los datos actuales se retornan sus
+        métricas; si hay uno guardado en disco para esos datos se carga; si
+        ya hay un entrenamiento en curso para esos datos, se espera ese mismo
+        resultado.
+
+        Returns:
+            Diccionario con métricas del modelo (o {"error": ...})
+        """
+        if not ML_AVAILABLE:
+            return {"error": "Scikit-learn no está instalado"}
+
+        try:
+            serie = analizador.datos_entrenamiento()
+        except Exception as e:
+            return {"error": str(e)}
+
+        clave = analizador.clave_modelo(serie)
+        if analizador.version_modelo == clave and analizador.metricas_modelo:
+            return analizador.metricas_modelo
+
+        tarea = self._en_curso.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(self._entrenar(analizador, serie, clave))
+            self._en_curso[clave] = tarea
+            tarea.add_done_callback(lambda _: self._en_curso.pop(clave, None))
+        else:
+            self.compartidos += 1
+
+        # shield: si quien espera se cancela, el entrenamiento sigue para los demás
+        return await asyncio.shield(tarea)
+
+    async def _entrenar(self, analizador: AnalizadorFinancieroML, serie, clave: str) -> Dict:
+        # Un modelo ya entrenado con estos mismos datos se reutiliza desde disco
+        if await asyncio.to_thread(analizador.cargar_modelo_guardado, clave):
+            return analizador.metricas_modelo
+
+        loop = asyncio.get_running_loop()
+        logger.info(f"🤖 Entrenando modelo de ventas ({len(serie)} días)...")
+        try:
+            modelo, metricas = await loop.run_in_executor(self._pool(), entrenar_pronosticador, serie)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # Un proceso murió (p. ej. sin memoria): el próximo intento crea otro pool
+                self._executor = None
+            logger.error(f"Error al entrenar modelo: {e}")
+            return {"error": str(e)}
+
+        self.entrenamientos += 1
+        analizador.aplicar_modelo(modelo, metricas, clave)
+        await asyncio.to_thread(analizador.guardar_modelo)
+        logger.info(f"✅ Modelo de ventas entrenado (precisión {metricas['precisión']})")
+        return metricas
+
+    def cerrar(self) -> None:
+        """Libera los procesos del pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Instancia global
+entrenador_ml = EntrenadorML()
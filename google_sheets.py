@@ -4,15 +4,39 @@ Maneja todas las operaciones de lectura/escritura en Google Drive
 """
 
 import gspread
+import hashlib
+import json
+import os
 from google.oauth2.service_account import Credentials
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 import logging
+import re
+import threading
+from bisect import bisect_right
 from config import Config
+from almacenamiento import Almacenamiento, totales_vacios
+from cache_hojas import CacheHoja
+from gspread.urls import DRIVE_FILES_API_V3_URL
+from gspread.utils import numericise_all, rowcol_to_a1
+from cola_escritura import ColaEscritura
+from detector_cambios import DetectorCambios
+from limitador_cuota import LimitadorCuota
+from sesion_http import SesionSheets
+from utils import centavos_a_celda, fecha_a_ordinal, generar_id_registro, monto_a_centavos
+from vuelo_unico import VueloUnico, coalescido
 
 logger = logging.getLogger(__name__)
 
-class GoogleSheetsManager:
+VENTAS_HEADERS = ['Fecha', 'Número Factura', 'Cliente', 'Monto',
+                  'Medio de Pago', 'Observaciones', 'Timestamp', 'ID']
+GASTOS_HEADERS = ['Fecha', 'Categoría', 'Proveedor', 'Monto',
+                  'Medio de Pago', 'Observaciones', 'Timestamp', 'ID']
+CIERRE_HEADERS = ['Fecha', 'Efectivo', 'Transferencia', 'Tarjeta Débito',
+                  'Tarjeta Crédito', 'Otro', 'Total del Día', 'Observaciones',
+                  'Timestamp', 'ID']
+
+class GoogleSheetsManager(Almacenamiento):
     """Gestor de operaciones con Google Sheets"""
 
     def __init__(self):
@@ -21,9 +45,82 @@ class GoogleSheetsManager:
             'https://www.googleapis.com/auth/drive'
         ]
         self.client = None
-        self.ventas_sheet = None
-        self.gastos_sheet = None
-        self._connect()
+        self.sesion: Optional[SesionSheets] = None
+        self._ventas_sheet = None
+        self._gastos_sheet = None
+        self._cierre_sheet = None
+        self._conectado = False
+        # Última fila de datos conocida por hoja, según las respuestas de append
+        self._ultima_fila: Dict[str, int] = {}
+        self._conexion_lock = threading.Lock()
+        # Consultas idénticas simultáneas (p. ej. varios /estado) comparten una sola lectura
+        self._vuelos = VueloUnico()
+        self.cache_ventas = CacheHoja('ventas', Config.CACHE_TTL,
+                                      dimensiones=['Medio de Pago'],
+                                      claves=['Número Factura', 'ID'])
+        self.cache_gastos = CacheHoja('gastos', Config.CACHE_TTL,
+                                      dimensiones=['Categoría', 'Medio de Pago'],
+                                      claves=['ID', 'Fecha'],
+                                      normalizadas=['Categoría'],
+                                      textos=['Proveedor'])
+        # Versión en Drive de cada spreadsheet: detecta ediciones hechas a mano
+        self._detectores = {
+            spreadsheet_id: DetectorCambios(
+                nombre, lambda spreadsheet_id=spreadsheet_id: self._version_drive(spreadsheet_id)
+            )
+            for spreadsheet_id, nombre in ((Config.VENTAS_SHEET_ID, 'ventas'),
+                                           (Config.GASTOS_SHEET_ID, 'gastos'))
+        }
+        self.cola = ColaEscritura(
+            Config.DIARIO_ESCRITURA, self._enviar_lote,
+            Config.ESCRITURA_LOTE_MS, Config.ESCRITURA_LOTE_FILAS,
+            espera_maxima=Config.ESCRITURA_REINTENTO_MAX,
+            aplicar_operacion=self._aplicar_operacion
+        )
+        # No se conecta aquí ni se toca el diario: la conexión y el hilo de envío
+        # arrancan en la primera operación que los necesite (o al precalentar),
+        # así importar el módulo no usa la red ni el disco
+
+    @property
+    def ventas_sheet(self):
+        self.conectar()
+        return self._ventas_sheet
+
+    @property
+    def gastos_sheet(self):
+        self.conectar()
+        return self._gastos_sheet
+
+    @property
+    def cierre_sheet(self):
+        self.conectar()
+        return self._cierre_sheet
+
+    def conectar(self) -> None:
+        """Abre la conexión con Google Sheets si aún no existe (seguro entre hilos)"""
+        if self._conectado:
+            return
+        with self._conexion_lock:
+            if not self._conectado:
+                self._connect()
+                self._conectado = True
+        # El hilo de envío sube lo que quedó pendiente de una ejecución anterior
+        self.cola.iniciar()
+
+    def precalentar(self) -> None:
+        """Conecta y carga las cachés en segundo plano para que la primera consulta sea rápida"""
+        def _precalentar():
+            # Aunque falle la conexión, la cola reintenta por su cuenta lo pendiente
+            self.cola.iniciar()
+            try:
+                self.conectar()
+                for tipo in ('venta', 'gasto'):
+                    self._cache_sincronizada(tipo)
+                logger.info("🔥 Conexión y cachés de Google Sheets listas")
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo precalentar Google Sheets, se reintentará al usarlo: {e}")
+
+        threading.Thread(target=_precalentar, name='sheets-precalentar', daemon=True).start()
 
     def _connect(self) -> None:
         try:
@@ -31,40 +128,103 @@ class GoogleSheetsManager:
                 Config.GOOGLE_CREDENTIALS_FILE,
                 scopes=self.scopes
             )
-            self.client = gspread.authorize(creds)
-            self.ventas_sheet = self.client.open_by_key(Config.VENTAS_SHEET_ID).sheet1
-            self.gastos_sheet = self.client.open_by_key(Config.GASTOS_SHEET_ID).sheet1
+            # Sesión compartida con keep-alive; el token se renueva antes de vencer
+            self.sesion = SesionSheets(
+                creds, Config.SHEETS_POOL_CONEXIONES, Config.TOKEN_MARGEN_RENOVACION,
+                LimitadorCuota(Config.SHEETS_CUOTA_POR_MINUTO, Config.SHEETS_RAFAGA),
+                Config.SHEETS_MAX_REINTENTOS, plazo=Config.SHEETS_PLAZO_PETICION
+            )
+            self.sesion.renovar_si_necesario()
+            self.sesion.iniciar()
+            self.client = gspread.Client(auth=creds, session=self.sesion.session)
+            self.client.set_timeout(Config.SHEETS_PLAZO_PETICION)
+            # Un solo open_by_key por spreadsheet: ventas y cierre diario comparten el de ventas
+            spreadsheet_ventas = self.client.open_by_key(Config.VENTAS_SHEET_ID)
+            self._ventas_sheet = spreadsheet_ventas.sheet1
+            spreadsheet_gastos = self.client.open_by_key(Config.GASTOS_SHEET_ID)
+            self._gastos_sheet = spreadsheet_gastos.sheet1
 
             # Hoja de cierre diario (segunda hoja del spreadsheet de ventas)
-            spreadsheet = self.client.open_by_key(Config.VENTAS_SHEET_ID)
             try:
-                self.cierre_sheet = spreadsheet.worksheet('Cierre Diario')
+                self._cierre_sheet = spreadsheet_ventas.worksheet('Cierre Diario')
             except gspread.WorksheetNotFound:
-                self.cierre_sheet = spreadsheet.add_worksheet(
+                self._cierre_sheet = spreadsheet_ventas.add_worksheet(
                     title='Cierre Diario', rows=1000, cols=10
                 )
 
-            self._init_headers()
+            self._init_headers(spreadsheet_ventas, spreadsheet_gastos)
             logger.info("✅ Conectado exitosamente a Google Sheets")
         except Exception as e:
             logger.error(f"❌ Error al conectar con Google Sheets: {e}")
             raise
 
-    def _init_headers(self) -> None:
-        ventas_headers = ['Fecha', 'Número Factura', 'Cliente', 'Monto',
-                         'Medio de Pago', 'Observaciones', 'Timestamp']
-        if not self.ventas_sheet.row_values(1):
-            self.ventas_sheet.append_row(ventas_headers)
+    def _init_headers(self, spreadsheet_ventas, spreadsheet_gastos) -> None:
+        """
+        Verifica los encabezados con una lectura y a lo sumo una escritura por
+        spreadsheet. Si este esquema ya se verificó antes, no hace llamadas.
+        """
+        version = self._version_esquema()
+        if self._leer_esquema_local() == version:
+            logger.debug("📋 Encabezados ya verificados para esta versión del esquema")
+            return
+
+        hojas_por_spreadsheet = [
+            (spreadsheet_ventas, [(self._ventas_sheet, VENTAS_HEADERS),
+                                  (self._cierre_sheet, CIERRE_HEADERS)]),
+            (spreadsheet_gastos, [(self._gastos_sheet, GASTOS_HEADERS)]),
+        ]
+        for spreadsheet, hojas in hojas_por_spreadsheet:
+            respuesta = spreadsheet.values_batch_get(
+                [self._rango_hoja(sheet, '1:1') for sheet, _ in hojas]
+            )
+            escrituras = []
+            for (sheet, headers), rango in zip(hojas, respuesta.get('valueRanges', [])):
+                actuales = (rango.get('values') or [[]])[0]
+                if not actuales:
+                    escrituras.append({'range': self._rango_hoja(sheet, 'A1'), 'values': [headers]})
+                elif 'ID' not in actuales:
+                    # Hojas creadas antes de existir la columna ID
+                    celda = rowcol_to_a1(1, headers.index('ID') + 1)
+                    escrituras.append({'range': self._rango_hoja(sheet, celda), 'values': [['ID']]})
+            if escrituras:
+                spreadsheet.values_batch_update(
+                    body={'valueInputOption': 'RAW', 'data': escrituras}
+                )
+                logger.info(f"📋 {len(escrituras)} encabezados actualizados en {spreadsheet.id}")
+
+        self._guardar_esquema_local(version)
+
+    @staticmethod
+    def _rango_hoja(sheet, celdas: str) -> str:
+        """Rango A1 calificado con el nombre de la hoja"""
+        titulo = sheet.title.replace("'", "''")
+        return f"'{titulo}'!{celdas}"
+
+    @staticmethod
+    def _version_esquema() -> str:
+        """Sello del esquema esperado: cambia si cambian los encabezados o las hojas"""
+        esquema = [Config.VENTAS_SHEET_ID, Config.GASTOS_SHEET_ID,
+                   VENTAS_HEADERS, GASTOS_HEADERS, CIERRE_HEADERS]
+        return hashlib.sha1(json.dumps(esquema).encode('utf-8')).hexdigest()[:12]
 
-        gastos_headers = ['Fecha', 'Categoría', 'Proveedor', 'Monto',
-                         'Medio de Pago', 'Observaciones', 'Timestamp']
-        if not self.gastos_sheet.row_values(1):
-            self.gastos_sheet.append_row(gastos_headers)
+    @staticmethod
+    def _leer_esquema_local() -> Optional[str]:
+        try:
+            with open(Config.ESQUEMA_LOCAL, encoding='utf-8') as archivo:
+                return json.load(archivo).get('version')
+        except (OSError, ValueError):
+            return None
 
-        cierre_headers = ['Fecha', 'Efectivo', 'Transferencia', 'Tarjeta Débito',
-                         'Tarjeta Crédito', 'Otro', 'Total del Día', 'Observaciones', 'Timestamp']
-        if not self.cierre_sheet.row_values(1):
-            self.cierre_sheet.append_row(cierre_headers)
+    @staticmethod
+    def _guardar_esquema_local(version: str) -> None:
+        try:
+            temporal = Config.ESQUEMA_LOCAL + '.tmp'
+            with open(temporal, 'w', encoding='utf-8') as archivo:
+                json.dump({'version': version,
+                           'verificado': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}, archivo)
+            os.replace(temporal, Config.ESQUEMA_LOCAL)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo guardar el esquema local: {e}")
 
     def registrar_cierre_diario(self, cierre: Dict) -> bool:
         """
@@ -72,7 +232,7 @@ class GoogleSheetsManager:
 
         Args:
             cierre: Dict con keys: fecha, efectivo, transferencia, tarjeta_debito,
-                    tarjeta_credito, otro, total, observaciones
+                    tarjeta_credito, otro, total (montos en centavos), observaciones
         Returns:
             bool: True si se registró exitosamente
         """
@@ -80,16 +240,18 @@ class GoogleSheetsManager:
             timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             row = [
                 cierre.get('fecha', ''),
-                cierre.get('efectivo', 0),
-                cierre.get('transferencia', 0),
-                cierre.get('tarjeta_debito', 0),
-                cierre.get('tarjeta_credito', 0),
-                cierre.get('otro', 0),
-                cierre.get('total', 0),
+                centavos_a_celda(cierre.get('efectivo', 0)),
+                centavos_a_celda(cierre.get('transferencia', 0)),
+                centavos_a_celda(cierre.get('tarjeta_debito', 0)),
+                centavos_a_celda(cierre.get('tarjeta_credito', 0)),
+                centavos_a_celda(cierre.get('otro', 0)),
+                centavos_a_celda(cierre.get('total', 0)),
                 cierre.get('observaciones', '-'),
-                timestamp
+                timestamp,
+                cierre.get('id') or generar_id_registro()
             ]
-            self.cierre_sheet.append_row(row)
+            self.cola.encolar('cierre', row)
+            self._vuelos.nueva_generacion()
             logger.info(f"✅ Cierre diario registrado: {cierre.get('fecha')} - Total: {cierre.get('total')}")
             return True
         except Exception as e:
@@ -103,12 +265,14 @@ class GoogleSheetsManager:
                 venta.get('fecha', ''),
                 venta.get('numero_factura', ''),
                 venta.get('cliente', '-'),
-                venta.get('monto', 0),
+                centavos_a_celda(venta.get('monto', 0)),
                 venta.get('medio_pago', ''),
                 venta.get('observaciones', '-'),
-                timestamp
+                timestamp,
+                venta.get('id') or generar_id_registro()
             ]
-            self.ventas_sheet.append_row(row)
+            self.cola.encolar('venta', row)
+            self._vuelos.nueva_generacion()
             logger.info(f"✅ Venta registrada: {venta.get('numero_factura')}")
             return True
         except Exception as e:
@@ -122,72 +286,316 @@ class GoogleSheetsManager:
                 gasto.get('fecha', ''),
                 gasto.get('categoria', ''),
                 gasto.get('proveedor', '-'),
-                gasto.get('monto', 0),
+                centavos_a_celda(gasto.get('monto', 0)),
                 gasto.get('medio_pago', ''),
                 gasto.get('observaciones', '-'),
-                timestamp
+                timestamp,
+                gasto.get('id') or generar_id_registro()
             ]
-            self.gastos_sheet.append_row(row)
+            self.cola.encolar('gasto', row)
+            self._vuelos.nueva_generacion()
             logger.info(f"✅ Gasto registrado: {gasto.get('categoria')}")
             return True
         except Exception as e:
             logger.error(f"❌ Error al registrar gasto: {e}")
             return False
 
-    def _fecha_en_rango(self, fecha_str: str, inicio: Optional[str], fin: Optional[str]) -> bool:
+    def _enviar_lote(self, hoja: str, filas: List[List], verificar: bool = False) -> None:
         """
-        FIX BUG 3: Implementación real del filtrado por rango de fechas.
-        La versión original simplemente ignoraba inicio y fin.
+        Escribe en una sola llamada las filas encoladas para una hoja
+
+        Args:
+            verificar: Omitir las filas cuyo ID ya está en la hoja (reintentos
+                de envíos que pudieron aplicarse aunque la respuesta falló)
         """
-        if not inicio and not fin:
-            return True
+        sheet = self.cierre_sheet if hoja == 'cierre' else self._sheet(hoja)
+        if verificar:
+            existentes = self._ids_en_hoja(hoja, [fila[-1] for fila in filas])
+            if existentes:
+                logger.info(f"♻️ {len(existentes)} filas de {hoja} ya estaban en Google Sheets")
+                filas = [fila for fila in filas if fila[-1] not in existentes]
+            if not filas:
+                return
+        def _escribir():
+            respuesta = sheet.append_rows(filas)
+            if hoja != 'cierre':
+                self._aplicar_agregadas(hoja, respuesta, filas)
+
+        self._escritura_propia(hoja, _escribir)
+        logger.info(f"📤 {len(filas)} filas de {hoja} enviadas a Google Sheets")
+
+    def _ids_en_hoja(self, hoja: str, ids: List[str]) -> set:
+        """Cuáles de los IDs indicados ya existen en la hoja"""
+        if hoja == 'cierre':
+            columna = CIERRE_HEADERS.index('ID') + 1
+            return set(ids) & set(self.cierre_sheet.col_values(columna))
+        cache = self._cache(hoja)
+        cache.marcar_desactualizada()
+        cache.sincronizar(self._sheet(hoja))
+        return {id_registro for id_registro in ids if cache.buscar('ID', id_registro)}
+
+    def _sheet(self, tipo: str):
+        """Retorna la hoja de 'venta' o 'gasto'"""
+        return self.ventas_sheet if tipo == 'venta' else self.gastos_sheet
+
+    def _cache(self, tipo: str) -> CacheHoja:
+        """Retorna la caché de la hoja de 'venta' o 'gasto'"""
+        return self.cache_ventas if tipo == 'venta' else self.cache_gastos
+
+    @staticmethod
+    def _spreadsheet_de(hoja: str) -> str:
+        """ID del spreadsheet de 'venta', 'gasto' o 'cierre' (el cierre está en el de ventas)"""
+        return Config.GASTOS_SHEET_ID if hoja == 'gasto' else Config.VENTAS_SHEET_ID
+
+    def _version_drive(self, spreadsheet_id: str) -> Optional[str]:
+        """Versión del archivo en Drive: aumenta con cada cambio del spreadsheet"""
+        self.conectar()
+        respuesta = self.client.request(
+            'get', f'{DRIVE_FILES_API_V3_URL}/{spreadsheet_id}',
+            params={'fields': 'version', 'supportsAllDrives': True}
+        )
+        return respuesta.json().get('version')
+
+    def _escritura_propia(self, hoja: str, escribir):
+        """
+        Ejecuta una escritura del bot en la hoja indicada sin que el cambio de
+        versión que produce se tome por una edición externa
+        """
+        spreadsheet_id = self._spreadsheet_de(hoja)
+        caches = [self._cache(tipo) for tipo in ('venta', 'gasto')
+                  if self._spreadsheet_de(tipo) == spreadsheet_id]
+        return self._detectores[spreadsheet_id].escritura_propia(caches, escribir)
+
+    def _cache_sincronizada(self, tipo: str) -> CacheHoja:
+        """
+        Retorna la caché de la hoja indicada, refrescándola si está vencida
+
+        Sin conexión se usa la última copia local (si existe) en lugar de fallar.
+        No espera a la cola de escritura: quien lee suma las filas del diario
+        con _pendientes_de_envio.
+        """
+        cache = self._cache(tipo)
         try:
-            fecha = datetime.strptime(fecha_str, '%d/%m/%Y')
-            if inicio:
-                fecha_inicio = datetime.strptime(inicio, '%d/%m/%Y')
-                if fecha < fecha_inicio:
-                    return False
-            if fin:
-                fecha_fin = datetime.strptime(fin, '%d/%m/%Y')
-                if fecha > fecha_fin:
-                    return False
-            return True
-        except (ValueError, TypeError):
-            # Si la fecha no tiene formato válido, incluirla para no silenciar datos
-            return True
+            cache.sincronizar(self._sheet(tipo), self._detectores[self._spreadsheet_de(tipo)].version)
+        except Exception as e:
+            if not cache.cargada:
+                raise
+            logger.warning(f"⚠️ Sin conexión con Google Sheets, usando copia local de {tipo}s: {e}")
+            return cache
+        if cache.buscar('ID', ''):
+            self._asignar_ids_faltantes(tipo, cache)
+        return cache
+
+    def _pendientes_de_envio(self, tipo: str, cache: CacheHoja) -> List[List]:
+        """Filas confirmadas en el diario que aún no están en la hoja ni en la caché"""
+        return [
+            fila for fila in self.cola.filas_pendientes(tipo)
+            if not cache.buscar('ID', fila[-1])
+        ]
+
+    def _asignar_ids_faltantes(self, tipo: str, cache: CacheHoja) -> None:
+        """Asigna ID a las filas que no lo tienen (históricas o agregadas a mano)"""
+        try:
+            letra = cache.letra_columna('ID')
+            nuevos = {posicion + 2: generar_id_registro() for posicion in cache.buscar('ID', '')}
+            def _escribir():
+                self._sheet(tipo).batch_update([
+                    {'range': f'{letra}{fila}', 'values': [[id_registro]]}
+                    for fila, id_registro in nuevos.items()
+                ])
+                cache.aplicar_columna('ID', nuevos)
+
+            self._escritura_propia(tipo, _escribir)
+            logger.info(f"🆔 {len(nuevos)} registros de {tipo} recibieron ID")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron asignar IDs a {tipo}s: {e}")
+
+    def _resolver_fila(self, tipo: str, id_registro: str) -> Optional[int]:
+        """
+        Ubica la fila actual de un registro a partir de su ID
+
+        La fila se toma del índice local y se confirma leyendo una sola celda;
+        si no coincide (p. ej. otro usuario borró filas) se recarga la caché.
+        Llamar desde _en_fila, para que nadie mueva la fila antes de escribirla.
+        """
+        if not id_registro:
+            return None
+        for recargar in (False, True):
+            if recargar:
+                self._cache(tipo).invalidar()
+            cache = self._cache_sincronizada(tipo)
+            posiciones = cache.buscar('ID', id_registro)
+            if posiciones:
+                fila = posiciones[0] + 2
+                celda = self._sheet(tipo).acell(f"{cache.letra_columna('ID')}{fila}")
+                if celda.value == id_registro:
+                    return fila
+        return None
+
+    def _en_fila(self, tipo: str, id_registro: str, accion, vaciar: bool = True) -> Optional[int]:
+        """
+        Ubica la fila del registro y ejecuta accion(fila) sin soltar el bloqueo
+        de escritura del spreadsheet entre ambos pasos: otra edición o borrado
+        del bot no puede desplazar la fila en medio
+
+        Args:
+            vaciar: Enviar antes lo pendiente del diario (False desde la propia cola)
+
+        Returns:
+            La fila modificada, o None si el registro no se encontró
+        """
+        if vaciar and self.cola.pendientes(tipo):
+            # El registro puede seguir en el diario: se necesita su fila real.
+            # Se espera antes de tomar el bloqueo, que la cola también usa al enviar
+            self.cola.vaciar(Config.ESCRITURA_ESPERA_LECTURA)
+
+        def _escribir():
+            fila = self._resolver_fila(tipo, id_registro)
+            if fila is not None:
+                accion(fila)
+            return fila
+
+        return self._escritura_propia(tipo, _escribir)
+
+    def _aplicar_agregadas(self, tipo: str, respuesta: Dict, filas: List[List]) -> None:
+        """Incorpora a la caché las filas agregadas, ubicadas según la respuesta de la API"""
+        cache = self._cache(tipo)
+        try:
+            rango = respuesta['updates']['updatedRange']
+            primera_fila = int(re.search(r'![A-Z]+(\d+)', rango).group(1))
+        except (KeyError, TypeError, AttributeError):
+            self._ultima_fila.pop(tipo, None)
+            cache.marcar_desactualizada()
+            return
+        self._ultima_fila[tipo] = primera_fila + len(filas) - 1
+        cache.aplicar_agregadas(filas, primera_fila)
+
+    @staticmethod
+    def _venta_desde_fila(fila: Optional[int], row: List[str]) -> Dict:
+        return {
+            'fila': fila,
+            'fecha': row[0] if len(row) > 0 else '',
+            'numero_factura': row[1] if len(row) > 1 else '',
+            'cliente': row[2] if len(row) > 2 else '',
+            'monto': monto_a_centavos(row[3]) if len(row) > 3 else 0,
+            'medio_pago': row[4] if len(row) > 4 else '',
+            'observaciones': row[5] if len(row) > 5 else '',
+            'timestamp': row[6] if len(row) > 6 else '',
+            'id': row[7] if len(row) > 7 else ''
+        }
+
+    @staticmethod
+    def _gasto_desde_fila(fila: int, row: List[str]) -> Dict:
+        return {
+            'fila': fila,
+            'fecha': row[0] if len(row) > 0 else '',
+            'categoria': row[1] if len(row) > 1 else '',
+            'proveedor': row[2] if len(row) > 2 else '',
+            'monto': monto_a_centavos(row[3]) if len(row) > 3 else 0,
+            'medio_pago': row[4] if len(row) > 4 else '',
+            'observaciones': row[5] if len(row) > 5 else '',
+            'timestamp': row[6] if len(row) > 6 else '',
+            'id': row[7] if len(row) > 7 else ''
+        }
 
+    def _rango_ordinal(self, inicio: Optional[str],
+                       fin: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+        """
+        FIX BUG 3: Filtrado real por rango de fechas.
+        Convierte los extremos DD/MM/AAAA a ordinales una sola vez por consulta;
+        si alguno es inválido no se filtra, para no silenciar datos.
+        """
+        inicio_ord = fecha_a_ordinal(inicio) if inicio else None
+        fin_ord = fecha_a_ordinal(fin) if fin else None
+        if (inicio and inicio_ord is None) or (fin and fin_ord is None):
+            return None, None
+        return inicio_ord, fin_ord
+
+    @coalescido
     def obtener_ventas(self, fecha_inicio: Optional[str] = None,
                        fecha_fin: Optional[str] = None) -> List[Dict]:
         try:
-            all_records = self.ventas_sheet.get_all_records()
-            if not fecha_inicio and not fecha_fin:
-                return all_records
-            # FIX BUG 3: filtrado real por fecha
-            return [r for r in all_records if self._fecha_en_rango(r.get('Fecha', ''), fecha_inicio, fecha_fin)]
+            inicio, fin = self._rango_ordinal(fecha_inicio, fecha_fin)
+            cache = self._cache_sincronizada('venta')
+            registros = cache.registros(cache.posiciones_en_rango(inicio, fin))
+            registros.extend(
+                self._registro_pendiente('venta', fila)
+                for fila in self._pendientes_de_envio('venta', cache)
+                if self._en_rango(fila[0], inicio, fin)
+            )
+            return registros
         except Exception as e:
             logger.error(f"❌ Error al obtener ventas: {e}")
             return []
 
+    @coalescido
     def obtener_gastos(self, fecha_inicio: Optional[str] = None,
                        fecha_fin: Optional[str] = None) -> List[Dict]:
         try:
-            all_records = self.gastos_sheet.get_all_records()
-            if not fecha_inicio and not fecha_fin:
-                return all_records
-            # FIX BUG 3: filtrado real por fecha
-            return [r for r in all_records if self._fecha_en_rango(r.get('Fecha', ''), fecha_inicio, fecha_fin)]
+            inicio, fin = self._rango_ordinal(fecha_inicio, fecha_fin)
+            cache = self._cache_sincronizada('gasto')
+            registros = cache.registros(cache.posiciones_en_rango(inicio, fin))
+            registros.extend(
+                self._registro_pendiente('gasto', fila)
+                for fila in self._pendientes_de_envio('gasto', cache)
+                if self._en_rango(fila[0], inicio, fin)
+            )
+            return registros
         except Exception as e:
             logger.error(f"❌ Error al obtener gastos: {e}")
             return []
 
+    @staticmethod
+    def _registro_pendiente(tipo: str, fila: List) -> Dict:
+        """Fila del diario con la forma de get_all_records()"""
+        headers = VENTAS_HEADERS if tipo == 'venta' else GASTOS_HEADERS
+        return dict(zip(headers, numericise_all([str(v) for v in fila])))
+
+    def registros_completos(self, tipo: str) -> List[Dict]:
+        """
+        Todos los registros de la hoja, incluidos los que siguen en el diario.
+        A diferencia de obtener_ventas/obtener_gastos, propaga los errores.
+        """
+        cache = self._cache_sincronizada(tipo)
+        return cache.registros() + [
+            self._registro_pendiente(tipo, fila) for fila in self._pendientes_de_envio(tipo, cache)
+        ]
+
+    @staticmethod
+    def _en_rango(fecha: str, inicio: Optional[int], fin: Optional[int]) -> bool:
+        """Mismo criterio que la caché: las fechas inválidas siempre se incluyen"""
+        ordinal = fecha_a_ordinal(fecha)
+        if ordinal is None:
+            return True
+        return (inicio is None or ordinal >= inicio) and (fin is None or ordinal <= fin)
+
+    def _resumen_con_pendientes(self, tipo: str, inicio: Optional[int],
+                                fin: Optional[int]) -> Dict:
+        """Resumen de la caché más las filas que siguen en el diario"""
+        cache = self._cache_sincronizada(tipo)
+        resumen = cache.resumen(inicio, fin)
+        headers = VENTAS_HEADERS if tipo == 'venta' else GASTOS_HEADERS
+        for fila in self._pendientes_de_envio(tipo, cache):
+            if not self._en_rango(fila[0], inicio, fin):
+                continue
+            centavos = monto_a_centavos(fila[3])
+            resumen['total'] += centavos
+            resumen['conteo'] += 1
+            for dimension, totales in resumen['por'].items():
+                valor = str(fila[headers.index(dimension)])
+                totales[valor] = totales.get(valor, 0) + centavos
+        return resumen
+
+    @coalescido
     def calcular_totales(self, fecha_inicio: Optional[str] = None,
                         fecha_fin: Optional[str] = None) -> Dict:
         try:
-            ventas = self.obtener_ventas(fecha_inicio, fecha_fin)
-            gastos = self.obtener_gastos(fecha_inicio, fecha_fin)
+            inicio, fin = self._rango_ordinal(fecha_inicio, fecha_fin)
+            ventas = self._resumen_con_pendientes('venta', inicio, fin)
+            gastos = self._resumen_con_pendientes('gasto', inicio, fin)
 
-            total_ventas = sum(float(v.get('Monto', 0)) for v in ventas)
-            total_gastos = sum(float(g.get('Monto', 0)) for g in gastos)
+            total_ventas = ventas['total']
+            total_gastos = gastos['total']
             utilidad = total_ventas - total_gastos
 
             return {
@@ -195,150 +603,296 @@ class GoogleSheetsManager:
                 'total_gastos': total_gastos,
                 'utilidad': utilidad,
                 'margen': (utilidad / total_ventas * 100) if total_ventas > 0 else 0,
-                'num_ventas': len(ventas),
-                'num_gastos': len(gastos)
+                'num_ventas': ventas['conteo'],
+                'num_gastos': gastos['conteo'],
+                'ventas_por_medio': ventas['por']['Medio de Pago'],
+                'gastos_por_categoria': gastos['por']['Categoría']
             }
         except Exception as e:
             logger.error(f"❌ Error al calcular totales: {e}")
-            return {
-                'total_ventas': 0, 'total_gastos': 0,
-                'utilidad': 0, 'margen': 0,
-                'num_ventas': 0, 'num_gastos': 0
-            }
+            return totales_vacios()
+
+    def _posiciones_factura(self, numero_factura: str) -> Tuple[CacheHoja, List[int]]:
+        """
+        Busca la factura en el índice local. Dentro del TTL un fallo del índice
+        se da por bueno (lo normal con una factura nueva): las filas que siguen
+        en el diario las revisa quien llama. Solo con la caché vencida se
+        refresca, por si la factura fue agregada desde otro lugar.
+        """
+        cache = self.cache_ventas
+        posiciones = cache.buscar('Número Factura', numero_factura) if cache.cargada else []
+        if not posiciones and not cache.vigente and not self.cola.sin_conexion:
+            cache = self._cache_sincronizada('venta')
+            posiciones = cache.buscar('Número Factura', numero_factura)
+        return cache, posiciones
 
+    @coalescido
     def buscar_venta_por_factura(self, numero_factura: str) -> Optional[Dict]:
         try:
-            all_values = self.ventas_sheet.get_all_values()
-            for idx, row in enumerate(all_values[1:], start=2):
-                if len(row) >= 2 and row[1] == numero_factura:
-                    return {
-                        'fila': idx,
-                        'fecha': row[0] if len(row) > 0 else '',
-                        'numero_factura': row[1] if len(row) > 1 else '',
-                        'cliente': row[2] if len(row) > 2 else '',
-                        'monto': row[3] if len(row) > 3 else '',
-                        'medio_pago': row[4] if len(row) > 4 else '',
-                        'observaciones': row[5] if len(row) > 5 else '',
-                        'timestamp': row[6] if len(row) > 6 else ''
-                    }
+            cache, posiciones = self._posiciones_factura(numero_factura)
+            if posiciones:
+                return self._venta_desde_fila(posiciones[0] + 2, cache.fila(posiciones[0]))
+            # Recién registrada: sigue en el diario y todavía no tiene fila en la hoja
+            for row in self.cola.filas_pendientes('venta'):
+                if str(row[1]) == numero_factura:
+                    return self._venta_desde_fila(None, [str(v) for v in row])
             return None
         except Exception as e:
             logger.error(f"❌ Error al buscar venta: {e}")
             return None
 
+    @coalescido
+    def existe_factura(self, numero_factura: str) -> bool:
+        """Indica si ya hay una venta registrada con ese número de factura"""
+        try:
+            if any(str(fila[1]) == numero_factura for fila in self.cola.filas_pendientes('venta')):
+                return True
+            return bool(self._posiciones_factura(numero_factura)[1])
+        except Exception as e:
+            logger.error(f"❌ Error al verificar factura: {e}")
+            return False
+
+    def _posiciones_gastos(self, categoria: Optional[str], proveedor: Optional[str],
+                           fecha: Optional[str]) -> Tuple[CacheHoja, List[int]]:
+        """
+        Intersecta los índices de la caché (categoría y proveedor sin
+        distinguir tildes ni mayúsculas; proveedor por subcadena)
+        """
+        cache = self._cache_sincronizada('gasto')
+        conjuntos = []
+        if categoria:
+            conjuntos.append(cache.buscar_normalizado('Categoría', categoria))
+        if fecha:
+            conjuntos.append(set(cache.buscar('Fecha', fecha)))
+        if proveedor:
+            conjuntos.append(cache.buscar_texto('Proveedor', proveedor))
+        if not conjuntos:
+            return cache, list(range(cache.num_filas))
+        conjuntos.sort(key=len)
+        return cache, sorted(conjuntos[0].intersection(*conjuntos[1:]))
+
+    @coalescido
+    def buscar_gastos_pagina(self, categoria: str = None, proveedor: str = None,
+                             fecha: str = None, cursor=None, tamano: int = 10) -> Dict:
+        """
+        El cursor guarda los IDs de la página entregada (y la posición de la
+        última fila como respaldo): las posiciones cambian si se borran filas
+        anteriores, los IDs no
+        """
+        try:
+            cache, posiciones = self._posiciones_gastos(categoria, proveedor, fecha)
+            inicio = 0 if cursor is None else bisect_right(posiciones, self._posicion_cursor(cache, cursor))
+            pagina = posiciones[inicio:inicio + tamano]
+            hay_mas = inicio + tamano < len(posiciones)
+            gastos = [self._gasto_desde_fila(idx, row) for idx, row in cache.filas(pagina)]
+            return {
+                'gastos': gastos,
+                'total': len(posiciones),
+                'cursor': (tuple(g['id'] for g in gastos), pagina[-1]) if hay_mas else None
+            }
+        except Exception as e:
+            logger.error(f"❌ Error al buscar gastos: {e}")
+            return {'gastos': [], 'total': 0, 'cursor': None}
+
+    @staticmethod
+    def _posicion_cursor(cache: CacheHoja, cursor) -> int:
+        """Posición actual de la última fila entregada que todavía existe"""
+        ids, posicion = cursor
+        for id_registro in reversed(ids):
+            actuales = cache.buscar('ID', id_registro) if id_registro else []
+            if actuales:
+                return actuales[0]
+        # Se borró toda la página: lo siguiente quedó a partir de su primera posición
+        return posicion - len(ids)
+
+    @coalescido
     def buscar_gasto_por_criterio(self, categoria: str = None,
                                    proveedor: str = None,
                                    fecha: str = None) -> List[Dict]:
         try:
-            all_values = self.gastos_sheet.get_all_values()
-            resultados = []
-            for idx, row in enumerate(all_values[1:], start=2):
-                if len(row) < 3:
-                    continue
-                coincide = True
-                if categoria and row[1].lower() != categoria.lower():
-                    coincide = False
-                if proveedor and proveedor.lower() not in row[2].lower():
-                    coincide = False
-                if fecha and row[0] != fecha:
-                    coincide = False
-                if coincide:
-                    resultados.append({
-                        'fila': idx,
-                        'fecha': row[0] if len(row) > 0 else '',
-                        'categoria': row[1] if len(row) > 1 else '',
-                        'proveedor': row[2] if len(row) > 2 else '',
-                        'monto': row[3] if len(row) > 3 else '',
-                        'medio_pago': row[4] if len(row) > 4 else '',
-                        'observaciones': row[5] if len(row) > 5 else '',
-                        'timestamp': row[6] if len(row) > 6 else ''
-                    })
-            return resultados
+            cache, posiciones = self._posiciones_gastos(categoria, proveedor, fecha)
+            return [self._gasto_desde_fila(idx, row) for idx, row in cache.filas(posiciones)]
         except Exception as e:
             logger.error(f"❌ Error al buscar gastos: {e}")
             return []
 
+    def metricas_conexion(self) -> Dict:
+        """Reutilización de conexiones y estado del token (vacío si no hay conexión)"""
+        if not self.sesion:
+            return {}
+        return {
+            **self.sesion.metricas(),
+            'lecturas_compartidas': self._vuelos.compartidas,
+            'consultas_version': sum(d.consultas for d in self._detectores.values()),
+            'cambios_externos': self.cache_ventas.cambios_externos + self.cache_gastos.cambios_externos
+        }
+
+    def pendientes_de_sincronizar(self) -> Dict:
+        """Estado de la cola de escritura: filas en el diario y si hay conexión"""
+        return {'pendientes': self.cola.pendientes(), 'sin_conexion': self.cola.sin_conexion}
+
+    def cerrar(self) -> None:
+        """Intenta enviar lo pendiente del diario y cierra la sesión HTTP"""
+        if self.cola.pendientes() and not self.cola.vaciar(Config.ESCRITURA_ESPERA_LECTURA):
+            # Siguen en el diario: se envían en el próximo arranque
+            logger.warning(f"📒 {self.cola.pendientes()} registros quedan en el diario local")
+        if self.sesion:
+            self.sesion.detener()
+
+    def _leer_ultima_fila(self, tipo: str) -> Optional[Tuple[int, List[str]]]:
+        """
+        Lee solo la última fila de datos conocida por la respuesta de append
+
+        Se piden dos filas: si la siguiente tiene datos, o la esperada está
+        vacía, la hoja cambió por fuera y no se puede confiar en la posición.
+        """
+        ultima = self._ultima_fila.get(tipo)
+        if not ultima:
+            return None
+        headers = VENTAS_HEADERS if tipo == 'venta' else GASTOS_HEADERS
+        letra = rowcol_to_a1(1, len(headers))[:-1]
+        valores = self._sheet(tipo).get(f'A{ultima}:{letra}{ultima + 1}')
+        if len(valores) != 1 or not valores[0]:
+            self._ultima_fila.pop(tipo, None)
+            return None
+        row = [str(v) for v in valores[0]]
+        return ultima, row + [''] * (len(headers) - len(row))
+
+    @coalescido
     def obtener_ultimo_registro(self, tipo: str) -> Optional[Dict]:
+        """
+        Último registro de la hoja sin descargarla completa: desde la caché si
+        está cargada (su refresco solo lee las filas nuevas) o leyendo la fila
+        indicada por el último append
+        """
         try:
-            sheet = self.ventas_sheet if tipo == 'venta' else self.gastos_sheet
-            all_values = sheet.get_all_values()
-            if len(all_values) < 2:
-                return None
-            ultima_fila = len(all_values)
-            row = all_values[-1]
+            if self.cola.pendientes(tipo):
+                self.cola.vaciar(Config.ESCRITURA_ESPERA_LECTURA)
+            ultimo = None if self._cache(tipo).cargada else self._leer_ultima_fila(tipo)
+            if ultimo is None:
+                ultimo = self._cache_sincronizada(tipo).ultima()
+                if ultimo is None:
+                    return None
+            ultima_fila, row = ultimo
             if tipo == 'venta':
-                return {
-                    'fila': ultima_fila,
-                    'fecha': row[0] if len(row) > 0 else '',
-                    'numero_factura': row[1] if len(row) > 1 else '',
-                    'cliente': row[2] if len(row) > 2 else '',
-                    'monto': row[3] if len(row) > 3 else '',
-                    'medio_pago': row[4] if len(row) > 4 else '',
-                    'observaciones': row[5] if len(row) > 5 else '',
-                    'timestamp': row[6] if len(row) > 6 else ''
-                }
-            else:
-                return {
-                    'fila': ultima_fila,
-                    'fecha': row[0] if len(row) > 0 else '',
-                    'categoria': row[1] if len(row) > 1 else '',
-                    'proveedor': row[2] if len(row) > 2 else '',
-                    'monto': row[3] if len(row) > 3 else '',
-                    'medio_pago': row[4] if len(row) > 4 else '',
-                    'observaciones': row[5] if len(row) > 5 else '',
-                    'timestamp': row[6] if len(row) > 6 else ''
-                }
+                return self._venta_desde_fila(ultima_fila, row)
+            return self._gasto_desde_fila(ultima_fila, row)
         except Exception as e:
             logger.error(f"❌ Error al obtener último registro: {e}")
             return None
 
-    def editar_venta(self, fila: int, venta: Dict) -> bool:
+    @staticmethod
+    def _fila_editada(tipo: str, datos: Dict) -> List:
+        """Columnas A:G de un registro editado (el ID no cambia)"""
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return [
+            datos.get('fecha', ''),
+            datos.get('numero_factura', '') if tipo == 'venta' else datos.get('categoria', ''),
+            datos.get('cliente', '-') if tipo == 'venta' else datos.get('proveedor', '-'),
+            centavos_a_celda(datos.get('monto', 0)),
+            datos.get('medio_pago', ''),
+            datos.get('observaciones', '-'),
+            timestamp + ' (editado)'
+        ]
+
+    def _editar_fila(self, tipo: str, id_registro: str, row: List, vaciar: bool = True) -> Optional[int]:
+        """Reemplaza las columnas A:G del registro; retorna su fila (None si no existe)"""
+        def _escribir(fila: int):
+            self._sheet(tipo).update(f'A{fila}:G{fila}', [row])
+            self._cache(tipo).aplicar_edicion(fila, row)
+
+        fila = self._en_fila(tipo, id_registro, _escribir, vaciar)
+        if fila is not None:
+            self._vuelos.nueva_generacion()
+        return fila
+
+    def _eliminar_fila(self, tipo: str, id_registro: str, vaciar: bool = True) -> Optional[int]:
+        """Borra la fila del registro; retorna la fila que ocupaba (None si no existe)"""
+        def _escribir(fila: int):
+            self._sheet(tipo).delete_rows(fila)
+            self._cache(tipo).aplicar_eliminacion(fila)
+            if fila <= self._ultima_fila.get(tipo, 0):
+                self._ultima_fila[tipo] -= 1
+
+        fila = self._en_fila(tipo, id_registro, _escribir, vaciar)
+        if fila is not None:
+            self._vuelos.nueva_generacion()
+        return fila
+
+    def editar_venta(self, id_registro: str, venta: Dict) -> bool:
         try:
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            row = [
-                venta.get('fecha', ''),
-                venta.get('numero_factura', ''),
-                venta.get('cliente', '-'),
-                venta.get('monto', 0),
-                venta.get('medio_pago', ''),
-                venta.get('observaciones', '-'),
-                timestamp + ' (editado)'
-            ]
-            self.ventas_sheet.update(f'A{fila}:G{fila}', [row])
+            fila = self._editar_fila('venta', id_registro, self._fila_editada('venta', venta))
+            if fila is None:
+                logger.error(f"❌ No se encontró la venta con ID {id_registro}")
+                return False
             logger.info(f"✅ Venta editada en fila {fila}")
             return True
         except Exception as e:
             logger.error(f"❌ Error al editar venta: {e}")
             return False
 
-    def editar_gasto(self, fila: int, gasto: Dict) -> bool:
+    def editar_gasto(self, id_registro: str, gasto: Dict) -> bool:
         try:
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            row = [
-                gasto.get('fecha', ''),
-                gasto.get('categoria', ''),
-                gasto.get('proveedor', '-'),
-                gasto.get('monto', 0),
-                gasto.get('medio_pago', ''),
-                gasto.get('observaciones', '-'),
-                timestamp + ' (editado)'
-            ]
-            self.gastos_sheet.update(f'A{fila}:G{fila}', [row])
+            fila = self._editar_fila('gasto', id_registro, self._fila_editada('gasto', gasto))
+            if fila is None:
+                logger.error(f"❌ No se encontró el gasto con ID {id_registro}")
+                return False
             logger.info(f"✅ Gasto editado en fila {fila}")
             return True
         except Exception as e:
             logger.error(f"❌ Error al editar gasto: {e}")
             return False
 
-    def eliminar_registro(self, fila: int, tipo: str) -> bool:
+    def eliminar_registro(self, id_registro: str, tipo: str) -> bool:
         try:
-            sheet = self.ventas_sheet if tipo == 'venta' else self.gastos_sheet
-            sheet.delete_rows(fila)
+            fila = self._eliminar_fila(tipo, id_registro)
+            if fila is None:
+                logger.error(f"❌ No se encontró {tipo} con ID {id_registro}")
+                return False
             logger.info(f"✅ {tipo.capitalize()} eliminada de fila {fila}")
             return True
         except Exception as e:
             logger.error(f"❌ Error al eliminar {tipo}: {e}")
             return False
 
+    # ----- Ediciones diferidas (réplica desde otro almacenamiento) -----
+
+    def encolar_edicion(self, tipo: str, id_registro: str, datos: Dict) -> bool:
+        """
+        Anota en el diario la edición de un registro; se aplica en Google
+        Sheets en segundo plano y se reintenta hasta lograrlo
+
+        Returns:
+            bool: True si quedó registrada en el diario
+        """
+        try:
+            self.cola.encolar_operacion(tipo, 'editar', id_registro, self._fila_editada(tipo, datos))
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error al anotar edición de {tipo}: {e}")
+            return False
+
+    def encolar_eliminacion(self, tipo: str, id_registro: str) -> bool:
+        """
+        Anota en el diario el borrado de un registro (ver encolar_edicion)
+
+        Returns:
+            bool: True si quedó registrado en el diario
+        """
+        try:
+            self.cola.encolar_operacion(tipo, 'eliminar', id_registro)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error al anotar borrado de {tipo}: {e}")
+            return False
+
+    def _aplicar_operacion(self, tipo: str, op: str, id_registro: str, row: Optional[List]) -> bool:
+        """Aplica una operación del diario (desde el hilo de la cola); False si el registro no existe"""
+        if op == 'editar':
+            fila = self._editar_fila(tipo, id_registro, row, vaciar=False)
+        else:
+            fila = self._eliminar_fila(tipo, id_registro, vaciar=False)
+        return fila is not None
+
 # Instancia global
 sheets_manager = GoogleSheetsManager()
\ No newline at end of file
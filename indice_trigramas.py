@@ -0,0 +1,88 @@
+"""
+Índice de trigramas para búsqueda de subcadenas
+Cada texto distinto se guarda normalizado (sin tildes ni mayúsculas) y se
+indexa por sus trigramas; una consulta intersecta los textos de los trigramas
+de la subcadena buscada, verifica esos candidatos y une sus posiciones
+"""
+
+from array import array
+from typing import Dict, Iterable, Set
+from utils import clave_busqueda
+
+def _trigramas(texto: str) -> Set[str]:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+class IndiceTrigramas:
+    """
+    Posiciones de filas indexadas por los trigramas de un texto
+
+    Un mismo texto (p. ej. un proveedor en miles de filas) se indexa una sola
+    vez: los trigramas apuntan a textos distintos y cada texto a sus filas.
+    """
+
+    def __init__(self):
+        self.limpiar()
+
+    def limpiar(self) -> None:
+        # texto original -> texto normalizado
+        self._normalizados: Dict[str, str] = {}
+        # texto normalizado -> posiciones de las filas que lo tienen
+        self._posiciones: Dict[str, array] = {}
+        # trigrama -> textos normalizados que lo contienen
+        self._textos: Dict[str, Set[str]] = {}
+
+    def agregar(self, posicion: int, texto: str) -> None:
+        """Indexa el texto de la fila en la posición indicada"""
+        normalizado = self._normalizados.get(texto)
+        if normalizado is None:
+            normalizado = self._normalizados[texto] = clave_busqueda(texto)
+        posiciones = self._posiciones.get(normalizado)
+        if posiciones is None:
+            posiciones = self._posiciones[normalizado] = array('l')
+            for trigrama in _trigramas(normalizado):
+                self._textos.setdefault(trigrama, set()).add(normalizado)
+        posiciones.append(posicion)
+
+    def quitar(self, posicion: int, texto: str) -> None:
+        """Quita la fila en la posición indicada, indexada antes con ese texto"""
+        normalizado = self._normalizados.get(texto)
+        if normalizado is None:
+            normalizado = clave_busqueda(texto)
+        posiciones = self._posiciones[normalizado]
+        posiciones.remove(posicion)
+        if not posiciones:
+            del self._posiciones[normalizado]
+            for trigrama in _trigramas(normalizado):
+                textos = self._textos[trigrama]
+                textos.discard(normalizado)
+                if not textos:
+                    del self._textos[trigrama]
+
+    def desplazar(self, desde: int) -> None:
+        """Resta uno a las posiciones mayores que desde (tras borrar esa fila)"""
+        for normalizado, posiciones in self._posiciones.items():
+            self._posiciones[normalizado] = array('l', (p - 1 if p > desde else p for p in posiciones))
+
+    def buscar(self, subcadena: str) -> Set[int]:
+        """
+        Posiciones cuyo texto contiene la subcadena (sin distinguir tildes
+        ni mayúsculas)
+        """
+        consulta = clave_busqueda(subcadena)
+        candidatos: Iterable[str]
+        if len(consulta) < 3:
+            # Consulta muy corta para tener trigramas: se revisan todos los textos
+            candidatos = self._posiciones.keys()
+        else:
+            conjuntos = sorted(
+                (self._textos.get(t, set()) for t in _trigramas(consulta)), key=len
+            )
+            if not conjuntos[0]:
+                return set()
+            candidatos = conjuntos[0].intersection(*conjuntos[1:])
+        # Los trigramas pueden coincidir en otro orden: se confirma la subcadena
+        resultado: Set[int] = set()
+        for texto in candidatos:
+            if consulta in texto:
+                resultado.update(self._posiciones[texto])
+        return resultado
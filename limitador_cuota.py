@@ -0,0 +1,88 @@
+"""
+Limitador de peticiones a la API de Google Sheets
+Token bucket ajustado a la cuota por minuto, compartido por lecturas y
+escrituras; cuando hay escrituras esperando, las lecturas ceden el turno
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+# Clases de prioridad (menor número = se atiende primero)
+ESCRITURA = 0
+LECTURA = 1
+
+class LimitadorCuota:
+    """Token bucket con prioridades y pausa global ante respuestas 429"""
+
+    def __init__(self, por_minuto: int, rafaga: int):
+        """
+        Args:
+            por_minuto: Peticiones permitidas por minuto (cuota de la API)
+            rafaga: Peticiones que pueden salir seguidas tras un periodo inactivo
+        """
+        self.tasa = por_minuto / 60.0
+        self.capacidad = float(max(1, rafaga))
+        self._fichas = self.capacidad
+        self._ultima_recarga = time.monotonic()
+        self._pausa_hasta = 0.0
+        self._esperando = {ESCRITURA: 0, LECTURA: 0}
+        self._cond = threading.Condition()
+        self._esperas = 0
+
+    def _recargar(self, ahora: float) -> None:
+        self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultima_recarga) * self.tasa)
+        self._ultima_recarga = ahora
+
+    def adquirir(self, prioridad: int = LECTURA, limite: Optional[float] = None) -> float:
+        """
+        Bloquea hasta que la petición pueda salir
+
+        Args:
+            limite: Instante (time.monotonic) después del cual ya no se espera
+
+        Returns:
+            float: Segundos esperados
+
+        Raises:
+            TimeoutError: Si se llega al límite sin obtener turno
+        """
+        inicio = time.monotonic()
+        with self._cond:
+            self._esperando[prioridad] += 1
+            try:
+                while True:
+                    ahora = time.monotonic()
+                    self._recargar(ahora)
+                    turno = all(self._esperando[p] == 0 for p in self._esperando if p < prioridad)
+                    if ahora >= self._pausa_hasta and turno and self._fichas >= 1:
+                        self._fichas -= 1
+                        break
+                    if limite is not None and ahora >= limite:
+                        raise TimeoutError('Sin turno en el limitador de cuota antes del plazo')
+                    espera = max(self._pausa_hasta - ahora, (1 - self._fichas) / self.tasa, 0.01)
+                    if limite is not None:
+                        espera = min(espera, limite - ahora)
+                    self._cond.wait(espera)
+            finally:
+                self._esperando[prioridad] -= 1
+                self._cond.notify_all()
+        esperado = time.monotonic() - inicio
+        if esperado > 0.01:
+            self._esperas += 1
+        return esperado
+
+    def pausar(self, segundos: float) -> None:
+        """Detiene todas las peticiones (la API respondió 429) y vacía el bucket"""
+        with self._cond:
+            self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + segundos)
+            self._fichas = 0.0
+            self._cond.notify_all()
+
+    def metricas(self) -> Dict:
+        with self._cond:
+            return {
+                'peticiones_demoradas': self._esperas,
+                'escrituras_en_espera': self._esperando[ESCRITURA],
+                'lecturas_en_espera': self._esperando[LECTURA]
+            }
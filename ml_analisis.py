@@ -7,15 +7,22 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
+import hashlib
+import json
 import logging
+import os
+from utils import monto_a_centavos
+from pronostico_ventas import (
+    FEATURES_PRONOSTICO, HIPERPARAMETROS_PRONOSTICO, MIN_DIAS, NIVEL_INTERVALO,
+    BACKTEST_ORIGENES, BACKTEST_PASO, BACKTEST_HORIZONTE, serie_diaria_ventas
+)
 
 # ML Libraries
 try:
-    from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
     from sklearn.cluster import KMeans
     from sklearn.preprocessing import StandardScaler
-    from sklearn.model_selection import train_test_split
-    from sklearn.metrics import mean_absolute_error, r2_score
+    import sklearn
+    import joblib
     ML_AVAILABLE = True
 except ImportError:
     ML_AVAILABLE = False
@@ -28,20 +35,42 @@ class AnalizadorFinancieroML:
     Analizador financiero con capacidades de Machine Learning
     """
     
-    def __init__(self, ruta_excel: str):
+    def __init__(self, ruta_excel: str, dir_modelos: Optional[str] = None):
         """
         Inicializa el analizador con el archivo Excel de SURTHILANAS
         
         Args:
             ruta_excel: Ruta al archivo Excel con datos financieros
+            dir_modelos: Carpeta donde se guardan los modelos entrenados
+                (None para no guardarlos)
         """
         self.ruta_excel = ruta_excel
+        self.dir_modelos = dir_modelos
         self.df_transacciones = None
         self.df_categorias = None
         self.modelo_ventas = None
+        self.metricas_modelo: Optional[Dict] = None
+        self.version_modelo: Optional[str] = None
         self.scaler = StandardScaler() if ML_AVAILABLE else None
+        # Ventas registradas desde el bot posteriores al Excel: ID -> (fecha, importe, descripción)
+        self._ventas_bot: Dict[str, Tuple[pd.Timestamp, float, str]] = {}
         self.cargar_datos()
     
+    @staticmethod
+    def _agregar_caracteristicas(df: pd.DataFrame) -> None:
+        """Agrega (en el mismo DataFrame) las columnas derivadas de la fecha y el tipo"""
+        # Crear características adicionales
+        df['Año'] = df['Fecha'].dt.year
+        df['Mes'] = df['Fecha'].dt.month
+        df['Día'] = df['Fecha'].dt.day
+        df['DiaSemana'] = df['Fecha'].dt.dayofweek
+        df['Trimestre'] = df['Fecha'].dt.quarter
+        
+        # Clasificar tipo de transacción
+        df['Tipo'] = df['Importe'].apply(
+            lambda x: 'Ingreso' if x > 0 else 'Gasto'
+        )
+    
     def cargar_datos(self):
         """Carga y procesa los datos del Excel"""
         try:
@@ -74,17 +103,11 @@ class AnalizadorFinancieroML:
                 errors='coerce'
             )
             
-            # Crear características adicionales
-            self.df_transacciones['Año'] = self.df_transacciones['Fecha'].dt.year
-            self.df_transacciones['Mes'] = self.df_transacciones['Fecha'].dt.month
-            self.df_transacciones['Día'] = self.df_transacciones['Fecha'].dt.day
-            self.df_transacciones['DiaSemana'] = self.df_transacciones['Fecha'].dt.dayofweek
-            self.df_transacciones['Trimestre'] = self.df_transacciones['Fecha'].dt.quarter
+            self._agregar_caracteristicas(self.df_transacciones)
             
-            # Clasificar tipo de transacción
-            self.df_transacciones['Tipo'] = self.df_transacciones['Importe'].apply(
-                lambda x: 'Ingreso' if x > 0 else 'Gasto'
-            )
+            # Base del Excel: las ventas registradas desde el bot se suman aparte
+            self._df_excel = self.df_transacciones
+            self.fecha_corte = self.df_transacciones['Fecha'].max()
             
             # Cargar categorías
             try:
@@ -104,6 +127,50 @@ class AnalizadorFinancieroML:
             logger.error(f"Error al cargar datos: {e}")
             raise
     
+    def incorporar_ventas(self, ventas: List[Dict]) -> int:
+        """
+        Sincroniza las ventas registradas desde el bot con los datos de entrenamiento
+        
+        Recibe todas las ventas registradas (con las claves de los encabezados
+        de la hoja); las que no son posteriores al Excel se ignoran. Aplica
+        solo la diferencia por ID: nuevas, editadas y eliminadas. El Excel no
+        se vuelve a leer.
+        
+        Returns:
+            int: Ventas agregadas, modificadas o quitadas (0 si no hubo cambios)
+        """
+        actuales = {}
+        for venta in ventas:
+            fecha = pd.to_datetime(str(venta.get('Fecha', '')), format='%d/%m/%Y', errors='coerce')
+            importe = monto_a_centavos(venta.get('Monto')) / 100
+            # Las ventas anteriores al corte ya están en el Excel
+            if pd.isna(fecha) or fecha <= self.fecha_corte or importe <= 0 or not venta.get('ID'):
+                continue
+            descripcion = f"Factura {venta.get('Número Factura', '')} - {venta.get('Cliente', '')}"
+            actuales[str(venta['ID'])] = (fecha, importe, descripcion)
+        
+        cambios = len(actuales.keys() ^ self._ventas_bot.keys()) + sum(
+            1 for id_venta, datos in actuales.items()
+            if id_venta in self._ventas_bot and self._ventas_bot[id_venta] != datos
+        )
+        if cambios == 0:
+            return 0
+        
+        self._fijar_ventas_bot(actuales)
+        logger.info(f"Ventas del bot incorporadas: {len(actuales)} ({cambios} cambios)")
+        return cambios
+    
+    def _fijar_ventas_bot(self, ventas_bot: Dict[str, Tuple[pd.Timestamp, float, str]]) -> None:
+        """Reemplaza las ventas del bot y rearma df_transacciones (Excel + bot)"""
+        self._ventas_bot = ventas_bot
+        df_bot = pd.DataFrame(
+            [('Ventas', fecha, descripcion, importe, None)
+             for fecha, importe, descripcion in ventas_bot.values()],
+            columns=['Categoría', 'Fecha', 'Descripción', 'Importe', 'Extra']
+        )
+        self._agregar_caracteristicas(df_bot)
+        self.df_transacciones = pd.concat([self._df_excel, df_bot], ignore_index=True)
+    
     # ============================================
     # ANÁLISIS DESCRIPTIVO
     # ============================================
@@ -209,157 +276,286 @@ class AnalizadorFinancieroML:
     # PREDICCIONES CON MACHINE LEARNING
     # ============================================
     
-    def entrenar_modelo_ventas(self) -> Dict:
+    def datos_entrenamiento(self) -> pd.Series:
         """
-        Entrena un modelo de ML para predecir ventas futuras
+        Serie de ingresos diarios con la que se entrena el modelo de ventas
         
-        Returns:
-            Diccionario con métricas del modelo
+        Raises:
+            ValueError: Si no hay suficientes días de datos para entrenar
         """
-        if not ML_AVAILABLE:
-            return {"error": "Scikit-learn no está instalado"}
+        serie = serie_diaria_ventas(self.df_transacciones)
+        if len(serie) < MIN_DIAS:
+            raise ValueError(f"No hay suficientes datos para entrenar (mínimo {MIN_DIAS} días de ventas)")
+        return serie
+    
+    @staticmethod
+    def clave_modelo(serie: pd.Series) -> str:
+        """
+        Huella de los datos de entrenamiento y de la configuración del modelo:
+        cambia si cambia cualquier venta, los hiperparámetros o la versión de
+        scikit-learn (un modelo guardado con otra versión no es confiable)
+        """
+        huella = hashlib.sha256()
+        huella.update(pd.util.hash_pandas_object(serie, index=True).to_numpy().tobytes())
+        huella.update(json.dumps({
+            'features': FEATURES_PRONOSTICO,
+            'hiperparametros': HIPERPARAMETROS_PRONOSTICO,
+            'backtest': [BACKTEST_ORIGENES, BACKTEST_PASO, BACKTEST_HORIZONTE, NIVEL_INTERVALO],
+            'sklearn': sklearn.__version__
+        }, sort_keys=True).encode('utf-8'))
+        return huella.hexdigest()[:16]
+    
+    def aplicar_modelo(self, modelo, metricas: Dict, clave: str) -> None:
+        """Instala un modelo ya entrenado (por ejemplo, en otro proceso)"""
+        self.modelo_ventas = modelo
+        self.metricas_modelo = metricas
+        self.version_modelo = clave
+    
+    def _ruta_modelo(self, clave: str) -> str:
+        return os.path.join(self.dir_modelos, f"ventas_{clave}.joblib")
+    
+    def cargar_modelo_guardado(self, clave: Optional[str] = None) -> bool:
+        """
+        Carga el modelo guardado para los datos actuales, si existe
+        
+        Args:
+            clave: Clave del modelo (se calcula de los datos si no se indica)
         
+        Returns:
+            bool: True si el modelo vigente corresponde a los datos actuales
+        """
+        if not ML_AVAILABLE or not self.dir_modelos:
+            return False
         try:
-            # Filtrar solo ventas/ingresos
-            df_ventas = self.df_transacciones[
-                self.df_transacciones['Importe'] > 0
-            ].copy()
-            
-            if len(df_ventas) < 20:
-                return {"error": "No hay suficientes datos para entrenar (mínimo 20 ventas)"}
-            
-            # Preparar características
-            features = ['Año', 'Mes', 'Día', 'DiaSemana', 'Trimestre']
-            X = df_ventas[features]
-            y = df_ventas['Importe']
-            
-            # Dividir datos
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y, test_size=0.2, random_state=42
-            )
-            
-            # Entrenar modelo
-            self.modelo_ventas = GradientBoostingRegressor(
-                n_estimators=100,
-                learning_rate=0.1,
-                max_depth=4,
-                random_state=42
-            )
-            
-            self.modelo_ventas.fit(X_train, y_train)
+            if clave is None:
+                clave = self.clave_modelo(self.datos_entrenamiento())
+            if self.version_modelo == clave:
+                return True
+            
+            ruta = self._ruta_modelo(clave)
+            if not os.path.exists(ruta):
+                return False
+            artefacto = joblib.load(ruta)
+            if artefacto.get('clave') != clave:
+                return False
+            
+            self.aplicar_modelo(artefacto['modelo'], artefacto['metricas'], clave)
+            logger.info(f"📦 Modelo de ventas cargado desde {ruta} (entrenado {artefacto.get('entrenado')})")
+            return True
             
-            # Evaluar
-            y_pred = self.modelo_ventas.predict(X_test)
-            mae = mean_absolute_error(y_test, y_pred)
-            r2 = r2_score(y_test, y_pred)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo cargar el modelo guardado: {e}")
+            return False
+    
+    def restaurar_modelo_guardado(self) -> bool:
+        """
+        Al iniciar: recupera las ventas del bot guardadas con el último modelo
+        y carga ese modelo si corresponde a los datos resultantes
+
+        Sin esto la clave se calcularía solo con el Excel y la primera
+        predicción reentrenaría (y borraría) el modelo vigente.
+        
+        Returns:
+            bool: True si se cargó el modelo
+        """
+        if not ML_AVAILABLE or not self.dir_modelos or not os.path.isdir(self.dir_modelos):
+            return False
+        try:
+            guardados = [
+                os.path.join(self.dir_modelos, nombre) for nombre in os.listdir(self.dir_modelos)
+                if nombre.startswith('ventas_') and nombre.endswith('.joblib')
+            ]
+            if not guardados:
+                return False
+            artefacto = joblib.load(max(guardados, key=os.path.getmtime))
+            # Si el Excel se actualizó, las ventas que ya incluye no se duplican
+            ventas_bot = {
+                id_venta: datos for id_venta, datos in artefacto.get('ventas_bot', {}).items()
+                if datos[0] > self.fecha_corte
+            }
+            if ventas_bot:
+                self._fijar_ventas_bot(ventas_bot)
+            return self.cargar_modelo_guardado()
             
-            # Importancia de características
-            importancia = dict(zip(
-                features,
-                self.modelo_ventas.feature_importances_
-            ))
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo restaurar el modelo guardado: {e}")
+            return False
+    
+    def guardar_modelo(self) -> bool:
+        """Guarda el modelo vigente y borra los de versiones anteriores de los datos"""
+        if not ML_AVAILABLE or not self.dir_modelos or self.modelo_ventas is None:
+            return False
+        try:
+            os.makedirs(self.dir_modelos, exist_ok=True)
+            ruta = self._ruta_modelo(self.version_modelo)
+            temporal = ruta + '.tmp'
+            joblib.dump({
+                'clave': self.version_modelo,
+                'modelo': self.modelo_ventas,
+                'metricas': self.metricas_modelo,
+                # Con ellas se rearman los datos del modelo al reiniciar, sin leer la hoja
+                'ventas_bot': self._ventas_bot,
+                'entrenado': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }, temporal)
+            os.replace(temporal, ruta)
+            
+            for nombre in os.listdir(self.dir_modelos):
+                anterior = os.path.join(self.dir_modelos, nombre)
+                if nombre.startswith('ventas_') and nombre.endswith('.joblib') and anterior != ruta:
+                    os.remove(anterior)
+            return True
             
-            return {
-                'mae': mae,
-                'r2': r2,
-                'precisión': f"{r2 * 100:.1f}%",
-                'error_promedio': mae,
-                'importancia_features': importancia,
-                'num_datos_entrenamiento': len(X_train),
-                'num_datos_prueba': len(X_test)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar el modelo: {e}")
+            return False
+    
+    def _predicciones_diarias(self, serie: pd.Series, fechas: pd.DatetimeIndex) -> Tuple[np.ndarray, bool]:
+        """
+        Venta total estimada para cada fecha: con el modelo (una llamada por
+        semana futura), o con el promedio diario histórico del mes si no hay modelo
+        
+        Args:
+            serie: Ingresos diarios observados (serie_diaria_ventas)
+            fechas: Días a estimar
+        
+        Returns:
+            (predicciones, usa_modelo)
+        """
+        if ML_AVAILABLE and self.modelo_ventas is not None:
+            return self.modelo_ventas.pronosticar(serie, fechas), True
+        
+        promedio_por_mes = serie.groupby(serie.index.month).mean()
+        promedio = promedio_por_mes.reindex(fechas.month).to_numpy(dtype=float)
+        return np.where(np.isnan(promedio), serie.mean(), promedio), False
+    
+    def predecir_ventas_rango(self, fecha_inicio: datetime, fecha_fin: datetime) -> Dict:
+        """
+        Predice las ventas de cada día entre dos fechas (ambas incluidas)
+        
+        Args:
+            fecha_inicio: Primer día a predecir
+            fecha_fin: Último día a predecir
+        
+        Returns:
+            Dict con el total, el promedio diario, la serie diaria y el
+            desglose por mes ('por_mes': lista de {año, mes, venta_total_predicha,
+            dias} y, si el modelo tiene intervalos calibrados, venta_minima y
+            venta_maxima con cobertura 'nivel_confianza')
+        """
+        try:
+            fechas = pd.date_range(pd.Timestamp(fecha_inicio).normalize(),
+                                   pd.Timestamp(fecha_fin).normalize(), freq='D')
+            if len(fechas) == 0:
+                return {"error": "El rango de fechas está vacío"}
+            
+            historia = serie_diaria_ventas(self.df_transacciones)
+            if len(historia) == 0:
+                return {"error": "No hay ventas registradas"}
+            
+            predicciones, usa_modelo = self._predicciones_diarias(historia, fechas)
+            serie = pd.Series(predicciones, index=fechas)
+            por_mes = serie.groupby([fechas.year, fechas.month]).agg(['sum', 'count'])
+            ultimo_dato = historia.index[-1]
+            
+            resultado = {
+                'fecha_inicio': fechas[0],
+                'fecha_fin': fechas[-1],
+                'venta_total_predicha': float(serie.sum()),
+                'venta_promedio_dia': float(serie.mean()),
+                'dias': len(fechas),
+                'prediccion_diaria': serie,
+                'por_mes': []
             }
+            for (año, mes), fila in por_mes.iterrows():
+                total = float(fila['sum'])
+                datos_mes = {'año': int(año), 'mes': int(mes),
+                             'venta_total_predicha': total, 'dias': int(fila['count'])}
+                if usa_modelo:
+                    fin_mes = min(pd.Timestamp(year=int(año), month=int(mes), day=1) + pd.offsets.MonthEnd(0),
+                                  fechas[-1])
+                    intervalo = self.modelo_ventas.intervalo(total, (fin_mes - ultimo_dato).days / 30)
+                    if intervalo is not None:
+                        datos_mes['venta_minima'], datos_mes['venta_maxima'] = intervalo
+                        datos_mes['nivel_confianza'] = NIVEL_INTERVALO
+                resultado['por_mes'].append(datos_mes)
+            if not usa_modelo:
+                resultado['metodo'] = 'promedio_histórico'
+            return resultado
             
         except Exception as e:
-            logger.error(f"Error al entrenar modelo: {e}")
+            logger.error(f"Error en predicción: {e}")
             return {"error": str(e)}
     
-    def predecir_ventas_mes(self, año: int, mes: int) -> Dict:
+    def predecir_ventas_meses(self, año: int, mes: int, meses: int = 1) -> List[Dict]:
         """
-        Predice las ventas para un mes específico
+        Predice las ventas de varios meses consecutivos a partir de un solo
+        pronóstico diario del rango completo (el modelo se consulta una vez por
+        cada semana futura, no una vez por mes)
         
         Args:
-            año: Año a predecir
-            mes: Mes a predecir (1-12)
-        """
-        if not ML_AVAILABLE or self.modelo_ventas is None:
-            # Si no hay modelo, usar promedio histórico
-            return self._predecir_con_promedio(año, mes)
+            año: Año del primer mes
+            mes: Primer mes a predecir (1-12)
+            meses: Cantidad de meses a predecir
         
+        Returns:
+            Lista con un dict por mes (mismo formato que predecir_ventas_mes)
+        """
         try:
-            # Crear features para todos los días del mes
-            import calendar
-            dias_mes = calendar.monthrange(año, mes)[1]
+            inicio = pd.Timestamp(year=año, month=mes, day=1)
+            fin = inicio + pd.offsets.MonthEnd(meses)
+            rango = self.predecir_ventas_rango(inicio, fin)
+            if 'error' in rango:
+                return [rango]
+            
+            if rango.get('metodo') == 'promedio_histórico':
+                return [
+                    {
+                        'año': m['año'],
+                        'mes': m['mes'],
+                        'venta_total_predicha': m['venta_total_predicha'],
+                        'venta_promedio_dia': m['venta_total_predicha'] / m['dias'],
+                        'dias_mes': m['dias'],
+                        'metodo': 'promedio_histórico',
+                        'nota': 'Predicción basada en promedio histórico (modelo ML no disponible)'
+                    }
+                    for m in rango['por_mes']
+                ]
+            
+            # Comparar con histórico: total promedio del mismo mes en los años con datos
+            historia = serie_diaria_ventas(self.df_transacciones)
+            totales_mensuales = historia.groupby([historia.index.year, historia.index.month]).sum()
+            historico_por_mes = totales_mensuales.groupby(level=1).mean()
             
             predicciones = []
-            for dia in range(1, dias_mes + 1):
-                fecha = datetime(año, mes, dia)
-                trimestre = (mes - 1) // 3 + 1
-                dia_semana = fecha.weekday()
-                
-                features = pd.DataFrame([{
-                    'Año': año,
-                    'Mes': mes,
-                    'Día': dia,
-                    'DiaSemana': dia_semana,
-                    'Trimestre': trimestre
-                }])
-                
-                pred = self.modelo_ventas.predict(features)[0]
-                predicciones.append(pred)
-            
-            venta_total_predicha = sum(predicciones)
-            venta_promedio_dia = np.mean(predicciones)
-            
-            # Comparar con histórico
-            historico_mes = self.df_transacciones[
-                (self.df_transacciones['Mes'] == mes) &
-                (self.df_transacciones['Importe'] > 0)
-            ]['Importe'].sum()
-            
-            return {
-                'año': año,
-                'mes': mes,
-                'venta_total_predicha': venta_total_predicha,
-                'venta_promedio_dia': venta_promedio_dia,
-                'dias_mes': dias_mes,
-                'historico_mismo_mes': historico_mes,
-                'diferencia_vs_historico': venta_total_predicha - historico_mes,
-                'variacion_porcentual': ((venta_total_predicha - historico_mes) / historico_mes * 100) if historico_mes > 0 else 0
-            }
+            for m in rango['por_mes']:
+                venta_total_predicha = m['venta_total_predicha']
+                historico_mes = float(historico_por_mes.get(m['mes'], 0))
+                predicciones.append({
+                    'año': m['año'],
+                    'mes': m['mes'],
+                    'venta_total_predicha': venta_total_predicha,
+                    'venta_promedio_dia': venta_total_predicha / m['dias'],
+                    'dias_mes': m['dias'],
+                    'historico_mismo_mes': historico_mes,
+                    'diferencia_vs_historico': venta_total_predicha - historico_mes,
+                    'variacion_porcentual': ((venta_total_predicha - historico_mes) / historico_mes * 100) if historico_mes > 0 else 0,
+                    **{clave: m[clave] for clave in ('venta_minima', 'venta_maxima', 'nivel_confianza') if clave in m}
+                })
+            return predicciones
             
         except Exception as e:
             logger.error(f"Error en predicción: {e}")
-            return {"error": str(e)}
+            return [{"error": str(e)}]
     
-    def _predecir_con_promedio(self, año: int, mes: int) -> Dict:
-        """Predicción simple basada en promedios históricos"""
-        # Calcular promedio del mismo mes en años anteriores
-        df_mes = self.df_transacciones[
-            (self.df_transacciones['Mes'] == mes) &
-            (self.df_transacciones['Importe'] > 0)
-        ]
-        
-        if len(df_mes) == 0:
-            # Usar promedio general
-            promedio = self.df_transacciones[
-                self.df_transacciones['Importe'] > 0
-            ]['Importe'].mean()
-        else:
-            promedio = df_mes['Importe'].mean()
-        
-        import calendar
-        dias_mes = calendar.monthrange(año, mes)[1]
-        venta_predicha = promedio * dias_mes
+    def predecir_ventas_mes(self, año: int, mes: int) -> Dict:
+        """
+        Predice las ventas para un mes específico
         
-        return {
-            'año': año,
-            'mes': mes,
-            'venta_total_predicha': venta_predicha,
-            'venta_promedio_dia': promedio,
-            'dias_mes': dias_mes,
-            'metodo': 'promedio_histórico',
-            'nota': 'Predicción basada en promedio histórico (modelo ML no disponible)'
-        }
+        Args:
+            año: Año a predecir
+            mes: Mes a predecir (1-12)
+        """
+        return self.predecir_ventas_meses(año, mes, 1)[0]
     
     # ============================================
     # CLUSTERING Y SEGMENTACIÓN
@@ -572,6 +768,9 @@ class AnalizadorFinancieroML:
         texto += "━━━━━━━━━━━━━━━━━━━━\n\n"
         texto += f"💰 <b>Venta Total Estimada:</b> ${pred['venta_total_predicha']:,.0f}\n"
         texto += f"📊 <b>Venta Promedio/Día:</b> ${pred['venta_promedio_dia']:,.0f}\n"
+        if 'venta_minima' in pred:
+            texto += (f"🎯 <b>Rango probable ({pred['nivel_confianza']:.0%}):</b> "
+                      f"${pred['venta_minima']:,.0f} - ${pred['venta_maxima']:,.0f}\n")
         texto += f"📅 <b>Días del mes:</b> {pred['dias_mes']}\n\n"
         
         if 'historico_mismo_mes' in pred and pred['historico_mismo_mes'] > 0:
@@ -0,0 +1,228 @@
+"""
+Pronóstico de ventas sobre la serie de ingresos diarios
+El modelo aprende el total vendido por día (no el monto de cada transacción)
+con rezagos y promedios móviles de la propia serie; una validación con
+orígenes móviles (backtesting) calibra los intervalos de los totales mensuales
+"""
+
+import math
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional, Tuple
+
+# ml_analisis verifica ML_AVAILABLE antes de entrenar
+try:
+    from sklearn.ensemble import GradientBoostingRegressor
+    from sklearn.metrics import mean_absolute_error, r2_score
+except ImportError:
+    pass
+
+# Todas las características de un día dependen de la serie hasta 7 días
+# antes: una semana completa se predice con una sola llamada al modelo
+REZAGO_MINIMO = 7
+FEATURES_PRONOSTICO = ['DiaSemana', 'Día', 'Mes', 'Rezago7', 'Rezago14', 'Rezago28',
+                       'Media7', 'Media28', 'MediaDiaSemana']
+# Días de historia que necesitan las características del primer día entrenable
+HISTORIA_FEATURES = REZAGO_MINIMO + 27
+HIPERPARAMETROS_PRONOSTICO = {
+    'n_estimators': 100,
+    'learning_rate': 0.1,
+    'max_depth': 4,
+    'random_state': 42
+}
+# Mínimo de días (con o sin ventas) para entrenar
+MIN_DIAS = 60
+
+# Backtesting: orígenes cada PASO días hacia atrás, HORIZONTE días predichos en cada uno
+BACKTEST_ORIGENES = 12
+BACKTEST_PASO = 14
+BACKTEST_HORIZONTE = 30
+# Cobertura de los intervalos de los totales mensuales
+NIVEL_INTERVALO = 0.8
+
+def serie_diaria_ventas(df_transacciones: pd.DataFrame) -> pd.Series:
+    """
+    Ingresos totales por día, con 0 en los días sin ventas
+
+    Returns:
+        Serie indexada por fecha (un valor por día, sin huecos)
+    """
+    ventas = df_transacciones[(df_transacciones['Importe'] > 0) & df_transacciones['Fecha'].notna()]
+    if len(ventas) == 0:
+        return pd.Series(dtype=float)
+    diaria = ventas.groupby(ventas['Fecha'].dt.normalize())['Importe'].sum()
+    dias = pd.date_range(diaria.index.min(), diaria.index.max(), freq='D')
+    return diaria.reindex(dias, fill_value=0.0).astype(float)
+
+def _caracteristicas(valores: np.ndarray, fechas: pd.DatetimeIndex,
+                     posiciones: np.ndarray) -> np.ndarray:
+    """
+    Matriz de características de los días en 'posiciones'
+
+    Args:
+        valores: Venta de cada día de 'fechas' (solo se leen los días
+            anteriores a cada posición en REZAGO_MINIMO o más)
+        fechas: Fechas de todos los días de 'valores'
+        posiciones: Días a describir (>= HISTORIA_FEATURES)
+    """
+    # acumulada[i] = suma de valores[:i]
+    acumulada = np.concatenate(([0.0], np.cumsum(valores)))
+    p = posiciones
+    hasta = p - REZAGO_MINIMO + 1
+    dias = fechas[p]
+    return np.column_stack([
+        dias.dayofweek,
+        dias.day,
+        dias.month,
+        valores[p - 7],
+        valores[p - 14],
+        valores[p - 28],
+        (acumulada[hasta] - acumulada[hasta - 7]) / 7,
+        (acumulada[hasta] - acumulada[hasta - 28]) / 28,
+        (valores[p - 7] + valores[p - 14] + valores[p - 21] + valores[p - 28]) / 4
+    ])
+
+class PronosticadorVentas:
+    """Modelo de la venta diaria con intervalos calibrados para totales mensuales"""
+
+    def __init__(self):
+        self.modelo = None
+        # Errores relativos (real / predicho - 1) de los totales del backtest
+        self.cuantil_inferior: Optional[float] = None
+        self.cuantil_superior: Optional[float] = None
+
+    def ajustar(self, serie: pd.Series) -> 'PronosticadorVentas':
+        """Entrena con todos los días de la serie que tienen historia suficiente"""
+        valores = serie.to_numpy(dtype=float)
+        posiciones = np.arange(HISTORIA_FEATURES, len(valores))
+        self.modelo = GradientBoostingRegressor(**HIPERPARAMETROS_PRONOSTICO)
+        self.modelo.fit(_caracteristicas(valores, serie.index, posiciones), valores[posiciones])
+        return self
+
+    def pronosticar(self, serie: pd.Series, fechas: pd.DatetimeIndex) -> np.ndarray:
+        """
+        Venta estimada para cada fecha
+
+        Los días posteriores a la serie se predicen por semanas: cada bloque
+        de 7 días usa como historia las predicciones de los bloques anteriores.
+        Los días dentro de la serie se estiman con su historia real.
+        """
+        inicio = serie.index[0]
+        fin = max(serie.index[-1], fechas.max())
+        todas = pd.date_range(inicio, fin, freq='D')
+        valores = np.full(len(todas), np.nan)
+        valores[:len(serie)] = serie.to_numpy(dtype=float)
+
+        for bloque in range(len(serie), len(todas), REZAGO_MINIMO):
+            posiciones = np.arange(bloque, min(bloque + REZAGO_MINIMO, len(todas)))
+            # Las ventas no son negativas aunque el modelo extrapole por debajo de 0
+            valores[posiciones] = np.maximum(
+                self.modelo.predict(_caracteristicas(valores, todas, posiciones)), 0.0)
+
+        posiciones = (fechas - inicio).days.to_numpy()
+        resultado = np.empty(len(fechas))
+        futuras = posiciones >= len(serie)
+        resultado[futuras] = valores[posiciones[futuras]]
+
+        # Días ya ocurridos: una sola llamada con su historia real
+        pasadas = np.flatnonzero(~futuras & (posiciones >= HISTORIA_FEATURES))
+        if len(pasadas):
+            resultado[pasadas] = np.maximum(self.modelo.predict(
+                _caracteristicas(valores, todas, posiciones[pasadas])), 0.0)
+        sin_historia = ~futuras & (posiciones < HISTORIA_FEATURES)
+        resultado[sin_historia] = serie.iloc[:HISTORIA_FEATURES].mean()
+        return resultado
+
+    def intervalo(self, total: float, meses_adelante: float) -> Optional[Tuple[float, float]]:
+        """
+        Rango probable (NIVEL_INTERVALO) de un total mensual predicho
+
+        Los errores se midieron a HORIZONTE días; más lejos se amplían con la
+        raíz de la distancia, como si cada mes sumara un error independiente
+
+        Args:
+            total: Total predicho
+            meses_adelante: Distancia (en meses de 30 días) desde el último dato
+        """
+        if self.cuantil_inferior is None:
+            return None
+        escala = math.sqrt(max(1.0, meses_adelante))
+        return (max(0.0, total * (1 + self.cuantil_inferior * escala)),
+                total * (1 + self.cuantil_superior * escala))
+
+    def calibrar(self, errores_relativos: np.ndarray) -> None:
+        """Fija los cuantiles de error de los intervalos a partir del backtest"""
+        alfa = (1 - NIVEL_INTERVALO) / 2
+        self.cuantil_inferior = max(-1.0, float(np.quantile(errores_relativos, alfa)))
+        self.cuantil_superior = float(np.quantile(errores_relativos, 1 - alfa))
+
+def backtest(serie: pd.Series, origenes: int = BACKTEST_ORIGENES,
+             paso: int = BACKTEST_PASO, horizonte: int = BACKTEST_HORIZONTE) -> Dict:
+    """
+    Validación con orígenes móviles: en cada origen entrena solo con los días
+    anteriores y predice los 'horizonte' días siguientes, como en producción
+
+    Returns:
+        Dict con los valores reales y predichos de cada día evaluado y los
+        totales de cada horizonte (listas vacías si no alcanzan los datos)
+    """
+    reales, predichos, totales_reales, totales_predichos = [], [], [], []
+    for i in range(origenes):
+        origen = len(serie) - horizonte - i * paso
+        if origen < MIN_DIAS:
+            break
+        entrenamiento = serie.iloc[:origen]
+        prueba = serie.iloc[origen:origen + horizonte]
+        prediccion = PronosticadorVentas().ajustar(entrenamiento).pronosticar(entrenamiento, prueba.index)
+        reales.append(prueba.to_numpy())
+        predichos.append(prediccion)
+        totales_reales.append(prueba.sum())
+        totales_predichos.append(prediccion.sum())
+
+    return {
+        'reales': np.concatenate(reales) if reales else np.array([]),
+        'predichos': np.concatenate(predichos) if predichos else np.array([]),
+        'totales_reales': np.array(totales_reales),
+        'totales_predichos': np.array(totales_predichos)
+    }
+
+def entrenar_pronosticador(serie: pd.Series) -> Tuple[PronosticadorVentas, Dict]:
+    """
+    Evalúa el modelo con backtesting, calibra sus intervalos y lo entrena
+    con toda la serie
+
+    Función de módulo (sin estado) para poder ejecutarla en otro proceso
+
+    Returns:
+        (pronosticador, métricas)
+    """
+    evaluacion = backtest(serie)
+    pronosticador = PronosticadorVentas().ajustar(serie)
+
+    metricas = {
+        'num_datos_entrenamiento': len(serie) - HISTORIA_FEATURES,
+        'num_datos_prueba': len(evaluacion['reales']),
+        'origenes_backtest': len(evaluacion['totales_reales']),
+        'importancia_features': dict(zip(FEATURES_PRONOSTICO, pronosticador.modelo.feature_importances_))
+    }
+    if len(evaluacion['reales']) == 0:
+        metricas.update({'mae': None, 'r2': None, 'precisión': 'sin backtest',
+                         'error_promedio': None, 'error_mensual': None})
+        return pronosticador, metricas
+
+    mae = mean_absolute_error(evaluacion['reales'], evaluacion['predichos'])
+    r2 = r2_score(evaluacion['reales'], evaluacion['predichos'])
+    validos = evaluacion['totales_predichos'] > 0
+    errores = evaluacion['totales_reales'][validos] / evaluacion['totales_predichos'][validos] - 1
+    if len(errores) >= 2:
+        pronosticador.calibrar(errores)
+
+    metricas.update({
+        'mae': mae,
+        'r2': r2,
+        'precisión': f"{r2 * 100:.1f}%",
+        'error_promedio': mae,
+        # Error relativo medio del total de HORIZONTE días
+        'error_mensual': float(np.mean(np.abs(errores))) if len(errores) else None
+    })
+    return pronosticador, metricas
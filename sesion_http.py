@@ -0,0 +1,176 @@
+"""
+Sesión HTTP compartida para Google Sheets
+Una sola AuthorizedSession con pool de conexiones keep-alive; el token OAuth
+se renueva en segundo plano antes de vencer para que ninguna operación del
+usuario pague la renovación. Cada petición pasa por el limitador de cuota y
+se reintenta con espera exponencial si la API responde 429 o 5xx.
+"""
+
+import random
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from google.auth.transport.requests import AuthorizedSession, Request
+from requests.adapters import HTTPAdapter
+from requests.exceptions import Timeout
+from limitador_cuota import LimitadorCuota, ESCRITURA, LECTURA
+
+logger = logging.getLogger(__name__)
+
+class SesionLimitada(AuthorizedSession):
+    """AuthorizedSession que respeta la cuota y reintenta respuestas 429/5xx"""
+
+    def __init__(self, credenciales, limitador: LimitadorCuota,
+                 max_reintentos: int, espera_maxima: float = 32.0,
+                 plazo: Optional[float] = None):
+        """
+        Args:
+            plazo: Segundos que puede tomar una petición en total (esperas de
+                cuota, reintentos y la respuesta); al agotarse se entrega la
+                última respuesta recibida en lugar de seguir reintentando
+        """
+        super().__init__(credenciales)
+        self.limitador = limitador
+        self.max_reintentos = max_reintentos
+        self.espera_maxima = espera_maxima
+        self.plazo = plazo
+        self.reintentos = 0
+        self.respuestas_429 = 0
+
+    def request(self, method, url, *args, **kwargs):
+        # Las lecturas (GET) ceden el turno a las escrituras
+        prioridad = LECTURA if method.upper() == 'GET' else ESCRITURA
+        limite = time.monotonic() + self.plazo if self.plazo else None
+        intento = 0
+        respuesta = None
+        while True:
+            try:
+                self.limitador.adquirir(prioridad, limite)
+            except TimeoutError:
+                if respuesta is None:
+                    raise Timeout(f"Plazo de {self.plazo:g}s agotado esperando cuota de Google Sheets")
+                logger.warning(f"⏳ Google Sheets respondió {estado}; sin cuota para reintentar a tiempo")
+                return respuesta
+            if limite is not None:
+                # Cada intento espera la respuesta solo lo que queda del plazo
+                restante = max(1.0, limite - time.monotonic())
+                kwargs['timeout'] = min(kwargs.get('timeout') or restante, restante)
+            respuesta = super().request(method, url, *args, **kwargs)
+            estado = respuesta.status_code
+            # Un 5xx en una escritura pudo haberse aplicado: no se repite aquí
+            # (la cola de escritura reintenta verificando los IDs)
+            reintentable = estado == 429 or (estado >= 500 and prioridad == LECTURA)
+            if not reintentable or intento >= self.max_reintentos:
+                return respuesta
+
+            espera = min(self.espera_maxima, 2 ** intento) * random.uniform(0.5, 1.0)
+            try:
+                espera = max(espera, float(respuesta.headers.get('Retry-After', 0)))
+            except ValueError:
+                pass
+            if estado == 429:
+                self.respuestas_429 += 1
+                self.limitador.pausar(espera)
+            if limite is not None and time.monotonic() + espera >= limite:
+                logger.warning(f"⏳ Google Sheets respondió {estado}; sin tiempo para reintentar")
+                return respuesta
+            self.reintentos += 1
+            intento += 1
+            logger.warning(f"⏳ Google Sheets respondió {estado}, reintento {intento} en {espera:.1f}s")
+            time.sleep(espera)
+
+class SesionSheets:
+    """AuthorizedSession con pool de conexiones y renovación anticipada del token"""
+
+    def __init__(self, credenciales, tamano_pool: int, margen_renovacion: float,
+                 limitador: LimitadorCuota, max_reintentos: int,
+                 plazo: Optional[float] = None):
+        """
+        Args:
+            credenciales: Credenciales de la Service Account
+            tamano_pool: Conexiones keep-alive que se mantienen abiertas por host
+            margen_renovacion: Segundos antes del vencimiento en que se renueva el token
+            limitador: Limitador de cuota compartido por todas las peticiones
+            max_reintentos: Reintentos ante respuestas 429/5xx
+            plazo: Tope en segundos de cada petición, reintentos incluidos
+        """
+        self.credenciales = credenciales
+        self.margen = margen_renovacion
+        self.limitador = limitador
+        self.session = SesionLimitada(credenciales, limitador, max_reintentos, plazo=plazo)
+        self._adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=tamano_pool)
+        self.session.mount('https://', self._adaptador)
+        self._auth_request = Request()
+        self._lock = threading.Lock()
+        self._renovaciones = 0
+        self._renovaciones_fallidas = 0
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def iniciar(self) -> None:
+        """Arranca el hilo que mantiene el token vigente"""
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name='renovar-token', daemon=True)
+            self._hilo.start()
+
+    def detener(self) -> None:
+        """Detiene la renovación del token y cierra las conexiones del pool"""
+        self._detener.set()
+        self.session.close()
+
+    def _segundos_para_vencer(self) -> float:
+        """Segundos de vigencia que le quedan al token (0 si no hay token)"""
+        expiry = getattr(self.credenciales, 'expiry', None)
+        if not getattr(self.credenciales, 'token', None) or expiry is None:
+            return 0.0
+        # google-auth guarda expiry como datetime UTC sin zona horaria
+        ahora = datetime.now(timezone.utc).replace(tzinfo=None)
+        return (expiry - ahora).total_seconds()
+
+    def renovar_si_necesario(self) -> None:
+        """Renueva el token si vence dentro del margen configurado"""
+        if self._segundos_para_vencer() > self.margen:
+            return
+        with self._lock:
+            if self._segundos_para_vencer() > self.margen:
+                return
+            self.credenciales.refresh(self._auth_request)
+            self._renovaciones += 1
+            logger.debug("🔑 Token de Google renovado en segundo plano")
+
+    def _bucle(self) -> None:
+        espera = 0.0
+        while not self._detener.wait(espera):
+            try:
+                self.renovar_si_necesario()
+                espera = max(5.0, self._segundos_para_vencer() - self.margen)
+            except Exception as e:
+                self._renovaciones_fallidas += 1
+                logger.warning(f"⚠️ No se pudo renovar el token de Google: {e}")
+                espera = 30.0
+
+    def metricas(self) -> Dict:
+        """
+        Uso del pool: peticiones enviadas, conexiones nuevas (handshakes TLS)
+        y fracción de peticiones que reutilizaron una conexión abierta
+        """
+        peticiones = conexiones = 0
+        pools = self._adaptador.poolmanager.pools
+        for clave in list(pools.keys()):
+            pool = pools.get(clave)
+            if pool is not None:
+                peticiones += pool.num_requests
+                conexiones += pool.num_connections
+        return {
+            'peticiones': peticiones,
+            'conexiones_nuevas': conexiones,
+            'reutilizacion': (1 - conexiones / peticiones) if peticiones else 0.0,
+            'renovaciones_token': self._renovaciones,
+            'renovaciones_fallidas': self._renovaciones_fallidas,
+            'token_vence_en': round(self._segundos_para_vencer()),
+            'reintentos': self.session.reintentos,
+            'respuestas_429': self.session.respuestas_429,
+            **self.limitador.metricas()
+        }
@@ -0,0 +1,139 @@
+"""
+Fachada asíncrona sobre el almacenamiento configurado
+Ejecuta las llamadas (gspread o SQLite) en un pool de hilos acotado para no
+bloquear el event loop del bot, aplicando un tiempo máximo por llamada.
+El nombre del módulo y de la instancia sheets_async es histórico (de cuando
+Google Sheets era el único almacenamiento); los tiempos se siguen
+configurando con SHEETS_MAX_WORKERS y SHEETS_TIMEOUT.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional
+from config import Config
+from almacenamiento import Almacenamiento
+from almacenamiento_sqlite import AlmacenamientoSQLite
+from google_sheets import sheets_manager
+
+logger = logging.getLogger(__name__)
+
+class AlmacenamientoOcupado(Exception):
+    """El almacenamiento no respondió dentro de Config.SHEETS_TIMEOUT"""
+
+    def __init__(self, metodo: str):
+        super().__init__(f"Tiempo agotado en {metodo}")
+        self.metodo = metodo
+
+class AlmacenamientoAsync:
+    """Versión awaitable de las operaciones de un Almacenamiento"""
+
+    def __init__(self, manager: Almacenamiento,
+                 max_workers: int = Config.SHEETS_MAX_WORKERS,
+                 timeout: float = Config.SHEETS_TIMEOUT):
+        self.manager = manager
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='almacenamiento'
+        )
+
+    @property
+    def listo(self) -> bool:
+        """Indica si el almacenamiento ya tiene el historial completo"""
+        return self.manager.listo
+
+    async def _ejecutar(self, metodo: str, *args, **kwargs) -> Any:
+        """
+        Ejecuta un método del manager en el pool de hilos
+
+        Args:
+            metodo: Nombre del método del almacenamiento
+
+        Raises:
+            AlmacenamientoOcupado: Si se agota el tiempo de espera
+        """
+        loop = asyncio.get_running_loop()
+        llamada = partial(getattr(self.manager, metodo), *args, **kwargs)
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, llamada),
+                timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            # El hilo no se puede interrumpir: la operación puede completarse luego
+            logger.error(f"⏱️ Tiempo agotado ({self.timeout:.0f}s) en {metodo}")
+            # Un valor por defecto se mostraría como dato real ($0, "no encontrada")
+            raise AlmacenamientoOcupado(metodo)
+
+    async def registrar_venta(self, venta: Dict) -> bool:
+        return await self._ejecutar('registrar_venta', venta)
+
+    async def registrar_gasto(self, gasto: Dict) -> bool:
+        return await self._ejecutar('registrar_gasto', gasto)
+
+    async def registrar_cierre_diario(self, cierre: Dict) -> bool:
+        return await self._ejecutar('registrar_cierre_diario', cierre)
+
+    async def obtener_ventas(self, fecha_inicio: Optional[str] = None,
+                             fecha_fin: Optional[str] = None) -> List[Dict]:
+        return await self._ejecutar('obtener_ventas', fecha_inicio, fecha_fin)
+
+    async def obtener_gastos(self, fecha_inicio: Optional[str] = None,
+                             fecha_fin: Optional[str] = None) -> List[Dict]:
+        return await self._ejecutar('obtener_gastos', fecha_inicio, fecha_fin)
+
+    async def registros_completos(self, tipo: str) -> List[Dict]:
+        """Todos los registros; propaga los errores del almacenamiento"""
+        return await self._ejecutar('registros_completos', tipo)
+
+    async def calcular_totales(self, fecha_inicio: Optional[str] = None,
+                               fecha_fin: Optional[str] = None) -> Dict:
+        return await self._ejecutar('calcular_totales', fecha_inicio, fecha_fin)
+
+    async def buscar_venta_por_factura(self, numero_factura: str) -> Optional[Dict]:
+        return await self._ejecutar('buscar_venta_por_factura', numero_factura)
+
+    async def existe_factura(self, numero_factura: str) -> bool:
+        return await self._ejecutar('existe_factura', numero_factura)
+
+    async def buscar_gasto_por_criterio(self, categoria: str = None,
+                                        proveedor: str = None,
+                                        fecha: str = None) -> List[Dict]:
+        return await self._ejecutar('buscar_gasto_por_criterio', categoria, proveedor, fecha)
+
+    async def pendientes_de_sincronizar(self) -> Dict:
+        return await self._ejecutar('pendientes_de_sincronizar')
+
+    async def buscar_gastos_pagina(self, categoria: str = None, proveedor: str = None,
+                                   fecha: str = None, cursor=None, tamano: int = 10) -> Dict:
+        return await self._ejecutar('buscar_gastos_pagina', categoria, proveedor, fecha,
+                                    cursor, tamano)
+
+    async def obtener_ultimo_registro(self, tipo: str) -> Optional[Dict]:
+        return await self._ejecutar('obtener_ultimo_registro', tipo)
+
+    async def editar_venta(self, id_registro: str, venta: Dict) -> bool:
+        return await self._ejecutar('editar_venta', id_registro, venta)
+
+    async def editar_gasto(self, id_registro: str, gasto: Dict) -> bool:
+        return await self._ejecutar('editar_gasto', id_registro, gasto)
+
+    async def eliminar_registro(self, id_registro: str, tipo: str) -> bool:
+        return await self._ejecutar('eliminar_registro', id_registro, tipo)
+
+    def cerrar(self) -> None:
+        """Cierra el almacenamiento y el pool de hilos (al apagar el bot)"""
+        self.manager.cerrar()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def crear_almacenamiento() -> Almacenamiento:
+    """Almacenamiento según Config.ALMACENAMIENTO ('sheets' o 'sqlite')"""
+    if Config.ALMACENAMIENTO != 'sqlite':
+        return sheets_manager
+    # Opcional: SQLite es la base principal y Google Sheets recibe una copia de cada cambio
+    return AlmacenamientoSQLite(Config.SQLITE_DB, espejo=sheets_manager)
+
+# Instancia global
+sheets_async = AlmacenamientoAsync(crear_almacenamiento())
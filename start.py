@@ -159,7 +159,12 @@ def test_google_connection():
     
     try:
         from google_sheets import sheets_manager
+        sheets_manager.conectar()
         print("✅ Conexión a Google Sheets exitosa")
+        metricas = sheets_manager.metricas_conexion()
+        print(f"   Token vigente por {metricas.get('token_vence_en', 0)}s, "
+              f"{metricas.get('peticiones', 0)} peticiones en "
+              f"{metricas.get('conexiones_nuevas', 0)} conexiones")
         return True
     except Exception as e:
         print(f"❌ Error al conectar con Google Sheets: {e}")
@@ -0,0 +1,43 @@
+"""Totales por rango de días con sumas prefijas"""
+
+import random
+
+from agregados_diarios import AgregadosDiarios
+
+
+def _resumen_directo(registros, inicio, fin):
+    """Mismo resumen recorriendo todos los registros"""
+    total, conteo, por = 0, 0, {}
+    for dia, centavos, medio in registros:
+        if dia is None or ((inicio is None or dia >= inicio) and (fin is None or dia <= fin)):
+            total += centavos
+            conteo += 1
+            por[medio] = por.get(medio, 0) + centavos
+    return {'total': total, 'conteo': conteo, 'por': {'Medio de Pago': por}}
+
+
+def test_resumen_por_rango_coincide_con_la_suma_directa():
+    azar = random.Random(3)
+    registros = [(azar.choice([None] + list(range(100, 130))), azar.randint(1, 10 ** 7),
+                  azar.choice(['Efectivo', 'Nequi', 'Tarjeta'])) for _ in range(500)]
+    agregados = AgregadosDiarios(['Medio de Pago'])
+    for dia, centavos, medio in registros:
+        agregados.agregar(dia, centavos, {'Medio de Pago': medio})
+
+    for inicio, fin in ((None, None), (100, 100), (105, 117), (90, 104), (125, None), (131, 140), (120, 110)):
+        assert agregados.resumen(inicio, fin) == _resumen_directo(registros, inicio, fin)
+
+
+def test_los_prefijos_se_recalculan_tras_agregar_y_quitar():
+    agregados = AgregadosDiarios(['Medio de Pago'])
+    agregados.agregar(10, 500, {'Medio de Pago': 'Efectivo'})
+    assert agregados.resumen(1, 20)['total'] == 500
+
+    agregados.agregar(12, 250, {'Medio de Pago': 'Nequi'})
+    assert agregados.resumen(1, 20) == {'total': 750, 'conteo': 2,
+                                        'por': {'Medio de Pago': {'Efectivo': 500, 'Nequi': 250}}}
+
+    agregados.quitar(10, 500, {'Medio de Pago': 'Efectivo'})
+    # Un valor sin registros en el rango no aparece en el desglose
+    assert agregados.resumen(1, 20) == {'total': 250, 'conteo': 1,
+                                        'por': {'Medio de Pago': {'Nequi': 250}}}
@@ -0,0 +1,124 @@
+"""Base SQLite: migración de montos en pesos e importación del historial de Google Sheets"""
+
+import sqlite3
+import time
+
+from almacenamiento_sqlite import AlmacenamientoSQLite
+
+ESQUEMA_PESOS = """
+CREATE TABLE ventas (
+    id TEXT PRIMARY KEY, fecha TEXT NOT NULL, fecha_ord INTEGER,
+    numero_factura TEXT NOT NULL, cliente TEXT, monto REAL NOT NULL,
+    medio_pago TEXT, observaciones TEXT, timestamp TEXT
+);
+CREATE TABLE gastos (
+    id TEXT PRIMARY KEY, fecha TEXT NOT NULL, fecha_ord INTEGER,
+    categoria TEXT NOT NULL, proveedor TEXT, proveedor_norm TEXT,
+    monto REAL NOT NULL, medio_pago TEXT, observaciones TEXT, timestamp TEXT
+);
+CREATE INDEX ix_gastos_categoria ON gastos(categoria COLLATE NOCASE);
+CREATE TABLE cierres (
+    id TEXT PRIMARY KEY, fecha TEXT NOT NULL,
+    efectivo REAL, transferencia REAL, tarjeta_debito REAL,
+    tarjeta_credito REAL, otro REAL, total REAL,
+    observaciones TEXT, timestamp TEXT
+);
+CREATE TABLE meta (clave TEXT PRIMARY KEY, valor TEXT);
+"""
+
+
+def _base_en_pesos(ruta):
+    conn = sqlite3.connect(ruta)
+    conn.executescript(ESQUEMA_PESOS)
+    conn.execute("INSERT INTO ventas VALUES ('v1', '01/01/2025', NULL, 'F1', '-', 12500.5, 'Efectivo', '-', 't')")
+    conn.execute("INSERT INTO gastos VALUES ('g1', '01/01/2025', NULL, 'Papelería', 'Éxito', 'exito', "
+                 "3000.25, 'Nequi', '-', 't')")
+    conn.execute("INSERT INTO cierres VALUES ('c1', '01/01/2025', 100.1, 200, 0, 0, 0, 300.1, '-', 't')")
+    conn.commit()
+    conn.close()
+
+
+def test_montos_en_pesos_pasan_a_centavos(tmp_path):
+    ruta = str(tmp_path / 'pesos.db')
+    _base_en_pesos(ruta)
+
+    base = AlmacenamientoSQLite(ruta)
+
+    assert base.buscar_venta_por_factura('F1')['monto'] == 1250050
+    assert base.calcular_totales()['total_gastos'] == 300025
+    cierre = base._consultar('SELECT efectivo, transferencia, total FROM cierres')[0]
+    assert [int(v) for v in cierre] == [10010, 20000, 30010]
+
+
+def test_migracion_se_aplica_una_sola_vez(tmp_path):
+    ruta = str(tmp_path / 'pesos.db')
+    _base_en_pesos(ruta)
+
+    AlmacenamientoSQLite(ruta)._conn.close()
+    base = AlmacenamientoSQLite(ruta)
+
+    assert base.buscar_venta_por_factura('F1')['monto'] == 1250050
+
+
+def test_categorias_se_buscan_sin_tildes_tras_migrar(tmp_path):
+    ruta = str(tmp_path / 'pesos.db')
+    _base_en_pesos(ruta)
+
+    base = AlmacenamientoSQLite(ruta)
+
+    assert [g['id'] for g in base.buscar_gasto_por_criterio(categoria='papeleria')] == ['g1']
+
+
+def _venta_hoja(id_registro, factura, monto=1000):
+    return {'Fecha': '01/01/2025', 'Número Factura': factura, 'Cliente': '-', 'Monto': monto,
+            'Medio de Pago': 'Efectivo', 'Observaciones': '-', 'Timestamp': 't', 'ID': id_registro}
+
+
+class EspejoFalso:
+    """GoogleSheetsManager mínimo: ventas en memoria y fallos de conexión al inicio"""
+
+    def __init__(self, ventas, fallos=0):
+        self.ventas = ventas
+        self.fallos = fallos
+
+    def conectar(self):
+        if self.fallos:
+            self.fallos -= 1
+            raise ConnectionError('Google Sheets no responde')
+
+    def registros_completos(self, tipo):
+        return [dict(v) for v in self.ventas] if tipo == 'venta' else []
+
+    def existe_factura(self, numero_factura):
+        return any(v['Número Factura'] == numero_factura for v in self.ventas)
+
+    def registrar_venta(self, venta):
+        self.ventas.append(_venta_hoja(venta['id'], venta['numero_factura'], venta['monto'] / 100))
+        return True
+
+    def eliminar_registro(self, id_registro, tipo):
+        antes = len(self.ventas)
+        self.ventas = [v for v in self.ventas if v['ID'] != id_registro]
+        return len(self.ventas) < antes
+
+
+def test_importacion_se_reintenta_y_mientras_tanto_responde_el_espejo(tmp_path):
+    espejo = EspejoFalso([_venta_hoja('h1', 'F1'), _venta_hoja('h2', 'F2')], fallos=2)
+    base = AlmacenamientoSQLite(str(tmp_path / 'base.db'), espejo=espejo, espera_reintento=0.01)
+
+    # Sin historial local, las consultas no deben responder con datos incompletos
+    assert not base.listo
+    assert base.existe_factura('F1')
+    assert base.registrar_venta({'id': 'v3', 'fecha': '01/01/2025', 'numero_factura': 'F3',
+                                 'monto': 50000, 'medio_pago': 'Efectivo'})
+    assert base.eliminar_registro('h2', 'venta')
+
+    base.precalentar()
+    limite = time.monotonic() + 5
+    while not base.listo and time.monotonic() < limite:
+        time.sleep(0.01)
+
+    assert base.listo
+    assert espejo.fallos == 0
+    assert [r[0] for r in base._consultar('SELECT id FROM ventas ORDER BY id')] == ['h1', 'v3']
+    assert base.calcular_totales()['total_ventas'] == 100000 + 50000
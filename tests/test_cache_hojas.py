@@ -0,0 +1,163 @@
+"""Sincronización de la caché de hojas con la hoja remota"""
+
+import random
+import re
+
+from cache_hojas import CacheHoja
+from detector_cambios import DetectorCambios
+
+ENCABEZADOS = ['Fecha', 'Número Factura', 'Monto', 'Medio de Pago', 'ID']
+
+
+class HojaFalsa:
+    """Hoja en memoria con la versión que Drive asignaría al archivo"""
+
+    def __init__(self, filas):
+        self.filas = [list(ENCABEZADOS)] + [list(f) for f in filas]
+        self.version = 1
+        self.llamadas = []
+
+    def modificar(self, cambio):
+        cambio(self.filas)
+        self.version += 1
+
+    def get_all_values(self):
+        self.llamadas.append('all')
+        return [list(f) for f in self.filas]
+
+    def get(self, rango):
+        self.llamadas.append('get')
+        inicio = int(re.match(r'[A-Z]+(\d+)', rango).group(1))
+        return [list(f) for f in self.filas[inicio - 1:]]
+
+
+def _fila(i, monto=1000, medio='Efectivo'):
+    return [f'{i % 28 + 1:02d}/01/2025', f'F{i}', str(monto), medio, f'ID{i}']
+
+
+def _cache_cargada(hoja):
+    cache = CacheHoja('ventas', ttl=0, dimensiones=['Medio de Pago'], claves=['Número Factura', 'ID'])
+    detector = DetectorCambios('ventas', lambda: str(hoja.version))
+    cache.sincronizar(hoja, detector.version)
+    hoja.llamadas.clear()
+    return cache, detector
+
+
+def _agregar_propia(hoja, cache, detector, fila):
+    def escribir():
+        hoja.modificar(lambda filas: filas.append(fila))
+        cache.aplicar_agregadas([fila], len(hoja.filas))
+
+    detector.escritura_propia([cache], escribir)
+
+
+def test_escrituras_propias_no_releen_la_hoja():
+    hoja = HojaFalsa([_fila(i) for i in range(20)])
+    cache, detector = _cache_cargada(hoja)
+
+    for i in range(20, 25):
+        _agregar_propia(hoja, cache, detector, _fila(i))
+        cache.sincronizar(hoja, detector.version)
+
+    assert hoja.llamadas == []
+    assert cache.num_filas == 25
+    assert cache.resumen()['total'] == 25 * 100000
+
+
+def test_edicion_externa_antes_de_una_escritura_propia_se_detecta():
+    hoja = HojaFalsa([_fila(i) for i in range(20)])
+    cache, detector = _cache_cargada(hoja)
+
+    hoja.modificar(lambda filas: filas[5].__setitem__(2, '5000'))
+    _agregar_propia(hoja, cache, detector, _fila(20))
+    cache.sincronizar(hoja, detector.version)
+
+    assert hoja.llamadas == ['all']
+    assert cache.fila(4)[2] == '5000'
+    assert cache.resumen()['total'] == 21 * 100000 + 400000
+    assert cache.cambios_externos == 1
+
+    # Ya al día: el siguiente refresco no vuelve a leer
+    hoja.llamadas.clear()
+    cache.sincronizar(hoja, detector.version)
+    assert hoja.llamadas == []
+
+
+def _cache_gastos(filas):
+    cache = CacheHoja('gastos', ttl=0, dimensiones=['Medio de Pago'], claves=['ID', 'Fecha'],
+                      normalizadas=['Medio de Pago'], textos=['Número Factura'])
+    cache.sincronizar(HojaFalsa(filas))
+    return cache
+
+
+def _indices(cache):
+    """Contenido de los índices, comparable entre una caché editada y una recién cargada"""
+    texto = cache._indices_texto['Número Factura']
+    return (
+        list(cache._indice_fechas),
+        sorted(cache._sin_fecha),
+        {c: {v: [p] if isinstance(p, int) else list(p) for v, p in i.items()}
+         for c, i in cache._indices_clave.items()},
+        {c: {v: sorted(p) for v, p in i.items()} for c, i in cache._indices_normalizados.items()},
+        {t: sorted(p) for t, p in texto._posiciones.items()},
+        texto._textos,
+        [cache.resumen(inicio, fin) for inicio, fin in ((None, None), (739261, 739270), (739270, None))],
+    )
+
+
+def test_ediciones_y_borrados_locales_equivalen_a_una_carga_completa():
+    azar = random.Random(7)
+    filas = [_fila(i, monto=azar.randint(1, 9999), medio=azar.choice(['Efectivo', 'Nequi']))
+             for i in range(300)]
+    filas[10][0] = 'sin fecha'
+    filas[20][4] = filas[30][4] = 'ID30'
+    cache = _cache_gastos(filas)
+
+    for paso in range(200):
+        n = cache.num_filas
+        accion = azar.choice(('editar', 'columna', 'eliminar'))
+        if accion == 'editar':
+            i = azar.randrange(n)
+            cache.aplicar_edicion(i + 2, _fila(azar.randrange(1000), monto=azar.randint(1, 9999),
+                                               medio=azar.choice(['Efectivo', 'Nequi', 'Daviplata'])))
+        elif accion == 'columna':
+            cache.aplicar_columna('ID', {azar.randrange(n) + 2: azar.choice(['', f'N{paso}', 'ID30'])
+                                         for _ in range(3)})
+        else:
+            cache.aplicar_eliminacion(azar.randrange(n) + 2)
+
+    nueva = _cache_gastos([cache.fila(i) for i in range(cache.num_filas)])
+    assert cache.columnas == nueva.columnas
+    assert _indices(cache) == _indices(nueva)
+
+
+def test_sin_detector_solo_se_leen_las_filas_nuevas():
+    hoja = HojaFalsa([_fila(i) for i in range(10)])
+    cache = CacheHoja('ventas', ttl=0, dimensiones=['Medio de Pago'], claves=['Número Factura', 'ID'])
+    cache.sincronizar(hoja)
+    assert hoja.llamadas == ['all']
+
+    hoja.llamadas.clear()
+    hoja.modificar(lambda filas: filas.extend([_fila(10), _fila(11, medio='Nequi')]))
+    cache.sincronizar(hoja)
+
+    # Se relee la última fila conocida más las nuevas, sin descargar la hoja
+    assert hoja.llamadas == ['get']
+    assert cache.num_filas == 12
+    assert cache.buscar('Número Factura', 'F11') == [11]
+    assert cache.resumen()['por']['Medio de Pago'] == {'Efectivo': 11 * 100000, 'Nequi': 100000}
+
+
+def test_sin_detector_un_cambio_en_la_ultima_fila_recarga_todo():
+    hoja = HojaFalsa([_fila(i) for i in range(10)])
+    cache = CacheHoja('ventas', ttl=0, claves=['ID'])
+    cache.sincronizar(hoja)
+
+    hoja.llamadas.clear()
+    hoja.modificar(lambda filas: filas.pop(3))
+    cache.sincronizar(hoja)
+
+    assert hoja.llamadas == ['get', 'all']
+    assert cache.num_filas == 9
+    assert cache.buscar('ID', 'ID2') == []
+    assert cache.buscar('ID', 'ID9') == [8]
@@ -0,0 +1,127 @@
+"""Recuperación del diario de la cola de escritura tras una caída"""
+
+import json
+import time
+import threading
+
+from cola_escritura import ColaEscritura
+
+
+def _escribir_diario(ruta, lineas):
+    with open(ruta, 'w', encoding='utf-8') as archivo:
+        for linea in lineas:
+            archivo.write((linea if isinstance(linea, str) else json.dumps(linea)) + '\n')
+
+
+def _cola(ruta, enviados=None, operaciones=None, aplicar=lambda *args: True):
+    def enviar_lote(hoja, filas, verificar):
+        enviados.append((hoja, [list(f) for f in filas], verificar))
+
+    def aplicar_operacion(hoja, op, id_registro, fila):
+        operaciones.append((hoja, op, id_registro, fila))
+        return aplicar(hoja, op, id_registro, fila)
+
+    return ColaEscritura(str(ruta), enviar_lote, intervalo_ms=10, max_filas=100,
+                         espera_reintento=0.01, aplicar_operacion=aplicar_operacion)
+
+
+def test_crear_la_cola_no_toca_el_diario_ni_arranca_hilos(tmp_path):
+    ruta = tmp_path / 'diario.jsonl'
+    hilos = threading.active_count()
+
+    _cola(ruta)
+
+    assert not ruta.exists()
+    assert threading.active_count() == hilos
+
+
+def test_ultima_linea_incompleta_se_descarta(tmp_path):
+    ruta = tmp_path / 'diario.jsonl'
+    _escribir_diario(ruta, [
+        {'id': 'a', 'hoja': 'venta', 'fila': ['01/01/2025', 'F1', 'ID1']},
+        {'id': 'b', 'hoja': 'venta', 'fila': ['01/01/2025', 'F2', 'ID2']},
+        '{"id": "c", "hoja": "venta", "fi',
+    ])
+
+    cola = _cola(ruta)
+
+    assert cola.filas_pendientes('venta') == [['01/01/2025', 'F1', 'ID1'], ['01/01/2025', 'F2', 'ID2']]
+    # El diario se reescribe sin la línea rota
+    assert [json.loads(linea)['id'] for linea in ruta.read_text(encoding='utf-8').splitlines()] == ['a', 'b']
+
+
+def test_marcas_ok_confirman_entradas(tmp_path):
+    ruta = tmp_path / 'diario.jsonl'
+    _escribir_diario(ruta, [
+        {'id': 'a', 'hoja': 'venta', 'fila': ['F1', 'ID1']},
+        {'id': 'b', 'hoja': 'gasto', 'fila': ['G1', 'ID2']},
+        {'ok': ['a']},
+        {'id': 'c', 'hoja': 'venta', 'fila': ['F3', 'ID3']},
+    ])
+
+    cola = _cola(ruta)
+
+    assert cola.pendientes() == 2
+    assert cola.filas_pendientes('venta') == [['F3', 'ID3']]
+    assert cola.filas_pendientes('gasto') == [['G1', 'ID2']]
+
+
+def test_filas_recuperadas_se_reenvian_verificando(tmp_path):
+    ruta = tmp_path / 'diario.jsonl'
+    _escribir_diario(ruta, [{'id': 'a', 'hoja': 'venta', 'fila': ['F1', 'ID1']}])
+    enviados = []
+
+    cola = _cola(ruta, enviados)
+    assert cola.vaciar(5)
+
+    # Pudo haberse escrito antes de la caída: el envío debe omitir IDs existentes
+    assert enviados == [('venta', [['F1', 'ID1']], True)]
+    cola.encolar('venta', ['F2', 'ID2'])
+    assert cola.vaciar(5)
+    assert enviados[-1] == ('venta', [['F2', 'ID2']], False)
+
+
+def test_operaciones_recuperadas_se_aplican_tras_las_filas(tmp_path):
+    ruta = tmp_path / 'diario.jsonl'
+    _escribir_diario(ruta, [
+        {'id': 'e', 'hoja': 'venta', 'op': 'editar', 'registro': 'ID1', 'fila': ['F1b']},
+        {'id': 'a', 'hoja': 'venta', 'fila': ['F1', 'ID1']},
+        {'id': 'd', 'hoja': 'venta', 'op': 'eliminar', 'registro': 'ID9', 'fila': None},
+    ])
+    enviados, operaciones = [], []
+
+    cola = _cola(ruta, enviados, operaciones, aplicar=lambda hoja, op, id_registro, fila: id_registro != 'ID9')
+    assert cola.filas_pendientes('venta') == [['F1', 'ID1']]
+    assert cola.vaciar(5)
+
+    assert enviados == [('venta', [['F1', 'ID1']], True)]
+    assert operaciones == [('venta', 'editar', 'ID1', ['F1b']), ('venta', 'eliminar', 'ID9', None)]
+    # La operación sobre un registro inexistente se descarta en lugar de reintentarse
+    assert cola.pendientes() == 0
+
+
+def test_error_del_diario_no_detiene_el_hilo(tmp_path):
+    ruta = tmp_path / 'diario.jsonl'
+    enviados = []
+    cola = _cola(ruta, enviados)
+    anotar = cola._anotar_diario
+    fallos = []
+
+    def anotar_con_disco_lleno(dato):
+        if 'ok' in dato and not fallos:
+            fallos.append(dato)
+            raise OSError('No queda espacio en el dispositivo')
+        anotar(dato)
+
+    cola._anotar_diario = anotar_con_disco_lleno
+    cola.encolar('venta', ['F1', 'ID1'])
+
+    limite = time.monotonic() + 5
+    while (cola.pendientes() or cola.sin_conexion) and time.monotonic() < limite:
+        time.sleep(0.01)
+
+    # Sin la marca ok no se sabe si la fila llegó: se reenvía verificando
+    assert fallos
+    assert enviados == [('venta', [['F1', 'ID1']], False), ('venta', [['F1', 'ID1']], True)]
+    assert cola.pendientes() == 0
+    assert cola._hilo.is_alive()
@@ -0,0 +1,43 @@
+"""Búsqueda de subcadenas con el índice de trigramas"""
+
+from indice_trigramas import IndiceTrigramas
+from utils import clave_busqueda
+
+PROVEEDORES = ['Tejidos Éxito', 'Hilos y Botones', 'Distribuidora Textil', 'Éxito', '', 'TEXTILES ANDINOS']
+
+
+def _indice():
+    indice = IndiceTrigramas()
+    for posicion, proveedor in enumerate(PROVEEDORES):
+        indice.agregar(posicion, proveedor)
+    return indice
+
+
+def _busqueda_directa(subcadena):
+    consulta = clave_busqueda(subcadena)
+    return {i for i, proveedor in enumerate(PROVEEDORES) if consulta in clave_busqueda(proveedor)}
+
+
+def test_coincide_con_la_busqueda_directa_sin_tildes_ni_mayusculas():
+    for subcadena in ('exito', 'ÉXITO', 'textil', 'hilos y', 'xti', 'boton', 'nada', 'ti', 'e', ''):
+        assert _indice().buscar(subcadena) == _busqueda_directa(subcadena), subcadena
+
+
+def test_trigramas_en_otro_orden_no_son_coincidencia():
+    indice = IndiceTrigramas()
+    # Contiene los trigramas de 'abcab' ('abc', 'bca', 'cab') pero no la subcadena
+    indice.agregar(0, 'cabcaxabc')
+
+    assert indice.buscar('abcab') == set()
+    assert indice.buscar('bcax') == {0}
+
+
+def test_quitar_y_desplazar_posiciones():
+    indice = _indice()
+    indice.quitar(0, 'Tejidos Éxito')
+    indice.desplazar(0)
+
+    assert indice.buscar('exito') == {2}
+    assert indice.buscar('tejidos') == set()
+    # El texto ya no está en ninguna fila: sus trigramas exclusivos desaparecen
+    assert 'tej' not in indice._textos
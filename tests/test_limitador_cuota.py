@@ -0,0 +1,26 @@
+"""Esperas del limitador de cuota con plazo"""
+
+import time
+
+import pytest
+
+from limitador_cuota import ESCRITURA, LECTURA, LimitadorCuota
+
+
+def test_sin_fichas_se_respeta_el_plazo():
+    limitador = LimitadorCuota(por_minuto=1, rafaga=1)
+    limitador.adquirir()
+
+    inicio = time.monotonic()
+    with pytest.raises(TimeoutError):
+        limitador.adquirir(LECTURA, limite=inicio + 0.1)
+
+    assert time.monotonic() - inicio < 1
+    # Un plazo vencido no deja la petición contada como en espera
+    assert limitador.metricas()['lecturas_en_espera'] == 0
+
+
+def test_con_fichas_el_plazo_no_interviene():
+    limitador = LimitadorCuota(por_minuto=60, rafaga=2)
+
+    assert limitador.adquirir(ESCRITURA, limite=time.monotonic() + 0.1) < 0.1
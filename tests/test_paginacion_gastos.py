@@ -0,0 +1,72 @@
+"""Paginación de gastos por cursor en GoogleSheetsManager"""
+
+import re
+
+from config import Config
+from detector_cambios import DetectorCambios
+from google_sheets import GASTOS_HEADERS, GoogleSheetsManager
+
+
+class HojaGastos:
+    """Hoja de gastos en memoria con la versión que Drive asignaría al archivo"""
+
+    def __init__(self, cantidad):
+        self.filas = [list(GASTOS_HEADERS)] + [
+            ['01/01/2025', 'Insumos' if i % 2 == 0 else 'Nómina', 'Proveedor', '1000',
+             'Efectivo', '-', 't', f'G{i}']
+            for i in range(cantidad)
+        ]
+        self.version = 1
+
+    def borrar(self, *ids):
+        self.filas = [fila for fila in self.filas if fila[-1] not in ids]
+        self.version += 1
+
+    def get_all_values(self):
+        return [list(f) for f in self.filas]
+
+    def get(self, rango):
+        inicio = int(re.match(r'[A-Z]+(\d+)', rango).group(1))
+        return [list(f) for f in self.filas[inicio - 1:]]
+
+
+def _manager(hoja):
+    manager = GoogleSheetsManager()
+    # Sin red: la hoja y su versión se leen de la hoja en memoria
+    manager._conectado = True
+    manager._gastos_sheet = hoja
+    manager._detectores[Config.GASTOS_SHEET_ID] = DetectorCambios('gastos', lambda: str(hoja.version))
+    manager.cache_gastos.ttl = 0
+    return manager
+
+
+def _ids(pagina):
+    return [g['id'] for g in pagina['gastos']]
+
+
+def test_el_cursor_sobrevive_a_borrados_de_filas_anteriores():
+    hoja = HojaGastos(25)
+    manager = _manager(hoja)
+
+    pagina = manager.buscar_gastos_pagina(categoria='INSUMOS', tamano=5)
+    assert _ids(pagina) == ['G0', 'G2', 'G4', 'G6', 'G8']
+    assert pagina['total'] == 13
+
+    # Otro usuario borra filas ya entregadas: las posiciones siguientes se corren
+    hoja.borrar('G2', 'G4')
+    pagina = manager.buscar_gastos_pagina(categoria='INSUMOS', cursor=pagina['cursor'], tamano=5)
+    assert _ids(pagina) == ['G10', 'G12', 'G14', 'G16', 'G18']
+    assert pagina['total'] == 11
+
+    # Se borra toda la página entregada: se sigue desde donde empezaba
+    hoja.borrar('G10', 'G12', 'G14', 'G16', 'G18')
+    pagina = manager.buscar_gastos_pagina(categoria='INSUMOS', cursor=pagina['cursor'], tamano=5)
+    assert _ids(pagina) == ['G20', 'G22', 'G24']
+    assert pagina['cursor'] is None
+
+
+def test_iterar_gastos_recorre_todas_las_paginas():
+    manager = _manager(HojaGastos(23))
+
+    assert [g['id'] for g in manager.iterar_gastos(categoria='nomina', tamano=4)] == \
+        [f'G{i}' for i in range(1, 23, 2)]
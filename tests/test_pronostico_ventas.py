@@ -0,0 +1,77 @@
+"""Pronóstico de la venta diaria"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('sklearn')
+
+from pronostico_ventas import (HISTORIA_FEATURES, REZAGO_MINIMO, PronosticadorVentas,
+                               _caracteristicas, serie_diaria_ventas)
+
+
+def _serie_semanal(dias=180):
+    """Venta diaria con un patrón semanal fijo (sábados altos, domingos sin ventas)"""
+    fechas = pd.date_range('2024-01-01', periods=dias, freq='D')
+    patron = {0: 100.0, 1: 110.0, 2: 120.0, 3: 130.0, 4: 150.0, 5: 300.0, 6: 0.0}
+    return pd.Series([patron[d] for d in fechas.dayofweek], index=fechas)
+
+
+def test_las_caracteristicas_no_leen_los_ultimos_dias():
+    serie = _serie_semanal(60)
+    valores = serie.to_numpy()
+    posiciones = np.arange(HISTORIA_FEATURES, 60)
+    alteradas = valores.copy()
+    # Cambiar los REZAGO_MINIMO - 1 días previos y el propio día no cambia sus características
+    for p in posiciones:
+        alteradas[p - REZAGO_MINIMO + 1:p + 1] = -1.0
+        esperadas = _caracteristicas(valores, serie.index, np.array([p]))
+        assert np.array_equal(_caracteristicas(alteradas, serie.index, np.array([p])), esperadas)
+        alteradas[:] = valores
+
+
+def test_serie_diaria_rellena_los_dias_sin_ventas():
+    df = pd.DataFrame({
+        'Fecha': pd.to_datetime(['2024-01-01 09:00', '2024-01-01 17:00', '2024-01-04 10:00', None]),
+        'Importe': [100.0, 50.0, 30.0, 999.0]
+    })
+
+    serie = serie_diaria_ventas(df)
+
+    assert list(serie) == [150.0, 0.0, 0.0, 30.0]
+    assert serie.index[0] == pd.Timestamp('2024-01-01')
+
+
+def test_pronostico_por_semanas_sigue_el_patron():
+    serie = _serie_semanal()
+    pronosticador = PronosticadorVentas().ajustar(serie)
+    llamadas = []
+    predecir = pronosticador.modelo.predict
+
+    def contar(x):
+        llamadas.append(len(x))
+        return predecir(x)
+
+    pronosticador.modelo.predict = contar
+    futuras = pd.date_range(serie.index[-1] + pd.Timedelta(days=1), periods=21, freq='D')
+
+    prediccion = pronosticador.pronosticar(serie, futuras)
+
+    # Una llamada al modelo por cada semana futura
+    assert llamadas == [7, 7, 7]
+    assert (prediccion >= 0).all()
+    esperado = _serie_semanal(180 + 21).iloc[-21:].to_numpy()
+    assert np.allclose(prediccion, esperado, atol=15)
+
+
+def test_intervalo_se_amplia_con_la_distancia():
+    pronosticador = PronosticadorVentas()
+    assert pronosticador.intervalo(1000.0, 1) is None
+
+    pronosticador.calibrar(np.array([-0.2, -0.1, 0.0, 0.1, 0.3]))
+    cerca = pronosticador.intervalo(1000.0, 1)
+    lejos = pronosticador.intervalo(1000.0, 4)
+
+    assert cerca[0] < 1000.0 < cerca[1]
+    assert lejos[0] < cerca[0] and lejos[1] > cerca[1]
+    assert lejos[0] >= 0
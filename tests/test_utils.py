@@ -0,0 +1,48 @@
+"""Conversión de montos a centavos y su formato"""
+
+from decimal import Decimal
+
+from utils import centavos_a_celda, formatear_monto, monto_a_centavos, validar_monto
+
+
+def test_monto_a_centavos_desde_la_hoja():
+    assert monto_a_centavos(150000) == 15000000
+    assert monto_a_centavos('1500.5') == 150050
+    assert monto_a_centavos(' 0.1 ') == 10
+    assert monto_a_centavos(Decimal('2.675')) == 268
+    # 0.1 + 0.2 en float no es 0.3, pero al centavo sí
+    assert monto_a_centavos(0.1 + 0.2) == 30
+
+
+def test_monto_a_centavos_no_numerico_es_cero():
+    for valor in ('', 'abc', None, 'nan', 'inf', '-'):
+        assert monto_a_centavos(valor) == 0
+
+
+def test_sumas_en_centavos_son_exactas():
+    montos = ['0.10'] * 1000 + ['1234567.89'] * 1000
+    assert sum(monto_a_centavos(m) for m in montos) == 10 * 1000 + 123456789 * 1000
+
+
+def test_ida_y_vuelta_con_la_celda():
+    for centavos in (0, 100, 150050, 123456789, -2500):
+        assert monto_a_centavos(centavos_a_celda(centavos)) == centavos
+    assert centavos_a_celda(15000000) == 150000
+    assert isinstance(centavos_a_celda(15000000), int)
+
+
+def test_validar_monto_escrito_por_el_usuario():
+    assert validar_monto('1.250.000') == (True, 125000000)
+    assert validar_monto('1500,50') == (True, 150050)
+    for texto in ('0', '-5', 'abc', 'NaN', '0,001'):
+        assert validar_monto(texto) == (False, None)
+
+
+def test_formatear_monto_redondea_al_peso():
+    assert formatear_monto(125000000) == '$1.250.000'
+    assert formatear_monto(150050) == '$1.501'
+    assert formatear_monto(150049) == '$1.500'
+    assert formatear_monto(0) == '$0'
+    assert formatear_monto(-250000) == '$-2.500'
+    assert formatear_monto(-49) == '$0'
+    assert formatear_monto(10 ** 20) == '$1.000.000.000.000.000.000'
@@ -0,0 +1,80 @@
+"""Lecturas concurrentes idénticas compartidas por VueloUnico"""
+
+import threading
+import time
+
+import pytest
+
+from vuelo_unico import VueloUnico
+
+
+def _en_paralelo(cantidad, funcion):
+    resultados = [None] * cantidad
+
+    def correr(i):
+        try:
+            resultados[i] = funcion()
+        except Exception as e:
+            resultados[i] = e
+
+    hilos = [threading.Thread(target=correr, args=(i,)) for i in range(cantidad)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(5)
+    return resultados
+
+
+def test_llamadas_simultaneas_se_ejecutan_una_vez_y_reciben_copias():
+    vuelos = VueloUnico()
+    llamadas = []
+
+    def leer():
+        llamadas.append(1)
+        time.sleep(0.2)
+        return {'ventas': [1, 2, 3]}
+
+    resultados = _en_paralelo(5, lambda: vuelos.ejecutar('totales', leer))
+
+    assert len(llamadas) == 1
+    assert vuelos.compartidas == 4
+    assert all(r == {'ventas': [1, 2, 3]} for r in resultados)
+    # Cada una puede modificar lo recibido sin afectar a las demás
+    assert len({id(r) for r in resultados}) == 5
+    assert len({id(r['ventas']) for r in resultados}) == 5
+
+
+def test_los_errores_se_comparten():
+    vuelos = VueloUnico()
+
+    def fallar():
+        time.sleep(0.2)
+        raise ConnectionError('sin conexión')
+
+    resultados = _en_paralelo(3, lambda: vuelos.ejecutar('totales', fallar))
+
+    assert all(isinstance(r, ConnectionError) for r in resultados)
+    with pytest.raises(ConnectionError):
+        vuelos.ejecutar('totales', fallar)
+
+
+def test_nueva_generacion_no_se_une_a_lecturas_anteriores():
+    vuelos = VueloUnico()
+    empezo, seguir = threading.Event(), threading.Event()
+
+    def leer_lento():
+        empezo.set()
+        seguir.wait(5)
+        return 'sin el cambio'
+
+    hilo = threading.Thread(target=vuelos.ejecutar, args=('ventas', leer_lento))
+    hilo.start()
+    empezo.wait(5)
+
+    # Una escritura en medio: la lectura siguiente debe verla
+    vuelos.nueva_generacion()
+    assert vuelos.ejecutar('ventas', lambda: 'con el cambio') == 'con el cambio'
+
+    seguir.set()
+    hilo.join(5)
+    assert vuelos.compartidas == 0
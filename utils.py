@@ -4,8 +4,11 @@ Funciones auxiliares para el sistema SURTHILANAS
 """
 
 from datetime import datetime, timedelta  # FIX BUG 2: importar timedelta directamente
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from typing import Optional, Tuple
 import re
+import unicodedata
+import uuid
 import pytz
 from config import Config
 
@@ -33,39 +36,109 @@ def validar_fecha(fecha_str: str) -> Tuple[bool, Optional[str]]:
     except ValueError:
         return False, None
 
-def validar_monto(monto_str: str) -> Tuple[bool, Optional[float]]:
+def fecha_a_ordinal(fecha_str: str) -> Optional[int]:
     """
-    Valida y convierte un monto a float
+    Convierte una fecha DD/MM/AAAA a su número ordinal
 
     Args:
-        monto_str: String con el monto
+        fecha_str: String con la fecha
 
     Returns:
-        Tuple[bool, Optional[float]]: (es_valido, monto_float)
+        Optional[int]: Ordinal de la fecha o None si no es válida
     """
     try:
-        # Remover puntos de miles y reemplazar coma decimal por punto
-        monto_limpio = monto_str.replace('.', '').replace(',', '.')
-        monto = float(monto_limpio)
+        return datetime.strptime(fecha_str, '%d/%m/%Y').toordinal()
+    except (ValueError, TypeError):
+        return None
 
-        if monto <= 0:
-            return False, None
+def generar_id_registro() -> str:
+    """
+    Genera el identificador inmutable de un registro
 
-        return True, monto
-    except ValueError:
+    Returns:
+        str: ID de 12 caracteres hexadecimales
+    """
+    return uuid.uuid4().hex[:12]
+
+def clave_busqueda(texto) -> str:
+    """
+    Forma de un texto para búsquedas que ignoran mayúsculas y tildes
+
+    Returns:
+        str: Texto en minúsculas, sin tildes y sin espacios repetidos
+    """
+    descompuesto = unicodedata.normalize('NFKD', str(texto).lower())
+    sin_tildes = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_tildes.split())
+
+def monto_a_centavos(valor) -> int:
+    """
+    Convierte un monto en pesos (número o texto de la hoja, ej: 150000 o
+    '1500.5') a centavos enteros, redondeando al centavo más cercano
+
+    Args:
+        valor: Monto en pesos
+
+    Returns:
+        int: Monto en centavos (0 si no es numérico)
+    """
+    try:
+        pesos = valor if isinstance(valor, Decimal) else Decimal(str(valor).strip())
+    except (InvalidOperation, ValueError):
+        return 0
+    if not pesos.is_finite():
+        return 0
+    return int((pesos * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+def centavos_a_celda(centavos: int):
+    """
+    Monto en pesos para escribir en la hoja
+
+    Returns:
+        int si no tiene centavos, float en otro caso (ej: 150050 -> 1500.5)
+    """
+    pesos, resto = divmod(int(centavos), 100)
+    return pesos if resto == 0 else float(Decimal(int(centavos)) / 100)
+
+def validar_monto(monto_str: str) -> Tuple[bool, Optional[int]]:
+    """
+    Valida y convierte un monto escrito por el usuario a centavos
+
+    Args:
+        monto_str: String con el monto (ej: 1.250.000 o 1500,50)
+
+    Returns:
+        Tuple[bool, Optional[int]]: (es_valido, monto_en_centavos)
+    """
+    # Remover puntos de miles y reemplazar coma decimal por punto
+    monto_limpio = monto_str.replace('.', '').replace(',', '.')
+    try:
+        pesos = Decimal(monto_limpio)
+    except InvalidOperation:
+        return False, None
+
+    if not pesos.is_finite():
         return False, None
+    centavos = monto_a_centavos(pesos)
+    if centavos <= 0:
+        return False, None
+
+    return True, centavos
 
-def formatear_monto(monto: float) -> str:
+def formatear_monto(centavos: int) -> str:
     """
     Formatea un monto para mostrar con separador de miles
 
     Args:
-        monto: Monto numérico
+        centavos: Monto en centavos
 
     Returns:
-        str: Monto formateado (ej: $1.250.000)
+        str: Monto en pesos redondeado al peso (ej: $1.250.000)
     """
-    return f"${monto:,.0f}".replace(',', '.')
+    # Aritmética entera: sin pasar por float, exacto para cualquier total
+    pesos = (abs(int(centavos)) + 50) // 100
+    signo = '-' if centavos < 0 and pesos else ''
+    return f"${signo}{pesos:,}".replace(',', '.')
 
 def validar_numero_factura(numero: str) -> bool:
     """
@@ -210,14 +283,7 @@ def formatear_registro_venta(venta: dict) -> str:
     msg += f"📄 Factura: {venta.get('numero_factura', '-')}\n"
     msg += f"👤 Cliente: {venta.get('cliente', '-')}\n"
 
-    monto = venta.get('monto', 0)
-    if isinstance(monto, str):
-        try:
-            monto = float(monto)
-        except (ValueError, TypeError):
-            monto = 0
-
-    msg += f"💰 Monto: {formatear_monto(monto)}\n"
+    msg += f"💰 Monto: {formatear_monto(venta.get('monto', 0))}\n"
     msg += f"💳 Pago: {venta.get('medio_pago', '-')}\n"
     msg += f"📝 Obs: {venta.get('observaciones', '-')}\n"
 
@@ -234,14 +300,7 @@ def formatear_registro_gasto(gasto: dict) -> str:
     msg += f"📂 Categoría: {gasto.get('categoria', '-')}\n"
     msg += f"🏢 Proveedor: {gasto.get('proveedor', '-')}\n"
 
-    monto = gasto.get('monto', 0)
-    if isinstance(monto, str):
-        try:
-            monto = float(monto)
-        except (ValueError, TypeError):
-            monto = 0
-
-    msg += f"💰 Monto: {formatear_monto(monto)}\n"
+    msg += f"💰 Monto: {formatear_monto(gasto.get('monto', 0))}\n"
     msg += f"💳 Pago: {gasto.get('medio_pago', '-')}\n"
     msg += f"📝 Obs: {gasto.get('observaciones', '-')}\n"
 
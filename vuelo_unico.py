@@ -0,0 +1,69 @@
+"""
+Agrupación de lecturas concurrentes idénticas (single-flight)
+Si llega una consulta igual a otra que todavía está en curso, espera y
+comparte su resultado en lugar de repetir el trabajo y las llamadas a la API
+"""
+
+import copy
+import threading
+from concurrent.futures import Future
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable
+
+class VueloUnico:
+    """Ejecuta una sola vez las llamadas simultáneas con la misma clave"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._en_curso: Dict[Hashable, Future] = {}
+        self._generacion = 0
+        self.compartidas = 0
+
+    def nueva_generacion(self) -> None:
+        """
+        Llamar tras cada escritura: las lecturas que empiecen después ya no se
+        unen a las que estaban en curso, que pueden no incluir el cambio
+        """
+        with self._lock:
+            self._generacion += 1
+
+    def ejecutar(self, clave: Hashable, funcion: Callable, *args, **kwargs) -> Any:
+        """
+        Ejecuta funcion(*args, **kwargs), o espera el resultado de la llamada
+        en curso con la misma clave. Los errores también se comparten; el
+        resultado no: cada llamada que esperó recibe su propia copia.
+        """
+        with self._lock:
+            clave = (self._generacion, clave)
+            futuro = self._en_curso.get(clave)
+            lider = futuro is None
+            if lider:
+                futuro = self._en_curso[clave] = Future()
+            else:
+                self.compartidas += 1
+        if not lider:
+            # Quien llama puede modificar lo recibido (p. ej. editar una venta)
+            return copy.deepcopy(futuro.result())
+
+        try:
+            resultado = funcion(*args, **kwargs)
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            with self._lock:
+                del self._en_curso[clave]
+
+def coalescido(metodo: Callable) -> Callable:
+    """
+    Decorador para métodos de lectura de una clase con atributo _vuelos
+    (VueloUnico). Cada llamada recibe su propio resultado y puede modificarlo.
+    """
+    @wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        clave = (metodo.__name__, args, tuple(sorted(kwargs.items())))
+        return self._vuelos.ejecutar(clave, metodo, self, *args, **kwargs)
+    return envoltura